@@ -1,83 +1,226 @@
+import asyncio
+import logging
 import os
+import random
 import time
 from dotenv import load_dotenv
 
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.memory import ConversationBufferMemory
 from langchain.agents import Tool, AgentExecutor, create_tool_calling_agent
-from langchain_community.tools.tavily_search.tool import TavilySearchResults
 
 from fastapi import HTTPException
-from google.api_core.exceptions import InternalServerError
+
+from app.ai.callbacks import AgentTraceCallbackHandler, MetricsCallbackHandler
+from app.ai.model_pool import AllModelsFailed, ModelEndpoint, ModelHealth, ModelPool
+from app.ai.prompt_router import AGENT, DIRECT, RouteDecision, classify_prompt, route_latency
+from app.ai.retrieval import build_chat_history
+from app.ai.tavily import TavilySearch
+from app.circuit_breaker import get_breaker
+from app.config import (
+    AI_MODELS,
+    AI_MAX_ATTEMPTS,
+    AI_HEDGE_ENABLED,
+    AI_HEDGE_MIN_DELAY_SECONDS,
+    AI_HEDGE_DEFAULT_DELAY_SECONDS,
+    AI_REQUEST_TIMEOUT_SECONDS,
+    AI_MODEL_COOLDOWN_SECONDS,
+    AI_FAST_PATH_ENABLED,
+    AI_TRACE_SAMPLE_RATE,
+    CIRCUIT_SLOW_GEMINI_SECONDS,
+    CIRCUIT_SLOW_TAVILY_SECONDS,
+)
+from app.metrics import AI_RESPONSE_DURATION, AI_ROUTE_DECISIONS
+from app.sports_data import sports_store
 
 load_dotenv()
 
-# 1. Load Gemini LLM
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",  # or "gemini-1.5-flash"
-    temperature=0.7
+logger = logging.getLogger(__name__)
+
+# 1. Gemini models, in order of preference (AI_MODELS)
+def _make_llm(model_name: str):
+    return ChatGoogleGenerativeAI(
+        model=model_name,
+        temperature=0.7
+    )
+
+# 2. Tool for real-time info (web search), behind the Tavily circuit breaker
+search_tool_instance = TavilySearch()
+tavily_breaker = get_breaker("tavily", CIRCUIT_SLOW_TAVILY_SECONDS)
+
+WEB_SEARCH_UNAVAILABLE = (
+    "Web search is temporarily unavailable. Answer from your own knowledge and "
+    "tell the user that live information could not be checked."
 )
 
-# 2. Tool for real-time info (web search)
-search_tool_instance = TavilySearchResults()
+def web_search(query: str):
+    try:
+        with tavily_breaker.guard():
+            return search_tool_instance.run(query)
+    except Exception as e:
+        logger.warning("web search unavailable: %r", e)
+        return WEB_SEARCH_UNAVAILABLE
+
+# The agent runs on the model pool's event loop. The tools block, so they
+# run in a thread: a cancelled (hedged-out) attempt stops waiting at once
+# and its search finishes in the background without holding up the winner.
+async def aweb_search(query: str):
+    return await asyncio.to_thread(web_search, query)
+
 search_tool = Tool(
     name="web-search",
-    func=search_tool_instance.run,
+    func=web_search,
+    coroutine=aweb_search,
     description="Search the web for up-to-date or factual information"
 )
 
-# 3. Memory for ongoing conversations
-memory = ConversationBufferMemory(
-    memory_key="chat_history",
-    return_messages=True
+# Fixtures, results and league tables from the local store; only questions
+# it cannot answer cost a web search
+def sports_data_lookup(query: str) -> str:
+    answer = sports_store.lookup(query)
+    if answer is None:
+        return web_search(query)
+    return answer
+
+async def asports_data_lookup(query: str) -> str:
+    return await asyncio.to_thread(sports_data_lookup, query)
+
+sports_data_tool = Tool(
+    name="sports-data",
+    func=sports_data_lookup,
+    coroutine=asports_data_lookup,
+    description="Look up fixtures, recent results, live scores and league tables for teams or competitions. "
+                "Include the team or competition name in the query."
 )
 
+# 3. Conversation context: built per request from the user's own history
+# (recent messages of the chat plus retrieved earlier ones, see retrieval.py)
+
 # 4. Prompt guiding the AI’s behavior
 prompt = ChatPromptTemplate.from_messages([
     ("system", 
      "You're a sports expert AI assistant. Your job is to provide insightful, accurate, and concise information about football and other sports. "
      "You can discuss teams, players, match stats, recent scores, upcoming fixtures, and sports news. "
-     "If a question requires real-time or current data, call the appropriate tool to search the web and fetch updated info."),
+     "For fixtures, results, scores and league tables, call the sports-data tool first. "
+     "For other real-time or current data such as news and transfers, call the web-search tool to fetch updated info."),
     MessagesPlaceholder(variable_name="chat_history"),
     MessagesPlaceholder(variable_name="agent_scratchpad"),
     ("human", "{input}")
 ])
 
-# 5. Create the agent and executor
-agent = create_tool_calling_agent(
-    llm=llm,
-    tools=[search_tool],
-    prompt=prompt
-)
+# Prompt for the fast path: one LLM call, no tools
+direct_prompt = ChatPromptTemplate.from_messages([
+    ("system",
+     "You're a sports expert AI assistant. Your job is to provide insightful, accurate, and concise information about football and other sports. "
+     "Answer from your own knowledge. If the question turns out to need live data such as today's scores or the latest news, "
+     "say briefly that you can look it up if the user asks about it directly."),
+    MessagesPlaceholder(variable_name="chat_history"),
+    ("human", "{input}")
+])
+
+# 5. One agent executor per model, pooled for failover and hedging
+def _make_executor(model_llm):
+    agent = create_tool_calling_agent(
+        llm=model_llm,
+        tools=[sports_data_tool, search_tool],
+        prompt=prompt
+    )
+    return AgentExecutor(
+        agent=agent,
+        tools=[sports_data_tool, search_tool],
+    )
+
+def _make_endpoint(model_name: str) -> ModelEndpoint:
+    model_llm = _make_llm(model_name)
+    return ModelEndpoint(
+        name=model_name,
+        llm=model_llm,
+        executor=_make_executor(model_llm),
+        health=ModelHealth(model_name, cooldown_seconds=AI_MODEL_COOLDOWN_SECONDS),
+        breaker=get_breaker(f"gemini:{model_name}", CIRCUIT_SLOW_GEMINI_SECONDS),
+    )
 
-agent_executor = AgentExecutor(
-    agent=agent,
-    tools=[search_tool],
-    memory=memory,
-    verbose=True  
+model_pool = ModelPool(
+    [_make_endpoint(name) for name in AI_MODELS],
+    max_attempts=AI_MAX_ATTEMPTS,
+    hedge_enabled=AI_HEDGE_ENABLED,
+    hedge_min_delay=AI_HEDGE_MIN_DELAY_SECONDS,
+    hedge_default_delay=AI_HEDGE_DEFAULT_DELAY_SECONDS,
+    timeout=AI_REQUEST_TIMEOUT_SECONDS,
 )
 
-# 6. AI response generator with retry logic
-def generate_ai_response(user_input: str) -> str:
-    max_retries = 3
-
-    for attempt in range(1, max_retries + 1):
-        try:
-            result = agent_executor.invoke({"input": user_input})
-            return result.get("output", "I'm sorry, I couldn't generate a proper response.")
-        except InternalServerError as e:
-            print(f"[Retry {attempt}] Google API InternalServerError: {e}")
-            if attempt < max_retries:
-                time.sleep(2)
-            else:
-                raise HTTPException(
-                    status_code=503,
-                    detail="AI service is currently unavailable due to an internal error. Please try again later."
-                )
-        except Exception as e:
-            print("Unhandled exception in generate_ai_response:", e)
-            raise HTTPException(
-                status_code=500,
-                detail="Unexpected error occurred while processing the AI response."
+# Answer served when no model is available: the local sports data can still
+# cover fixtures, results and tables; anything else gets the 503
+DEGRADED_PREFIX = "The AI assistant is temporarily unavailable, but here is the latest data I have:\n\n"
+
+def _degraded_answer(user_input: str):
+    answer = sports_store.lookup(user_input)
+    return DEGRADED_PREFIX + answer if answer else None
+
+# 6. AI response generator: fast path or agent, with model failover and hedged requests
+def generate_ai_response(user_input: str, user_id=None, chat_id=None, on_token=None) -> str:
+    start = time.perf_counter()
+    outcome = "error"
+    decision = classify_prompt(user_input) if AI_FAST_PATH_ENABLED else RouteDecision(AGENT, "disabled")
+    AI_ROUTE_DECISIONS.labels(decision.route, decision.reason).inc()
+    chat_history = build_chat_history(user_id, chat_id, user_input)
+    # Step-by-step traces for a sample of requests (AI_TRACE_SAMPLE_RATE)
+    trace_callbacks = [AgentTraceCallbackHandler(decision.route)] if random.random() < AI_TRACE_SAMPLE_RATE else []
+
+    async def invoke_agent(endpoint, stream_callbacks):
+        return await endpoint.executor.ainvoke(
+            {"input": user_input, "chat_history": chat_history},
+            config={"callbacks": [MetricsCallbackHandler(), *trace_callbacks, *stream_callbacks]},
+        )
+
+    async def answer_directly(endpoint, stream_callbacks):
+        messages = direct_prompt.format_messages(
+            chat_history=chat_history,
+            input=user_input,
+        )
+        parts = []
+        async for chunk in endpoint.llm.astream(
+            messages,
+            config={"callbacks": [MetricsCallbackHandler(), *trace_callbacks, *stream_callbacks]},
+        ):
+            if isinstance(chunk.content, str):
+                parts.append(chunk.content)
+        return {"output": "".join(parts)}
+
+    try:
+        if decision.route == DIRECT:
+            result = model_pool.run(answer_directly, on_token=on_token)
+        else:
+            result = model_pool.run(invoke_agent, on_token=on_token)
+        outcome = "ok"
+        return result.get("output", "I'm sorry, I couldn't generate a proper response.")
+    except AllModelsFailed as e:
+        logger.error("All Gemini models failed: %r", e.last_error)
+        degraded = _degraded_answer(user_input)
+        if degraded is not None:
+            outcome = "degraded"
+            return degraded
+        outcome = "unavailable"
+        raise HTTPException(
+            status_code=503,
+            detail="AI service is currently unavailable due to an internal error. Please try again later."
+        )
+    except Exception:
+        logger.exception("Unhandled exception in generate_ai_response")
+        raise HTTPException(
+            status_code=500,
+            detail="Unexpected error occurred while processing the AI response."
+        )
+    finally:
+        elapsed = time.perf_counter() - start
+        AI_RESPONSE_DURATION.labels(decision.route, outcome).observe(elapsed)
+        if outcome == "ok":
+            route_latency.observe(decision.route, elapsed)
+            agent_average = route_latency.average(AGENT)
+            logger.info(
+                "ai_route route=%s reason=%s latency_ms=%.0f est_saved_ms=%s",
+                decision.route,
+                decision.reason,
+                elapsed * 1000,
+                f"{(agent_average - elapsed) * 1000:.0f}" if decision.route == DIRECT and agent_average else "n/a",
             )
@@ -0,0 +1,109 @@
+import logging
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from app.metrics import AI_TOKENS, AI_TOOL_CALLS, AI_TOOL_DURATION
+
+trace_logger = logging.getLogger("app.ai.trace")
+
+TRACE_TEXT_LIMIT = 500
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Feeds token usage and tool timings from agent runs into Prometheus."""
+
+    def __init__(self):
+        self._tool_starts = {}
+
+    def on_llm_end(self, response, **kwargs):
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None) or {}
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+        if input_tokens:
+            AI_TOKENS.labels("input").inc(input_tokens)
+        if output_tokens:
+            AI_TOKENS.labels("output").inc(output_tokens)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        name = (serialized or {}).get("name", "unknown")
+        self._tool_starts[run_id] = (name, time.perf_counter())
+        AI_TOOL_CALLS.labels(name).inc()
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._finish_tool(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._finish_tool(run_id)
+
+    def _finish_tool(self, run_id):
+        started = self._tool_starts.pop(run_id, None)
+        if started:
+            name, start = started
+            AI_TOOL_DURATION.labels(name).observe(time.perf_counter() - start)
+
+
+class TokenStreamHandler(BaseCallbackHandler):
+    """Forwards streamed LLM tokens to a callback (e.g. the chat WebSocket)."""
+
+    def __init__(self, on_token):
+        self.on_token = on_token
+
+    def on_llm_new_token(self, token, **kwargs):
+        if token:
+            self.on_token(token)
+
+
+def _clip(value) -> str:
+    text = value if isinstance(value, str) else repr(value)
+    return text if len(text) <= TRACE_TEXT_LIMIT else text[:TRACE_TEXT_LIMIT] + "…"
+
+
+class AgentTraceCallbackHandler(BaseCallbackHandler):
+    """Logs the steps of one agent run (replaces AgentExecutor verbose output).
+
+    Attached to a sample of requests only; see AI_TRACE_SAMPLE_RATE.
+    """
+
+    def __init__(self, route: str):
+        self.route = route
+        self._starts = {}
+
+    def _log(self, event: str, run_id, **fields):
+        started = self._starts.pop(run_id, None)
+        if started is not None:
+            fields["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        trace_logger.info("agent_trace %s", event, extra={"event": event, "route": self.route, "run_id": str(run_id), **fields})
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+        self._log("llm_start", run_id, messages=sum(len(batch) for batch in messages))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = {}
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or usage
+        self._log("llm_end", run_id, input_tokens=usage.get("input_tokens"), output_tokens=usage.get("output_tokens"))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._log("llm_error", run_id, error=_clip(error))
+
+    def on_agent_action(self, action, *, run_id, **kwargs):
+        self._log("agent_action", run_id, tool=action.tool, tool_input=_clip(action.tool_input))
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._log("tool_end", run_id, output=_clip(output))
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._log("tool_error", run_id, error=_clip(error))
+
+    def on_agent_finish(self, finish, *, run_id, **kwargs):
+        self._log("agent_finish", run_id, output=_clip(finish.return_values.get("output", "")))
@@ -0,0 +1,77 @@
+# app/ai/jobs.py
+#
+# Bounded background pool for AI generation jobs (POST /api/chats/?mode=async).
+# Jobs run on worker threads that are independent of the HTTP request, so a
+# dropped client connection does not cancel or repeat the LLM call. Capacity
+# is reserved before anything is written, which lets the route answer 503
+# without leaving an orphaned job behind.
+
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import AI_JOB_QUEUE_SIZE, AI_JOB_WORKERS
+
+
+class JobPoolFull(Exception):
+    pass
+
+
+class AIJobPool:
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._capacity = threading.BoundedSemaphore(workers + queue_size)
+        self._pending = 0  # reserved and not yet finished
+        self._idle = threading.Condition()
+        self._accepting = True
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ai-job")
+            return self._executor
+
+    def reserve(self):
+        if not self._accepting or not self._capacity.acquire(blocking=False):
+            raise JobPoolFull()
+        with self._idle:
+            self._pending += 1
+
+    def release(self):
+        self._capacity.release()
+        with self._idle:
+            self._pending -= 1
+            self._idle.notify_all()
+
+    def submit(self, fn, *args):
+        """Run fn(*args) on the pool; the caller must hold a reservation."""
+        # Carry the submitting request's context (e.g. its log request id)
+        context = contextvars.copy_context()
+
+        def run():
+            try:
+                context.run(fn, *args)
+            finally:
+                self.release()
+
+        return self._get_executor().submit(run)
+
+    def start(self):
+        self._accepting = True
+
+    def drain(self, timeout: float) -> bool:
+        """Stop taking new jobs and wait for queued and running ones to finish."""
+        self._accepting = False
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout=timeout)
+
+    def shutdown(self, wait: bool = True):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+job_pool = AIJobPool(workers=AI_JOB_WORKERS, queue_size=AI_JOB_QUEUE_SIZE)
@@ -0,0 +1,301 @@
+# app/ai/model_pool.py
+#
+# Ordered pool of LLM backends with health tracking, failover and hedging.
+#
+# Each model keeps a window of recent latencies and an error-rate average.
+# Healthy models are tried in configured order; a model that keeps failing
+# is cooled down and moved to the back. When the current attempt runs past
+# the model's p95 latency, a hedged request is sent to the next model and
+# whichever finishes first wins; the other task is cancelled. When tokens are
+# streamed, the first attempt to stream wins instead and the others are
+# cancelled right away (nothing is hedged once a stream has started).
+#
+# All attempts run on one long-lived event loop in a daemon thread. The
+# Gemini clients cache a gRPC-asyncio channel bound to the loop that first
+# used it, so a fresh loop per request would break every later call.
+#
+# Every model also has a circuit breaker (app/circuit_breaker.py). A model
+# whose breaker is open is skipped without a call; when every breaker is
+# open the pool fails immediately instead of waiting out the timeout.
+
+import asyncio
+import threading
+import time
+from collections import deque
+
+from google.api_core import exceptions as google_exceptions
+
+from app.ai.callbacks import TokenStreamHandler
+from app.circuit_breaker import CircuitOpen
+from app.metrics import AI_MODEL_HEALTH, AI_MODEL_REQUESTS, AI_RETRIES
+
+# Below this many samples the p95 is too noisy to hedge on
+MIN_LATENCY_SAMPLES = 20
+
+RETRYABLE_ERRORS = (
+    google_exceptions.ServerError,
+    google_exceptions.TooManyRequests,
+    google_exceptions.DeadlineExceeded,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, RETRYABLE_ERRORS):
+        return True
+    # langchain-google-genai wraps some API errors; look at the cause too
+    cause = exc.__cause__ or exc.__context__
+    return isinstance(cause, RETRYABLE_ERRORS)
+
+
+class AllModelsFailed(Exception):
+    def __init__(self, last_error):
+        super().__init__(f"All model attempts failed: {last_error!r}")
+        self.last_error = last_error
+
+
+class ModelHealth:
+    def __init__(self, name: str, cooldown_seconds: float, window: int = 200):
+        self.name = name
+        self.cooldown_seconds = cooldown_seconds
+        self.latencies = deque(maxlen=window)
+        self.error_rate = 0.0  # exponentially weighted, 0..1
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self._lock = threading.Lock()
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self.latencies.append(latency)
+            self.error_rate *= 0.9
+            self.consecutive_failures = 0
+        AI_MODEL_REQUESTS.labels(self.name, "ok").inc()
+        AI_MODEL_HEALTH.labels(self.name).set(self.score())
+
+    def record_failure(self):
+        with self._lock:
+            self.error_rate = self.error_rate * 0.9 + 0.1
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= 3:
+                self.cooldown_until = time.monotonic() + self.cooldown_seconds
+        AI_MODEL_REQUESTS.labels(self.name, "error").inc()
+        AI_MODEL_HEALTH.labels(self.name).set(self.score())
+
+    def p95(self):
+        with self._lock:
+            if len(self.latencies) < MIN_LATENCY_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def cooling_down(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+    def score(self) -> float:
+        """1.0 is fully healthy, 0.0 is failing or cooling down."""
+        if self.cooling_down():
+            return 0.0
+        return round(1.0 - self.error_rate, 3)
+
+
+class ModelEndpoint:
+    def __init__(self, name: str, llm, executor, health: ModelHealth, breaker):
+        self.name = name
+        self.llm = llm
+        self.executor = executor
+        self.health = health
+        self.breaker = breaker
+
+
+class _TokenGate:
+    # With a hedged request in flight both attempts may stream. The first one
+    # to produce a token owns the stream; on_claim lets the pool cancel the
+    # other attempts so the owner is also the answer the client gets.
+    def __init__(self, on_token, on_claim):
+        self.on_token = on_token
+        self.on_claim = on_claim
+        self.owner = None
+        self._lock = threading.Lock()
+
+    def callbacks_for(self, attempt: int):
+        if self.on_token is None:
+            return []
+        return [TokenStreamHandler(lambda token: self._emit(attempt, token))]
+
+    def _emit(self, attempt: int, token: str):
+        with self._lock:
+            claimed = self.owner is None
+            if claimed:
+                self.owner = attempt
+            forward = self.owner == attempt
+        if claimed:
+            self.on_claim()
+        if forward:
+            self.on_token(token)
+
+
+class ModelPool:
+    def __init__(
+        self,
+        endpoints,
+        max_attempts: int = 3,
+        hedge_enabled: bool = True,
+        hedge_min_delay: float = 1.5,
+        hedge_default_delay: float = 8.0,
+        timeout: float = 60.0,
+        unhealthy_error_rate: float = 0.5,
+    ):
+        self.endpoints = list(endpoints)
+        self.max_attempts = max_attempts
+        self.hedge_enabled = hedge_enabled
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay
+        self.timeout = timeout
+        self.unhealthy_error_rate = unhealthy_error_rate
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    def ordered(self):
+        healthy = [
+            e for e in self.endpoints
+            if not e.health.cooling_down() and e.health.error_rate < self.unhealthy_error_rate
+        ]
+        unhealthy = sorted(
+            (e for e in self.endpoints if e not in healthy),
+            key=lambda e: -e.health.score(),
+        )
+        return healthy + unhealthy
+
+    def _attempt_plan(self):
+        ordered = self.ordered()
+        return [ordered[i % len(ordered)] for i in range(max(self.max_attempts, 1))]
+
+    def _hedge_delay(self, endpoint: ModelEndpoint) -> float:
+        p95 = endpoint.health.p95()
+        return max(self.hedge_min_delay, p95 if p95 is not None else self.hedge_default_delay)
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        # Started on first use; lives as long as the worker
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="model-pool", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def run(self, call, on_token=None):
+        """Run call(endpoint, callbacks) -> awaitable with failover and hedging.
+
+        Blocks the calling thread; must not be called from the pool's loop.
+        """
+        return asyncio.run_coroutine_threadsafe(self._run(call, on_token), self._event_loop()).result()
+
+    async def _run(self, call, on_token):
+        loop = asyncio.get_running_loop()
+        claimed = asyncio.Event()
+        gate = _TokenGate(on_token, lambda: loop.call_soon_threadsafe(claimed.set))
+        claim_waiter = asyncio.ensure_future(claimed.wait())
+        plan = self._attempt_plan()
+        deadline = time.monotonic() + self.timeout
+        running = {}  # task -> (endpoint, started_at, attempt)
+        cancelled = []
+        launched = 0
+        hedged = False
+        timed_out = False
+        last_error = None
+
+        def launch(reason=None) -> bool:
+            nonlocal launched, last_error
+            # Skip models whose circuit is open
+            while launched < len(plan):
+                endpoint = plan[launched]
+                launched += 1
+                if endpoint.breaker.allow():
+                    break
+                last_error = CircuitOpen(endpoint.breaker.name, endpoint.breaker.retry_after())
+            else:
+                return False
+            if reason:
+                AI_RETRIES.labels(reason).inc()
+            task = asyncio.ensure_future(call(endpoint, gate.callbacks_for(launched)))
+            running[task] = (endpoint, time.monotonic(), launched)
+            return True
+
+        def cancel(task):
+            endpoint, started, _ = running.pop(task)
+            task.cancel()
+            cancelled.append(task)
+            AI_MODEL_REQUESTS.labels(endpoint.name, "cancelled").inc()
+            if timed_out:
+                endpoint.breaker.record(False, time.monotonic() - started)
+            else:
+                endpoint.breaker.cancel()
+
+        if not launch():
+            claim_waiter.cancel()
+            raise AllModelsFailed(last_error)
+        try:
+            while running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    last_error = asyncio.TimeoutError()
+                    timed_out = True
+                    break
+
+                can_hedge = (
+                    self.hedge_enabled and not hedged and gate.owner is None
+                    and len(running) == 1 and launched < len(plan)
+                )
+                wait_for = remaining
+                if can_hedge:
+                    endpoint, started, _ = next(iter(running.values()))
+                    hedge_at = started + self._hedge_delay(endpoint)
+                    wait_for = min(remaining, max(0.0, hedge_at - time.monotonic()))
+
+                waiting = set(running) if claim_waiter.done() else {*running, claim_waiter}
+                done, _ = await asyncio.wait(waiting, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+                if claim_waiter in done:
+                    done.discard(claim_waiter)
+                    # The client is watching the owner's stream: drop the rest
+                    if any(attempt == gate.owner for _, _, attempt in running.values()):
+                        for task, (_, _, attempt) in list(running.items()):
+                            if attempt != gate.owner:
+                                cancel(task)
+                        done = {task for task in done if task in running}
+                    if not done:
+                        continue
+                if not done:
+                    if can_hedge:
+                        hedged = True
+                        launch("hedge")
+                    continue
+
+                for task in done:
+                    endpoint, started, _ = running.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        endpoint.health.record_success(time.monotonic() - started)
+                        endpoint.breaker.record(True, time.monotonic() - started)
+                        return task.result()
+                    endpoint.health.record_failure()
+                    if is_retryable(error):
+                        endpoint.breaker.record(False, time.monotonic() - started)
+                    else:
+                        endpoint.breaker.cancel()  # a bad request, not an unhealthy model
+                    last_error = error
+                    if not is_retryable(error) and not running:
+                        raise error
+
+                if not running and launched < len(plan):
+                    if plan[launched] is endpoint:
+                        # Retrying the same model: back off briefly first
+                        await asyncio.sleep(min(2.0, max(0.0, deadline - time.monotonic())))
+                    launch("failover")
+            raise AllModelsFailed(last_error)
+        finally:
+            claim_waiter.cancel()
+            for task in list(running):
+                cancel(task)
+            if cancelled:
+                await asyncio.gather(*cancelled, return_exceptions=True)
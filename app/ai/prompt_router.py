@@ -0,0 +1,79 @@
+# app/ai/prompt_router.py
+#
+# Cheap, local pre-classifier that decides whether a prompt needs the full
+# tool-calling agent. Small talk and static sports knowledge (rules, tactics,
+# drills, history) go to one direct LLM call; anything that smells like
+# live data (scores, fixtures, news, "today") goes to the agent, which can
+# search the web. When in doubt we pick the agent, so misrouting only ever
+# costs latency, never freshness.
+
+import re
+import threading
+from dataclasses import dataclass
+
+DIRECT = "direct"
+AGENT = "agent"
+
+_SMALL_TALK_RE = re.compile(
+    r"^(hi|hello|hey|yo|hiya|thanks|thank you|thx|ty|cheers|ok|okay|k|cool|nice|great|awesome|"
+    r"perfect|got it|bye|goodbye|see you|good (morning|afternoon|evening|night)|how are you|"
+    r"who are you|what can you do|lol|haha|yes|no|sure)\b"
+    r"([\s!.?,:)]+(thanks|thank you|a lot|so much|very much|mate|man|bro|buddy|guys|again))*[\s!.?,:)]*$",
+    re.IGNORECASE,
+)
+
+_REALTIME_RE = re.compile(
+    r"\b(today|tonight|tomorrow|yesterday|this (week|weekend|month|season)|last (night|week|weekend|match|game)|"
+    r"next (match|game|fixture)|latest|live|current(ly)?|right now|recent(ly)?|upcoming|score[sd]?|"
+    r"result[s]?|fixture[s]?|schedule|standings|table|league position|news|transfer[s]?|rumou?rs?|"
+    r"injur(y|ies|ed)|line-?up|squad list|who won|won|lost|beat|kick-?off|odds|ranking[s]?|"
+    r"top scorer[s]?|20[2-9]\d)\b",
+    re.IGNORECASE,
+)
+
+_STATIC_RE = re.compile(
+    r"\b(rule[s]?|law[s]? of the game|offside|handball|penalt(y|ies)|free kick|corner kick|throw-?in|"
+    r"var|yellow card|red card|substitution[s]?|how many players|how long is|what is a|what's a|what does .+ mean|"
+    r"explain|define|definition|difference between|drill[s]?|exercise[s]?|warm-?up|training|"
+    r"tactic[s]?|formation[s]?|pressing|position[s]?|role of|how (do|does|to|can) (i|you|we|a|an|the)|"
+    r"tips?|technique|history of|origin of|invented)\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    route: str
+    reason: str
+
+
+def classify_prompt(text: str) -> RouteDecision:
+    stripped = (text or "").strip()
+    if not stripped:
+        return RouteDecision(DIRECT, "empty")
+    if _REALTIME_RE.search(stripped):
+        return RouteDecision(AGENT, "realtime")
+    if len(stripped) <= 60 and _SMALL_TALK_RE.match(stripped):
+        return RouteDecision(DIRECT, "small_talk")
+    if _STATIC_RE.search(stripped):
+        return RouteDecision(DIRECT, "static_knowledge")
+    return RouteDecision(AGENT, "default")
+
+
+class LatencyTracker:
+    """Moving average of response time per route, to estimate fast-path savings."""
+
+    def __init__(self):
+        self._averages = {}
+        self._lock = threading.Lock()
+
+    def observe(self, route: str, seconds: float):
+        with self._lock:
+            previous = self._averages.get(route)
+            self._averages[route] = seconds if previous is None else 0.9 * previous + 0.1 * seconds
+
+    def average(self, route: str):
+        return self._averages.get(route)
+
+
+route_latency = LatencyTracker()
@@ -0,0 +1,291 @@
+# app/ai/retrieval.py
+#
+# Per-user retrieval over chat history, so AI prompts stay small.
+#
+# Instead of replaying a whole conversation, each prompt gets the last few
+# messages of the current chat plus the top-k earlier messages from any of
+# the user's chats that look most like the new question. Similarity is the
+# dot product of hashed bag-of-words vectors (unigrams and bigrams, signed
+# feature hashing, log-scaled and L2-normalized), held per user in a NumPy
+# matrix. Nothing is trained and no embedding API is called.
+#
+# Each worker keeps the indexes of recently active users in memory, evicting
+# the least recently used beyond AI_RETRIEVAL_MEMORY_MB. An index is loaded
+# from backend.messages on first use (the newest
+# AI_RETRIEVAL_MAX_MESSAGES_PER_USER messages); after that each prompt
+# fetches only messages from AI_RETRIEVAL_SYNC_OVERLAP_SECONDS before the
+# newest one seen onwards and vectorizes those not indexed yet. Timestamps
+# come from the app clock before commit, so the overlap catches messages
+# saved by other workers or slow transactions that commit out of order.
+#
+# Months moved to cold storage (app/archive.py) are not in backend.messages
+# and are not indexed; retrieval only draws on the hot history.
+
+import logging
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from sqlalchemy import select
+
+from app.config import (
+    AI_CONTEXT_MAX_CHARS_PER_MESSAGE,
+    AI_CONTEXT_RECENT_MESSAGES,
+    AI_CONTEXT_RETRIEVED_MESSAGES,
+    AI_RETRIEVAL_MAX_MESSAGES_PER_USER,
+    AI_RETRIEVAL_MEMORY_MB,
+    AI_RETRIEVAL_MIN_SCORE,
+    AI_RETRIEVAL_SYNC_OVERLAP_SECONDS,
+)
+from app.database import engine
+from app.metrics import AI_CONTEXT_MESSAGES
+from app.models import Message, UserChat
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = 1024
+RERANK_FACTOR = 4
+EPOCH = datetime(1970, 1, 1)
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by can could did do does for from had has have how i i'm if in is it it's "
+    "me my of on or our so than that the their them then there these they this to us was we were what "
+    "when where which who why will with would you your".split()
+)
+
+
+# --------------------
+# Vectorizer
+# --------------------
+def _features(text: str) -> List[str]:
+    tokens = [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def vectorize(texts: List[str]) -> np.ndarray:
+    """One L2-normalized float32 row per text."""
+    rows, cols, signs = [], [], []
+    for i, text in enumerate(texts):
+        for feature in _features(text):
+            h = zlib.crc32(feature.encode())
+            rows.append(i)
+            cols.append(h % DIMENSIONS)
+            signs.append(1.0 if h & 0x80000000 else -1.0)
+    matrix = np.zeros((len(texts), DIMENSIONS), dtype=np.float32)
+    np.add.at(matrix, (np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp)), np.array(signs, dtype=np.float32))
+    np.copyto(matrix, np.sign(matrix) * np.log1p(np.abs(matrix)))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+# --------------------
+# Per-user index
+# --------------------
+@dataclass
+class IndexedMessage:
+    id: object
+    chat_id: object
+    from_user: bool
+    text: str
+    timestamp: datetime
+
+
+class UserIndex:
+    """Vectors and messages of one user, oldest first, at most `capacity` of them."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.size = 0
+        self._buffer = np.zeros((0, DIMENSIONS), dtype=np.float32)
+        self.messages: List[IndexedMessage] = []
+        self.ids = set()
+        self.high_water = None  # timestamp of the newest message seen
+        self.lock = threading.Lock()
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._buffer[:self.size]
+
+    @property
+    def nbytes(self) -> int:
+        return self._buffer.nbytes + sum(len(m.text) for m in self.messages)
+
+    def add(self, messages: List[IndexedMessage]) -> int:
+        """Index the messages not seen yet; returns how many were added."""
+        messages = [m for m in messages if m.id not in self.ids]
+        if not messages:
+            return 0
+        newest = max(m.timestamp for m in messages)
+        self.high_water = newest if self.high_water is None else max(self.high_water, newest)
+        messages = messages[-self.capacity:]
+        vectors = vectorize([m.text for m in messages])
+
+        # Drop the oldest rows that no longer fit, then grow geometrically
+        overflow = self.size + len(messages) - self.capacity
+        if overflow > 0:
+            self._buffer[:self.size - overflow] = self._buffer[overflow:self.size]
+            self.ids.difference_update(m.id for m in self.messages[:overflow])
+            del self.messages[:overflow]
+            self.size -= overflow
+        needed = self.size + len(messages)
+        if needed > len(self._buffer):
+            grown = np.zeros((min(self.capacity, max(needed, 2 * len(self._buffer))), DIMENSIONS), dtype=np.float32)
+            grown[:self.size] = self._buffer[:self.size]
+            self._buffer = grown
+        self._buffer[self.size:needed] = vectors
+        self.messages.extend(messages)
+        self.ids.update(m.id for m in messages)
+        self.size = needed
+        return len(messages)
+
+    def recent(self, chat_id, limit: int) -> List[int]:
+        """Positions of the chat's last `limit` messages, oldest first.
+
+        A late-committed message sits after newer ones in the buffer, hence the sort.
+        """
+        positions = []
+        for position in range(self.size - 1, -1, -1):
+            if len(positions) >= limit:
+                break
+            if self.messages[position].chat_id == chat_id:
+                positions.append(position)
+        return sorted(positions, key=lambda p: (self.messages[p].timestamp, p))
+
+    def search(self, query: str, k: int, exclude: set, min_score: float) -> List[int]:
+        """Positions of the k messages most similar to query, oldest first.
+
+        The hashed vectors shortlist RERANK_FACTOR * k candidates; those are
+        re-scored on their actual features, so a hash collision alone never
+        pulls an unrelated message into the prompt.
+        """
+        if k <= 0 or not self.size:
+            return []
+        scores = self.vectors @ vectorize([query])[0]
+        if exclude:
+            scores[list(exclude)] = -1
+        shortlist = min(k * RERANK_FACTOR, self.size)
+        candidates = np.argpartition(-scores, shortlist - 1)[:shortlist]
+
+        query_features = set(_features(query))
+        exact = []
+        for position in candidates:
+            if scores[position] <= 0:
+                continue
+            features = set(_features(self.messages[position].text))
+            shared = len(query_features & features)
+            if shared:
+                exact.append((shared / np.sqrt(len(query_features) * len(features)), int(position)))
+        exact.sort(reverse=True)
+        return sorted(position for score, position in exact[:k] if score >= min_score)
+
+
+class ConversationIndex:
+    def __init__(self, max_messages_per_user: int, memory_budget_bytes: int):
+        self.max_messages_per_user = max_messages_per_user
+        self.memory_budget_bytes = memory_budget_bytes
+        self._users = OrderedDict()  # least recently used first
+        self._lock = threading.Lock()
+
+    def _user_index(self, user_id) -> UserIndex:
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is None:
+                index = self._users[user_id] = UserIndex(self.max_messages_per_user)
+            self._users.move_to_end(user_id)
+            return index
+
+    def _evict(self):
+        with self._lock:
+            sizes = {user_id: index.nbytes for user_id, index in self._users.items()}
+            total = sum(sizes.values())
+            while total > self.memory_budget_bytes and len(self._users) > 1:
+                user_id, _ = self._users.popitem(last=False)
+                total -= sizes[user_id]
+
+    def _fetch_new(self, user_id, after) -> List[IndexedMessage]:
+        stmt = select(Message.id, Message.chat_id, Message.sender_id, Message.message_text, Message.timestamp).where(
+            Message.chat_id.in_(select(UserChat.chat_id).where(UserChat.user_id == user_id))
+        )
+        if after is None:
+            # First use: the newest messages, returned oldest first below
+            stmt = stmt.order_by(Message.timestamp.desc(), Message.id.desc()).limit(self.max_messages_per_user)
+        else:
+            overlap = after - timedelta(seconds=AI_RETRIEVAL_SYNC_OVERLAP_SECONDS)
+            stmt = stmt.where(Message.timestamp >= overlap).order_by(Message.timestamp, Message.id)
+        with engine.connect() as conn:
+            rows = conn.execute(stmt).all()
+        if after is None:
+            rows.reverse()
+        return [
+            IndexedMessage(row.id, row.chat_id, row.sender_id == user_id, row.message_text or "", row.timestamp or EPOCH)
+            for row in rows
+        ]
+
+    def sync(self, user_id) -> UserIndex:
+        """The user's index with every message saved so far."""
+        index = self._user_index(user_id)
+        with index.lock:
+            added = index.add(self._fetch_new(user_id, index.high_water))
+        if added:
+            self._evict()
+        return index
+
+
+conversation_index = ConversationIndex(AI_RETRIEVAL_MAX_MESSAGES_PER_USER, AI_RETRIEVAL_MEMORY_MB * 1024 * 1024)
+
+
+# --------------------
+# Prompt context
+# --------------------
+def _clip(text: str) -> str:
+    if len(text) <= AI_CONTEXT_MAX_CHARS_PER_MESSAGE:
+        return text
+    return text[:AI_CONTEXT_MAX_CHARS_PER_MESSAGE].rstrip() + " …"
+
+
+def build_chat_history(user_id, chat_id: Optional[object], user_input: str) -> list:
+    """chat_history messages for a prompt: relevant earlier turns, then the recent window."""
+    if user_id is None:
+        return []
+    try:
+        index = conversation_index.sync(user_id)
+    except Exception:
+        # History is an enhancement; answer without it rather than fail
+        logger.exception("conversation history unavailable for user %s", user_id)
+        return []
+
+    with index.lock:
+        recent = index.recent(chat_id, AI_CONTEXT_RECENT_MESSAGES + 1) if chat_id is not None else []
+        # The prompt being answered was saved before generation started
+        if recent and index.messages[recent[-1]].from_user and index.messages[recent[-1]].text == user_input:
+            current = recent.pop()
+        else:
+            current = None
+            recent = recent[-AI_CONTEXT_RECENT_MESSAGES:] if AI_CONTEXT_RECENT_MESSAGES else []
+        exclude = set(recent) | ({current} if current is not None else set())
+        retrieved = index.search(user_input, AI_CONTEXT_RETRIEVED_MESSAGES, exclude, AI_RETRIEVAL_MIN_SCORE)
+        retrieved_messages = [index.messages[p] for p in retrieved]
+        recent_messages = [index.messages[p] for p in recent]
+
+    AI_CONTEXT_MESSAGES.labels("retrieved").observe(len(retrieved_messages))
+    AI_CONTEXT_MESSAGES.labels("recent").observe(len(recent_messages))
+
+    history = []
+    if retrieved_messages:
+        lines = [
+            f"[{m.timestamp:%Y-%m-%d}] {'User' if m.from_user else 'Assistant'}: {_clip(m.text)}"
+            for m in retrieved_messages
+        ]
+        history.append(SystemMessage(
+            "Earlier messages from this user's history that may be relevant:\n" + "\n".join(lines)
+        ))
+    for m in recent_messages:
+        history.append(HumanMessage(_clip(m.text)) if m.from_user else AIMessage(_clip(m.text)))
+    return history
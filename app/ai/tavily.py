@@ -0,0 +1,36 @@
+# app/ai/tavily.py
+#
+# Tavily web search over the shared HTTP pool.
+#
+# langchain's TavilySearchResults posts with a bare requests.post (a new
+# connection and TLS handshake per search) and returns API errors as a
+# string result. This calls the same REST endpoint through
+# app.http_clients, returns results in the same shape, and raises on errors
+# so the circuit breaker sees them.
+
+import os
+
+from app.http_clients import http_client
+from app.metrics import track_outbound
+
+TAVILY_SEARCH_URL = "https://api.tavily.com/search"
+
+
+class TavilySearch:
+    def __init__(self, max_results: int = 5, search_depth: str = "advanced"):
+        self.max_results = max_results
+        self.search_depth = search_depth
+
+    def run(self, query: str) -> list:
+        with track_outbound("tavily", "search"):
+            response = http_client.post(TAVILY_SEARCH_URL, json={
+                "api_key": os.getenv("TAVILY_API_KEY"),
+                "query": query,
+                "max_results": self.max_results,
+                "search_depth": self.search_depth,
+            })
+        response.raise_for_status()
+        return [
+            {"title": r.get("title"), "url": r["url"], "content": r["content"], "score": r.get("score")}
+            for r in response.json().get("results", [])
+        ]
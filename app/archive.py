@@ -0,0 +1,281 @@
+# app/archive.py
+#
+# Cold storage for old message partitions.
+#
+# Partitions that ended more than MESSAGE_HOT_RETENTION_MONTHS ago are
+# written to gzipped CSV files under MESSAGE_ARCHIVE_DIR, indexed in
+# backend.message_archives / message_archive_chats, then detached and
+# dropped. When an archived chat is opened its rows are copied back into a
+# re-created partition for that month; the partition is dropped again once
+# nobody has rehydrated from it for MESSAGE_REHYDRATED_TTL_DAYS. The data
+# export rehydrates all of a user's chats first. Full-text search and AI
+# retrieval read only what is in the table; search reports the cut-off
+# (archived_until) in its response.
+#
+# The same maintenance task keeps future partitions created.
+
+import csv
+import gzip
+import hashlib
+import io
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+
+from app.background import PeriodicTask
+from app.config import (
+    MESSAGE_ARCHIVE_DIR,
+    MESSAGE_ARCHIVE_ENABLED,
+    MESSAGE_HOT_RETENTION_MONTHS,
+    MESSAGE_MAINTENANCE_INTERVAL_SECONDS,
+    MESSAGE_REHYDRATED_TTL_DAYS,
+)
+from app.database import engine
+from app.models import MessageArchive, MessageArchiveChat, UserChat
+from app.partitions import (
+    MAINTENANCE_LOCK_SQL,
+    MESSAGE_COLUMNS,
+    PARENT,
+    add_months,
+    attach_month_partition,
+    attached_partitions,
+    ensure_message_partitions,
+    month_start,
+    partition_name,
+)
+
+logger = logging.getLogger(__name__)
+
+_COLUMNS = ", ".join(MESSAGE_COLUMNS)
+_CHAT_ID_COLUMN = MESSAGE_COLUMNS.index("chat_id")
+
+
+def hot_cutoff(now=None) -> datetime:
+    """Partitions ending on or before this are cold."""
+    return add_months(month_start(now or datetime.utcnow()), -MESSAGE_HOT_RETENTION_MONTHS)
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _drop_partition(conn, name: str):
+    conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION backend.{name}"))
+    conn.execute(text(f"DROP TABLE backend.{name}"))
+
+
+# --------------------
+# Archival
+# --------------------
+def archive_partition(conn, start: datetime, archive_dir: str = MESSAGE_ARCHIVE_DIR):
+    """Write one partition to <archive_dir>/<name>.csv.gz, index it, then drop it.
+
+    Runs in the caller's transaction. The file is complete and fsynced before
+    the partition is dropped; if the transaction fails the file is simply
+    rewritten on the next run.
+    """
+    name = partition_name(start)
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    tmp_path = path + ".tmp"
+
+    raw = conn.connection.dbapi_connection
+    with raw.cursor() as cur, open(tmp_path, "wb") as f:
+        with gzip.GzipFile(fileobj=f, mode="wb") as gz:
+            cur.copy_expert(
+                f"COPY (SELECT {_COLUMNS} FROM backend.{name} ORDER BY chat_id, timestamp) TO STDOUT WITH (FORMAT csv)",
+                gz,
+            )
+            row_count = cur.rowcount
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    archive = conn.execute(
+        MessageArchive.__table__.insert().returning(MessageArchive.__table__.c.id),
+        {
+            "partition_name": name,
+            "range_start": start,
+            "range_end": add_months(start, 1),
+            "path": path,
+            "row_count": row_count,
+            "size_bytes": os.path.getsize(path),
+            "sha256": _sha256(path),
+            "archived_at": datetime.utcnow(),
+        },
+    ).scalar()
+    conn.execute(
+        text(f"""
+            INSERT INTO backend.message_archive_chats (archive_id, chat_id, message_count, rehydrated)
+            SELECT :archive_id, chat_id, count(*), false FROM backend.{name} GROUP BY chat_id
+        """),
+        {"archive_id": archive},
+    )
+    _drop_partition(conn, name)
+    logger.info("archived partition %s rows=%d path=%s", name, row_count, path)
+    return path
+
+
+def _release_rehydrated(conn, archive_id, name: str):
+    # Rows are still in the archive file; just drop the restored copy
+    _drop_partition(conn, name)
+    conn.execute(
+        text("UPDATE backend.message_archive_chats SET rehydrated = false WHERE archive_id = :id"),
+        {"id": archive_id},
+    )
+    conn.execute(text("UPDATE backend.message_archives SET rehydrated_at = NULL WHERE id = :id"), {"id": archive_id})
+    logger.info("released rehydrated partition %s", name)
+
+
+def archive_cold_partitions(now=None):
+    now = now or datetime.utcnow()
+    cutoff = hot_cutoff(now)
+    with engine.connect() as conn:
+        candidates = sorted(start for start in attached_partitions(conn) if add_months(start, 1) <= cutoff)
+
+    archived = []
+    for start in candidates:
+        name = partition_name(start)
+        # One partition per transaction keeps locks and file work short
+        with engine.begin() as conn:
+            conn.execute(MAINTENANCE_LOCK_SQL)
+            if start not in attached_partitions(conn):
+                continue
+            existing = conn.execute(
+                text("SELECT id, rehydrated_at FROM backend.message_archives WHERE partition_name = :name"),
+                {"name": name},
+            ).first()
+            if existing is None:
+                archive_partition(conn, start)
+                archived.append(name)
+            elif existing.rehydrated_at is None or now - existing.rehydrated_at > timedelta(days=MESSAGE_REHYDRATED_TTL_DAYS):
+                _release_rehydrated(conn, existing.id, name)
+    return archived
+
+
+# --------------------
+# Rehydration
+# --------------------
+def _chat_rows_from_archive(path: str, chat_ids: set) -> io.StringIO:
+    # Files are sorted by chat_id (uuid order is the order of the lowercase
+    # text form), so stop once we are past the last wanted chat
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    last = max(chat_ids)
+    with gzip.open(path, "rt", newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            chat_id = row[_CHAT_ID_COLUMN]
+            if chat_id in chat_ids:
+                writer.writerow(row)
+            elif chat_id > last:
+                break
+    buffer.seek(0)
+    return buffer
+
+
+def needs_rehydration(db: Session, chat_id) -> bool:
+    return db.query(MessageArchiveChat.chat_id).filter(
+        MessageArchiveChat.chat_id == chat_id,
+        MessageArchiveChat.rehydrated.is_(False),
+    ).first() is not None
+
+
+def archived_until(db: Session, user_id) -> Optional[datetime]:
+    """End of the newest archived month still holding messages of the user's chats, if any.
+
+    Readers that query backend.messages without rehydrating (search, AI
+    retrieval) don't see messages before this.
+    """
+    return db.execute(
+        select(func.max(MessageArchive.range_end))
+        .join(MessageArchiveChat, MessageArchiveChat.archive_id == MessageArchive.id)
+        .where(
+            MessageArchiveChat.chat_id.in_(select(UserChat.chat_id).where(UserChat.user_id == user_id)),
+            MessageArchiveChat.rehydrated.is_(False),
+        )
+    ).scalar()
+
+
+def rehydrate_chats(db: Session, chat_ids):
+    """Copy the chats' archived messages back into messages. Commits.
+
+    chat_ids may be a list or a subquery; each archive file is read once.
+    """
+    pending = (
+        db.query(MessageArchive)
+        .join(MessageArchiveChat, MessageArchiveChat.archive_id == MessageArchive.id)
+        .filter(MessageArchiveChat.chat_id.in_(chat_ids), MessageArchiveChat.rehydrated.is_(False))
+        .distinct()
+        .order_by(MessageArchive.range_start)
+        .all()
+    )
+    restored = 0
+    for archive in pending:
+        conn = db.connection()
+        conn.execute(MAINTENANCE_LOCK_SQL)
+        entries = (
+            db.query(MessageArchiveChat)
+            .filter(
+                MessageArchiveChat.archive_id == archive.id,
+                MessageArchiveChat.chat_id.in_(chat_ids),
+                MessageArchiveChat.rehydrated.is_(False),
+            )
+            .with_for_update()
+            .all()
+        )
+        if not entries:
+            db.commit()
+            continue
+        if not os.path.exists(archive.path):
+            logger.error("archive file missing for %s: %s", archive.partition_name, archive.path)
+            db.rollback()
+            continue
+
+        attach_month_partition(conn, archive.range_start)
+        with conn.connection.dbapi_connection.cursor() as cur:
+            cur.copy_expert(
+                f"COPY {PARENT} ({_COLUMNS}) FROM STDIN WITH (FORMAT csv)",
+                _chat_rows_from_archive(archive.path, {str(entry.chat_id) for entry in entries}),
+            )
+            restored += cur.rowcount
+        for entry in entries:
+            entry.rehydrated = True
+        archive.rehydrated_at = datetime.utcnow()
+        db.commit()
+    if restored:
+        logger.info("rehydrated %d archived messages", restored)
+    return restored
+
+
+def rehydrate_chat(db: Session, chat_id):
+    """Copy a chat's archived messages back into messages. Commits."""
+    return rehydrate_chats(db, [chat_id])
+
+
+# --------------------
+# Maintenance task
+# --------------------
+def run_message_maintenance():
+    with engine.begin() as conn:
+        conn.execute(MAINTENANCE_LOCK_SQL)
+        created = ensure_message_partitions(conn)
+    if created:
+        logger.info("created message partitions: %s", ", ".join(created))
+    if MESSAGE_ARCHIVE_ENABLED:
+        archive_cold_partitions()
+
+
+message_maintenance_task = PeriodicTask(
+    "message-partitions",
+    MESSAGE_MAINTENANCE_INTERVAL_SECONDS,
+    run_message_maintenance,
+    run_immediately=False,
+)
@@ -0,0 +1,44 @@
+# app/background.py
+#
+# Small helper for periodic maintenance work that runs inside each worker
+# process (data refreshes, cleanups). One daemon thread per task; an error
+# in one run is logged and the next run happens on schedule.
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    def __init__(self, name: str, interval: float, func, run_immediately: bool = True):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.run_immediately = run_immediately
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._loop, name=f"periodic-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self):
+        if not self.run_immediately and self._stopping.wait(self.interval):
+            return
+        while True:
+            try:
+                self.func()
+            except Exception:
+                logger.exception("Periodic task %s failed", self.name)
+            if self._stopping.wait(self.interval):
+                return
@@ -0,0 +1,189 @@
+# app/circuit_breaker.py
+#
+# Circuit breakers for external dependencies (Gemini models, Tavily, Stripe,
+# SMTP, OAuth providers).
+#
+# Each breaker watches the outcome of its last CIRCUIT_WINDOW calls. A call
+# counts as bad when it raises (exceptions listed in `ignore`, such as a
+# declined card, are the caller's problem and don't count) or when it takes
+# longer than the breaker's slow-call threshold. Once at least
+# CIRCUIT_MIN_CALLS have been seen and the bad share reaches
+# CIRCUIT_FAILURE_RATE, the breaker opens: calls are rejected immediately
+# with CircuitOpen instead of waiting on a dependency that is down. After
+# CIRCUIT_OPEN_SECONDS it goes half-open and lets a few probe calls through;
+# a good probe closes it again, a bad one re-opens it.
+#
+# State is per worker process and exported as circuit_breaker_state (and at
+# /health/circuits).
+
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from fastapi import HTTPException, status
+
+from app.config import (
+    CIRCUIT_FAILURE_RATE,
+    CIRCUIT_HALF_OPEN_PROBES,
+    CIRCUIT_MIN_CALLS,
+    CIRCUIT_OPEN_SECONDS,
+    CIRCUIT_WINDOW,
+)
+from app.metrics import CIRCUIT_BREAKER_REJECTED, CIRCUIT_BREAKER_STATE, CIRCUIT_BREAKER_TRANSITIONS
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"circuit '{name}' is open")
+        self.name = name
+        self.retry_after = retry_after
+
+    def to_http(self, detail: str) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(self.retry_after)))},
+        )
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        slow_call_seconds: float,
+        failure_rate: float = CIRCUIT_FAILURE_RATE,
+        window: int = CIRCUIT_WINDOW,
+        min_calls: int = CIRCUIT_MIN_CALLS,
+        open_seconds: float = CIRCUIT_OPEN_SECONDS,
+        half_open_probes: int = CIRCUIT_HALF_OPEN_PROBES,
+        ignore: tuple = (),
+    ):
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.ignore = ignore
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._outcomes = deque(maxlen=window)  # True = bad call
+        self._probes = 0  # half-open calls in flight
+        self._lock = threading.Lock()
+        CIRCUIT_BREAKER_STATE.labels(name).set(0)
+
+    # ---------- state ----------
+    def _transition(self, state: str):
+        # Caller holds the lock
+        if state == self.state:
+            return
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        self._outcomes.clear()
+        self._probes = 0
+        CIRCUIT_BREAKER_STATE.labels(self.name).set(STATE_VALUES[state])
+        CIRCUIT_BREAKER_TRANSITIONS.labels(self.name, state).inc()
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now. A True in half-open state takes a probe slot."""
+        with self._lock:
+            if self.state == OPEN:
+                if self.retry_after() > 0:
+                    CIRCUIT_BREAKER_REJECTED.labels(self.name).inc()
+                    return False
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    CIRCUIT_BREAKER_REJECTED.labels(self.name).inc()
+                    return False
+                self._probes += 1
+            return True
+
+    def record(self, ok: bool, duration: float):
+        bad = not ok or duration > self.slow_call_seconds
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._transition(OPEN if bad else CLOSED)
+                return
+            if self.state == OPEN:
+                return  # a call admitted before the breaker opened
+            self._outcomes.append(bad)
+            if len(self._outcomes) >= self.min_calls and sum(self._outcomes) / len(self._outcomes) >= self.failure_rate:
+                self._transition(OPEN)
+
+    def cancel(self):
+        """An allowed call was abandoned without an outcome (e.g. a losing hedge)."""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    # ---------- wrapping calls ----------
+    def _check(self):
+        if not self.allow():
+            raise CircuitOpen(self.name, self.retry_after())
+
+    def _finish(self, started: float, error: BaseException = None):
+        duration = time.perf_counter() - started
+        if error is None or isinstance(error, self.ignore):
+            self.record(True, duration)
+        elif isinstance(error, Exception):
+            self.record(False, duration)
+        else:
+            self.cancel()  # cancellation or shutdown, not the dependency's fault
+
+    @contextmanager
+    def guard(self):
+        """Run the block through the breaker; raises CircuitOpen when it is open.
+
+        Works around awaits too: the block's duration and exception are what count.
+        """
+        self._check()
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            self._finish(started, e)
+            raise
+        self._finish(started)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "recent_calls": len(self._outcomes),
+                "recent_failures": sum(self._outcomes),
+                "retry_after_seconds": round(self.retry_after(), 1) if self.state == OPEN else 0,
+            }
+
+
+# --------------------
+# Registry
+# --------------------
+_breakers = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name: str, slow_call_seconds: float, **options) -> CircuitBreaker:
+    """The process-wide breaker for `name`, created on first use."""
+    with _registry_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name, slow_call_seconds, **options)
+        return breaker
+
+
+def breaker_states() -> dict:
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
@@ -1,4 +1,5 @@
 import os
+from dataclasses import dataclass
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -35,3 +36,143 @@ BACKEND_DOMAIN = os.getenv("BACKEND_DOMAIN")
 GOOGLE_REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI")
 FACEBOOK_REDIRECT_URI = os.getenv("FACEBOOK_REDIRECT_URI")
 
+# Logging: JSON lines (or "text") through a background writer thread.
+# LOG_LEVELS overrides per logger, e.g. "app.ai.trace=DEBUG,uvicorn.access=WARNING"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+# Prometheus metrics (served at /metrics)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Per-request SQL profiler (adds X-DB-* response headers, logs N+1 suspects)
+SQL_PROFILER_ENABLED = os.getenv("SQL_PROFILER_ENABLED", "false").lower() == "true"
+SQL_PROFILER_REPEAT_THRESHOLD = int(os.getenv("SQL_PROFILER_REPEAT_THRESHOLD", 5))
+
+# Chat rate limits (messages per minute, burst = the same number)
+CHAT_RATE_LIMIT_SUBSCRIBED_PER_MINUTE = int(os.getenv("CHAT_RATE_LIMIT_SUBSCRIBED_PER_MINUTE", 20))
+CHAT_RATE_LIMIT_TRIAL_PER_MINUTE = int(os.getenv("CHAT_RATE_LIMIT_TRIAL_PER_MINUTE", 10))
+CHAT_RATE_LIMIT_FREE_PER_MINUTE = int(os.getenv("CHAT_RATE_LIMIT_FREE_PER_MINUTE", 3))
+CHAT_RATE_LIMIT_PER_IP_PER_MINUTE = int(os.getenv("CHAT_RATE_LIMIT_PER_IP_PER_MINUTE", 60))
+
+# AI admission control (per worker process)
+AI_MAX_CONCURRENT_PER_WORKER = int(os.getenv("AI_MAX_CONCURRENT_PER_WORKER", 8))
+AI_MAX_QUEUED_PER_WORKER = int(os.getenv("AI_MAX_QUEUED_PER_WORKER", 16))
+AI_QUEUE_TIMEOUT_SECONDS = float(os.getenv("AI_QUEUE_TIMEOUT_SECONDS", 10))
+
+# Gemini model pool: comma-separated, in order of preference
+AI_MODELS = [m.strip() for m in os.getenv("AI_MODELS", "gemini-2.5-flash,gemini-1.5-flash").split(",") if m.strip()]
+AI_MAX_ATTEMPTS = int(os.getenv("AI_MAX_ATTEMPTS", 3))
+AI_HEDGE_ENABLED = os.getenv("AI_HEDGE_ENABLED", "true").lower() == "true"
+AI_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("AI_HEDGE_MIN_DELAY_SECONDS", 1.5))
+AI_HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("AI_HEDGE_DEFAULT_DELAY_SECONDS", 8))
+AI_REQUEST_TIMEOUT_SECONDS = float(os.getenv("AI_REQUEST_TIMEOUT_SECONDS", 60))
+AI_MODEL_COOLDOWN_SECONDS = float(os.getenv("AI_MODEL_COOLDOWN_SECONDS", 30))
+
+# Fraction of AI requests whose agent steps are logged to app.ai.trace
+AI_TRACE_SAMPLE_RATE = float(os.getenv("AI_TRACE_SAMPLE_RATE", 0.01))
+
+# Send small talk and static-knowledge prompts straight to the LLM, skipping the agent
+AI_FAST_PATH_ENABLED = os.getenv("AI_FAST_PATH_ENABLED", "true").lower() == "true"
+
+# Background pool for async AI jobs (per worker process)
+AI_JOB_WORKERS = int(os.getenv("AI_JOB_WORKERS", 4))
+AI_JOB_QUEUE_SIZE = int(os.getenv("AI_JOB_QUEUE_SIZE", 32))
+
+# Prompt context: recent messages of the chat plus retrieved earlier ones
+AI_CONTEXT_RECENT_MESSAGES = int(os.getenv("AI_CONTEXT_RECENT_MESSAGES", 6))
+AI_CONTEXT_RETRIEVED_MESSAGES = int(os.getenv("AI_CONTEXT_RETRIEVED_MESSAGES", 4))
+AI_CONTEXT_MAX_CHARS_PER_MESSAGE = int(os.getenv("AI_CONTEXT_MAX_CHARS_PER_MESSAGE", 1200))
+AI_RETRIEVAL_MIN_SCORE = float(os.getenv("AI_RETRIEVAL_MIN_SCORE", 0.2))
+AI_RETRIEVAL_MAX_MESSAGES_PER_USER = int(os.getenv("AI_RETRIEVAL_MAX_MESSAGES_PER_USER", 5000))
+AI_RETRIEVAL_MEMORY_MB = int(os.getenv("AI_RETRIEVAL_MEMORY_MB", 256))
+# Messages are timestamped by the app before they commit; each sync re-reads
+# this much before the newest one indexed to catch late commits
+AI_RETRIEVAL_SYNC_OVERLAP_SECONDS = float(os.getenv("AI_RETRIEVAL_SYNC_OVERLAP_SECONDS", 300))
+
+# Local sports-data store: file:///path/to/data.json or an http(s) URL serving the same JSON
+SPORTS_DATA_SOURCE = os.getenv("SPORTS_DATA_SOURCE", "")
+SPORTS_DATA_REFRESH_SECONDS = float(os.getenv("SPORTS_DATA_REFRESH_SECONDS", 900))
+
+# Event-loop stall watchdog: logs the blocking route and stack when the loop is stuck longer than this
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", 100))
+
+# CORS origins allowed to call the API (comma-separated)
+CORS_ORIGINS = [o.strip() for o in os.getenv(
+    "CORS_ORIGINS",
+    "http://localhost:3000,http://127.0.0.1:3000,https://e22bbebece93.ngrok-free.app,"
+    "https://ppp7rljm-8000.inc1.devtunnels.ms/,http://localhost:8000,https://gameplan-demo.vercel.app",
+).split(",") if o.strip()]
+
+# Startup warm-up and graceful shutdown
+DB_WARM_CONNECTIONS = int(os.getenv("DB_WARM_CONNECTIONS", 5))
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", 10))
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", 30))
+
+
+# Monthly message partitions and cold-history archival
+MESSAGE_PARTITIONS_AHEAD_MONTHS = int(os.getenv("MESSAGE_PARTITIONS_AHEAD_MONTHS", 3))
+MESSAGE_MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("MESSAGE_MAINTENANCE_INTERVAL_SECONDS", 6 * 3600))
+MESSAGE_ARCHIVE_ENABLED = os.getenv("MESSAGE_ARCHIVE_ENABLED", "false").lower() == "true"
+MESSAGE_HOT_RETENTION_MONTHS = int(os.getenv("MESSAGE_HOT_RETENTION_MONTHS", 12))
+MESSAGE_ARCHIVE_DIR = os.getenv("MESSAGE_ARCHIVE_DIR", "archive/messages")
+MESSAGE_REHYDRATED_TTL_DAYS = int(os.getenv("MESSAGE_REHYDRATED_TTL_DAYS", 7))
+
+# Idempotency-Key handling for mutating endpoints
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", 24))
+# A duplicate of an in-flight request holds a worker thread this long at most
+# before getting 409 + Retry-After
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", 2))
+IDEMPOTENCY_RETRY_AFTER_SECONDS = int(os.getenv("IDEMPOTENCY_RETRY_AFTER_SECONDS", 3))
+IDEMPOTENCY_LOCK_TIMEOUT_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT_SECONDS", 300))
+
+# Recurring classes: occurrences are materialized this far ahead
+CLASS_OCCURRENCE_HORIZON_DAYS = int(os.getenv("CLASS_OCCURRENCE_HORIZON_DAYS", 400))
+CLASS_OCCURRENCE_REFRESH_SECONDS = float(os.getenv("CLASS_OCCURRENCE_REFRESH_SECONDS", 6 * 3600))
+
+# Circuit breakers for external dependencies (per worker process)
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", 0.5))
+CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", 20))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", 10))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", 30))
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", 1))
+# Calls slower than these count as failures
+CIRCUIT_SLOW_GEMINI_SECONDS = float(os.getenv("CIRCUIT_SLOW_GEMINI_SECONDS", 30))
+CIRCUIT_SLOW_TAVILY_SECONDS = float(os.getenv("CIRCUIT_SLOW_TAVILY_SECONDS", 8))
+CIRCUIT_SLOW_STRIPE_SECONDS = float(os.getenv("CIRCUIT_SLOW_STRIPE_SECONDS", 8))
+CIRCUIT_SLOW_SMTP_SECONDS = float(os.getenv("CIRCUIT_SLOW_SMTP_SECONDS", 10))
+CIRCUIT_SLOW_OAUTH_SECONDS = float(os.getenv("CIRCUIT_SLOW_OAUTH_SECONDS", 8))
+
+# Outgoing mail: connection timeout, and how long undeliverable mail is retried
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", 10))
+EMAIL_RETRY_INTERVAL_SECONDS = float(os.getenv("EMAIL_RETRY_INTERVAL_SECONDS", 30))
+EMAIL_RETRY_MAX_AGE_SECONDS = float(os.getenv("EMAIL_RETRY_MAX_AGE_SECONDS", 15 * 60))
+EMAIL_QUEUE_SIZE = int(os.getenv("EMAIL_QUEUE_SIZE", 1000))
+
+# Shared outbound HTTP pools (Stripe, Tavily, OAuth providers)
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", 20))
+HTTP_MAX_KEEPALIVE_PER_HOST = int(os.getenv("HTTP_MAX_KEEPALIVE_PER_HOST", 10))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", 90))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", 5))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", 30))
+HTTP_POOL_TIMEOUT_SECONDS = float(os.getenv("HTTP_POOL_TIMEOUT_SECONDS", 5))
+
+
+@dataclass(frozen=True)
+class Settings:
+    """App-level settings passed to create_app(); defaults come from the environment."""
+
+    secret_key: str = SECRET_KEY
+    cors_origins: tuple = tuple(CORS_ORIGINS)
+    metrics_enabled: bool = METRICS_ENABLED
+    sql_profiler_enabled: bool = SQL_PROFILER_ENABLED
+    sql_profiler_repeat_threshold: int = SQL_PROFILER_REPEAT_THRESHOLD
+    loop_monitor_enabled: bool = LOOP_MONITOR_ENABLED
+    loop_lag_threshold_ms: float = LOOP_LAG_THRESHOLD_MS
+    db_warm_connections: int = DB_WARM_CONNECTIONS
+    warmup_timeout_seconds: float = WARMUP_TIMEOUT_SECONDS
+    shutdown_drain_seconds: float = SHUTDOWN_DRAIN_SECONDS
+    background_tasks_enabled: bool = True
@@ -1,5 +1,5 @@
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 from app.config import DATABASE_URL
 
 # Specify schema in the metadata
@@ -14,13 +14,27 @@ Base = declarative_base(metadata=metadata)
 # Database engine
 engine = create_engine(DATABASE_URL)
 
-# Session maker
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Session maker. Loaded objects stay usable after commit (expire_on_commit=False),
+# so a route can commit, give its connection back and keep using what it read.
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
-# Dependency to get DB session in routes
+# Dependency to get DB session in routes. FastAPI caches it per request, so the
+# route, get_current_user and the rate-limit dependency all share one session.
+# A session only checks out a pooled connection when its first query runs and
+# returns it on commit/rollback.
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+def release_connection(db: Session):
+    """End the session's transaction so its connection goes back to the pool.
+
+    Call before slow work that doesn't touch the database (LLM calls, Stripe);
+    the next query checks out a connection again.
+    """
+    if db.in_transaction():
+        db.commit()
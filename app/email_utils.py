@@ -1,6 +1,52 @@
+import logging
 import smtplib
+import threading
+import time
+from collections import deque
 from email.mime.text import MIMEText
-from app.config import SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD, EMAIL_FROM
+from app.background import PeriodicTask
+from app.circuit_breaker import CircuitOpen, get_breaker
+from app.config import (
+    SMTP_SERVER,
+    SMTP_PORT,
+    SMTP_USERNAME,
+    SMTP_PASSWORD,
+    EMAIL_FROM,
+    SMTP_TIMEOUT_SECONDS,
+    CIRCUIT_SLOW_SMTP_SECONDS,
+    EMAIL_RETRY_INTERVAL_SECONDS,
+    EMAIL_RETRY_MAX_AGE_SECONDS,
+    EMAIL_QUEUE_SIZE,
+)
+from app.metrics import EMAILS_QUEUED, track_outbound
+
+logger = logging.getLogger(__name__)
+
+smtp_breaker = get_breaker("smtp", CIRCUIT_SLOW_SMTP_SECONDS)
+
+# Mails that could not be sent (SMTP down or its breaker open), oldest first,
+# as (queued_at, to_email, message). Retried by email_retry_task; a reset code
+# is useless after a while, so old entries are dropped instead of sent.
+_retry_queue = deque()
+_retry_lock = threading.Lock()
+
+
+def _deliver(to_email: str, msg: MIMEText):
+    with smtp_breaker.guard(), track_outbound("smtp", "send_mail"), \
+            smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT_SECONDS) as server:
+        server.starttls()
+        server.login(SMTP_USERNAME, SMTP_PASSWORD)
+        server.sendmail(EMAIL_FROM, [to_email], msg.as_string())
+
+
+def _queue_for_retry(to_email: str, msg: MIMEText):
+    with _retry_lock:
+        if len(_retry_queue) >= EMAIL_QUEUE_SIZE:
+            _retry_queue.popleft()
+            EMAILS_QUEUED.labels("dropped_full").inc()
+        _retry_queue.append((time.monotonic(), to_email, msg))
+    EMAILS_QUEUED.labels("queued").inc()
+
 
 def send_forgot_password_code(to_email: str, code: str):
     subject = "Your Password Reset Code"
@@ -12,9 +58,38 @@ def send_forgot_password_code(to_email: str, code: str):
     msg['To'] = to_email
 
     try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USERNAME, SMTP_PASSWORD)
-            server.sendmail(EMAIL_FROM, [to_email], msg.as_string())
+        _deliver(to_email, msg)
+    except CircuitOpen:
+        _queue_for_retry(to_email, msg)
     except Exception as e:
-        print(f"Failed to send email: {e}")
+        logger.error("Failed to send email, queued for retry: %r", e)
+        _queue_for_retry(to_email, msg)
+
+
+def retry_queued_emails():
+    """Send queued mails oldest first; stops at the first failure so the rest wait for the next run."""
+    while True:
+        with _retry_lock:
+            if not _retry_queue:
+                return
+            queued_at, to_email, msg = _retry_queue.popleft()
+        if time.monotonic() - queued_at > EMAIL_RETRY_MAX_AGE_SECONDS:
+            EMAILS_QUEUED.labels("expired").inc()
+            continue
+        try:
+            _deliver(to_email, msg)
+        except Exception as e:
+            with _retry_lock:
+                _retry_queue.appendleft((queued_at, to_email, msg))
+            if not isinstance(e, CircuitOpen):
+                logger.warning("Email retry failed: %r", e)
+            return
+        EMAILS_QUEUED.labels("sent").inc()
+
+
+email_retry_task = PeriodicTask(
+    "email-retry",
+    EMAIL_RETRY_INTERVAL_SECONDS,
+    retry_queued_emails,
+    run_immediately=False,
+)
@@ -0,0 +1,113 @@
+# app/http_clients.py
+#
+# Shared outbound HTTP connection pools.
+#
+# Stripe, Tavily and the OAuth providers all send their requests through the
+# two transports below (one for threadpool code, one for the event loop).
+# They live as long as the worker, so connections to an API are kept alive
+# and reused instead of paying for TCP + TLS on every call. HTTP/2 is used
+# where the server offers it. Each host gets its own pool, so one slow API
+# can't take every connection.
+#
+# SDKs that build and close a client per call (Authlib does) may be handed
+# the transport itself: closing a client does not close the shared pools,
+# only close_http_clients() at shutdown does.
+
+import threading
+
+try:
+    # Authlib prefers httpx2 when it is installed, and the transports of the
+    # two libraries don't mix; both have the same API
+    import httpx2 as httpx
+except ImportError:
+    import httpx
+
+from app.config import (
+    HTTP2_ENABLED,
+    HTTP_CONNECT_TIMEOUT_SECONDS,
+    HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    HTTP_MAX_CONNECTIONS_PER_HOST,
+    HTTP_MAX_KEEPALIVE_PER_HOST,
+    HTTP_POOL_TIMEOUT_SECONDS,
+    HTTP_TIMEOUT_SECONDS,
+)
+
+LIMITS = httpx.Limits(
+    max_connections=HTTP_MAX_CONNECTIONS_PER_HOST,
+    max_keepalive_connections=HTTP_MAX_KEEPALIVE_PER_HOST,
+    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+)
+TIMEOUT = httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS, pool=HTTP_POOL_TIMEOUT_SECONDS)
+
+
+def _origin(url: httpx.URL) -> tuple:
+    return url.scheme, url.host, url.port
+
+
+class SharedTransport(httpx.BaseTransport):
+    """One keep-alive pool per origin, for blocking callers."""
+
+    def __init__(self):
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, url: httpx.URL) -> httpx.HTTPTransport:
+        origin = _origin(url)
+        pool = self._pools.get(origin)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(origin)
+                if pool is None:
+                    pool = self._pools[origin] = httpx.HTTPTransport(http2=HTTP2_ENABLED, limits=LIMITS)
+        return pool
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        return self._pool(request.url).handle_request(request)
+
+    def close(self):
+        pass  # shared; see close_http_clients()
+
+    def shutdown(self):
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            pool.close()
+
+
+class SharedAsyncTransport(httpx.AsyncBaseTransport):
+    """One keep-alive pool per origin, for the event loop."""
+
+    def __init__(self):
+        self._pools = {}
+
+    def _pool(self, url: httpx.URL) -> httpx.AsyncHTTPTransport:
+        # Only touched from the event loop thread, so no lock
+        origin = _origin(url)
+        pool = self._pools.get(origin)
+        if pool is None:
+            pool = self._pools[origin] = httpx.AsyncHTTPTransport(http2=HTTP2_ENABLED, limits=LIMITS)
+        return pool
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._pool(request.url).handle_async_request(request)
+
+    async def aclose(self):
+        pass  # shared; see close_http_clients()
+
+    async def shutdown(self):
+        pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            await pool.aclose()
+
+
+sync_transport = SharedTransport()
+async_transport = SharedAsyncTransport()
+
+# Ready-made client on the shared pools for blocking callers
+http_client = httpx.Client(transport=sync_transport, timeout=TIMEOUT)
+
+
+async def close_http_clients():
+    """Close every pooled connection; the pools reopen on next use."""
+    sync_transport.shutdown()
+    await async_transport.shutdown()
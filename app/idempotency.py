@@ -0,0 +1,264 @@
+# app/idempotency.py
+#
+# Idempotency-Key support for POST endpoints that create things or cost
+# money (message sends, plan creation, Stripe checkout).
+#
+# The first request with a key claims a row in backend.idempotency_keys
+# (INSERT ... ON CONFLICT DO NOTHING) and commits it before doing any work.
+# When the handler finishes, its status code and JSON body are stored on the
+# row; a retry with the same key gets that stored response back without
+# running the handler again, so a retried send never costs a second LLM call.
+# A duplicate that arrives while the original is still running waits a
+# moment (IDEMPOTENCY_WAIT_SECONDS) for it to finish instead of starting its
+# own; if it is still running the duplicate gets 409 with Retry-After rather
+# than holding a threadpool thread for the length of an LLM call.
+#
+# Server-side failures (5xx, 429) are not stored: the row is deleted so the
+# client can retry with the same key. Rows expire after IDEMPOTENCY_TTL_HOURS.
+
+import hashlib
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.background import PeriodicTask
+from app.config import (
+    IDEMPOTENCY_LOCK_TIMEOUT_SECONDS,
+    IDEMPOTENCY_RETRY_AFTER_SECONDS,
+    IDEMPOTENCY_TTL_HOURS,
+    IDEMPOTENCY_WAIT_SECONDS,
+)
+from app.database import SessionLocal
+from app.metrics import IDEMPOTENT_REQUESTS
+from app.models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+# Response headers worth replaying (e.g. Location of a queued AI job)
+STORED_HEADERS = ("location", "retry-after")
+
+_POLL_START = 0.05
+_POLL_MAX = 0.5
+
+_table = IdempotencyKey.__table__
+
+
+def request_fingerprint(payload) -> str:
+    """Stable hash of the request parameters a key is bound to."""
+    raw = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _is_retryable(status_code: int) -> bool:
+    # Outcomes the client is expected to retry are not pinned to the key
+    return status_code >= 500 or status_code in (status.HTTP_409_CONFLICT, status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+# --------------------
+# Claiming and completing keys
+# --------------------
+def _claim(db: Session, user_id, key: str, endpoint: str, request_hash: str) -> bool:
+    now = datetime.utcnow()
+    claimed = db.execute(
+        insert(_table)
+        .values(
+            user_id=user_id,
+            key=key,
+            endpoint=endpoint,
+            request_hash=request_hash,
+            status="in_progress",
+            created_at=now,
+            locked_at=now,
+        )
+        .on_conflict_do_nothing()
+        .returning(_table.c.key)
+    ).first()
+    db.commit()
+    return claimed is not None
+
+
+def _take_over(db: Session, user_id, key: str, condition) -> bool:
+    """Re-claim an expired or abandoned row in place (compare-and-set)."""
+    now = datetime.utcnow()
+    taken = db.execute(
+        update(_table)
+        .where(_table.c.user_id == user_id, _table.c.key == key, condition)
+        .values(status="in_progress", created_at=now, locked_at=now, completed_at=None,
+                response_status=None, response_body=None, response_headers=None)
+        .returning(_table.c.key)
+    ).first()
+    db.commit()
+    return taken is not None
+
+
+def _complete(db: Session, user_id, key: str, status_code: int, body, headers: Optional[dict] = None):
+    db.execute(
+        update(_table)
+        .where(_table.c.user_id == user_id, _table.c.key == key)
+        .values(
+            status="completed",
+            response_status=status_code,
+            response_body=body,
+            response_headers=headers or None,
+            completed_at=datetime.utcnow(),
+        )
+    )
+    db.commit()
+
+
+def _forget(db: Session, user_id, key: str):
+    db.rollback()
+    db.execute(delete(_table).where(_table.c.user_id == user_id, _table.c.key == key))
+    db.commit()
+
+
+def _load(db: Session, user_id, key: str):
+    row = db.execute(select(_table).where(_table.c.user_id == user_id, _table.c.key == key)).first()
+    # End the read transaction so waiting does not pin a pooled connection
+    db.commit()
+    return row
+
+
+def _replay(row) -> JSONResponse:
+    headers = dict(row.response_headers or {})
+    headers[REPLAYED_HEADER] = "true"
+    return JSONResponse(status_code=row.response_status, content=row.response_body, headers=headers)
+
+
+def _wait_for_original(db: Session, user_id, key: str):
+    """Poll until the in-flight original finishes (or vanishes). Returns the last row seen."""
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    delay = _POLL_START
+    row = _load(db, user_id, key)
+    while row is not None and row.status == "in_progress" and time.monotonic() < deadline:
+        time.sleep(delay)
+        delay = min(delay * 2, _POLL_MAX)
+        row = _load(db, user_id, key)
+    return row
+
+
+# --------------------
+# Running a handler under a key
+# --------------------
+def _serialize(result, response_model, success_status: int):
+    if isinstance(result, JSONResponse):
+        headers = {k: v for k, v in result.headers.items() if k in STORED_HEADERS}
+        return result.status_code, json.loads(result.body), headers
+    if response_model is not None:
+        result = response_model.model_validate(result)
+    return success_status, jsonable_encoder(result), None
+
+
+def run_idempotent(
+    db: Session,
+    user_id,
+    key: Optional[str],
+    endpoint: str,
+    fingerprint: str,
+    handler: Callable[[], object],
+    success_status: int = status.HTTP_200_OK,
+    response_model=None,
+):
+    """Run handler() at most once per (user, key) and replay its response to retries.
+
+    Without a key the handler simply runs. The handler's return value is
+    returned unchanged on the first call; retries get a JSONResponse built
+    from what was stored.
+    """
+    if not key:
+        return handler()
+
+    while True:
+        if _claim(db, user_id, key, endpoint, fingerprint):
+            break
+
+        row = _load(db, user_id, key)
+        if row is None:
+            continue  # deleted between our insert and read; claim again
+
+        now = datetime.utcnow()
+        if now - row.created_at > timedelta(hours=IDEMPOTENCY_TTL_HOURS):
+            # Expired but not yet purged: treat as a fresh key
+            if _take_over(db, user_id, key, _table.c.created_at == row.created_at):
+                break
+            continue
+
+        if row.endpoint != endpoint or row.request_hash != fingerprint:
+            IDEMPOTENT_REQUESTS.labels(endpoint, "mismatch").inc()
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used with a different request",
+            )
+
+        if row.status == "in_progress":
+            if now - row.locked_at > timedelta(seconds=IDEMPOTENCY_LOCK_TIMEOUT_SECONDS):
+                # The original worker died mid-request; run it ourselves
+                if _take_over(db, user_id, key, (_table.c.status == "in_progress") & (_table.c.locked_at == row.locked_at)):
+                    logger.warning("took over abandoned idempotent request %s key=%s", endpoint, key)
+                    break
+                continue
+            IDEMPOTENT_REQUESTS.labels(endpoint, "waited").inc()
+            row = _wait_for_original(db, user_id, key)
+            if row is None:
+                continue  # the original failed and released the key
+            if row.status == "in_progress":
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="A request with this Idempotency-Key is still being processed",
+                    headers={"Retry-After": str(IDEMPOTENCY_RETRY_AFTER_SECONDS)},
+                )
+
+        IDEMPOTENT_REQUESTS.labels(endpoint, "replayed").inc()
+        return _replay(row)
+
+    try:
+        result = handler()
+    except HTTPException as e:
+        if _is_retryable(e.status_code):
+            _forget(db, user_id, key)
+        else:
+            db.rollback()
+            _complete(db, user_id, key, e.status_code, {"detail": jsonable_encoder(e.detail)}, e.headers)
+        IDEMPOTENT_REQUESTS.labels(endpoint, "failed").inc()
+        raise
+    except Exception:
+        _forget(db, user_id, key)
+        IDEMPOTENT_REQUESTS.labels(endpoint, "failed").inc()
+        raise
+
+    status_code, body, headers = _serialize(result, response_model, success_status)
+    if _is_retryable(status_code):
+        _forget(db, user_id, key)
+    else:
+        _complete(db, user_id, key, status_code, body, headers)
+    IDEMPOTENT_REQUESTS.labels(endpoint, "executed").inc()
+    return result
+
+
+# --------------------
+# Cleanup
+# --------------------
+def purge_expired_keys(now=None) -> int:
+    cutoff = (now or datetime.utcnow()) - timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+    db = SessionLocal()
+    try:
+        deleted = db.execute(delete(_table).where(_table.c.created_at < cutoff)).rowcount
+        db.commit()
+    finally:
+        db.close()
+    if deleted:
+        logger.info("purged %d expired idempotency keys", deleted)
+    return deleted
+
+
+idempotency_purge_task = PeriodicTask("idempotency-purge", 3600, purge_expired_keys, run_immediately=False)
@@ -0,0 +1,120 @@
+# app/loop_monitor.py
+#
+# Event-loop stall detection.
+#
+# A heartbeat coroutine wakes up every few milliseconds and records how late
+# it was (loop lag). A watchdog thread checks the heartbeat; when the loop
+# has not come back for longer than the threshold it captures the loop
+# thread's current stack, so the log shows the exact blocking call, together
+# with the route of the request task that was running at the time.
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+import weakref
+
+from app.metrics import EVENT_LOOP_LAG, EVENT_LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+STACK_LIMIT = 25
+
+
+class LoopLagMonitor:
+    def __init__(self, threshold_ms: float):
+        self.threshold = threshold_ms / 1000.0
+        self.interval = max(0.005, min(0.05, self.threshold / 4))
+        self._beat = None
+        self._loop = None
+        self._loop_thread_id = None
+        self._heartbeat = None
+        self._watchdog = None
+        self._stopping = threading.Event()
+        self._task_routes = weakref.WeakKeyDictionary()  # asyncio.Task -> "GET /api/..."
+
+    # ---------- request tracking ----------
+    def track(self, route: str):
+        task = asyncio.current_task()
+        if task is not None:
+            self._task_routes[task] = route
+
+    def _current_route(self):
+        # Read from the watchdog thread while the loop is stuck, so the
+        # running task cannot change underneath us.
+        task = asyncio.tasks._current_tasks.get(self._loop)
+        if task is None:
+            return "background"
+        return self._task_routes.get(task, "background")
+
+    # ---------- lifecycle ----------
+    async def start(self):
+        if self._heartbeat is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopping.clear()
+        self._heartbeat = asyncio.create_task(self._run_heartbeat())
+        self._watchdog = threading.Thread(target=self._run_watchdog, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopping.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            await asyncio.gather(self._heartbeat, return_exceptions=True)
+            self._heartbeat = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    async def _run_heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+            lag = max(0.0, now - expected)
+            EVENT_LOOP_LAG.observe(lag)
+            if lag > self.threshold:
+                logger.warning("event loop blocked for %.0fms", lag * 1000)
+
+    def _run_watchdog(self):
+        reported_beat = None
+        while not self._stopping.wait(self.interval):
+            beat = self._beat
+            stalled_for = time.monotonic() - beat - self.interval
+            if stalled_for > self.threshold and beat != reported_beat:
+                reported_beat = beat  # one report per stall
+                self._report(stalled_for)
+
+    def _report(self, stalled_for: float):
+        route = self._current_route()
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame, limit=STACK_LIMIT)) if frame else "<unavailable>\n"
+        EVENT_LOOP_STALLS.labels(route).inc()
+        logger.warning(
+            "event loop stalled for >%.0fms in %s; loop thread stack (most recent call last):\n%s",
+            stalled_for * 1000,
+            route,
+            stack,
+        )
+
+
+class LoopMonitorMiddleware:
+    """Tags each request task with its route so stalls can be attributed."""
+
+    def __init__(self, app, route_table, monitor: LoopLagMonitor):
+        self.app = app
+        self.route_table = route_table
+        self.monitor = monitor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            self.monitor.track(f'{scope["method"]} {self.route_table.resolve(scope["method"], scope["path"])}')
+        elif scope["type"] == "websocket":
+            self.monitor.track(f'WS {self.route_table.resolve("WS", scope["path"])}')
+        await self.app(scope, receive, send)
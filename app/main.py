@@ -1,89 +1,294 @@
 # app/main.py
 
-from fastapi import FastAPI
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.routing import APIRoute
 from starlette.middleware.sessions import SessionMiddleware
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.openapi.utils import get_openapi  # ✅ Import this for custom OpenAPI
+from sqlalchemy import text
 
-from app.routers import auth_routes, oauth_routes, users, payments, plans, classes, chats
+from app.routers import auth_routes, oauth_routes, users, payments, plans, classes, chats, search, export
 from app.database import engine, Base
-from app.config import SECRET_KEY
-
-app = FastAPI(
-    title="Gameapp",
-    openapi_tags=[
-        {"name": "Authentication", "description": "Auth related endpoints"},
-        {"name": "OAuth Login", "description": "OAuth login endpoints"},
-        {"name": "User", "description": "User profile and management"},
-        {"name": "Payment", "description": "Subscription and payments"},
-    ],
-    openapi_url="/openapi.json",
-    docs_url="/docs",
-    redoc_url="/redoc",
-)
+from app.migrations import run_migrations
+from app.config import Settings
+from app.metrics import PrometheusMiddleware, RouteTable, instrument_engine, render_metrics
+from app.logging_setup import RequestIdMiddleware, configure_logging, shutdown_logging
+from app.sql_profiler import SQLProfilerMiddleware, install_profiler
+from app.sports_data import sports_store
+from app.loop_monitor import LoopLagMonitor, LoopMonitorMiddleware
+from app.rate_limit import ai_admission, bucket_purge_task
+from app.archive import message_maintenance_task
+from app.idempotency import idempotency_purge_task
+from app.recurrence import class_occurrence_task
+from app.email_utils import email_retry_task
+from app.circuit_breaker import breaker_states
+from app.http_clients import close_http_clients
+from app.realtime import broadcaster
+from app.ai.agent import model_pool
+from app.ai.jobs import job_pool
+
+logger = logging.getLogger(__name__)
 
 # OAuth2 scheme for Swagger UI Authorization button
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
-# ✅ Fixed custom OpenAPI schema
-def custom_openapi():
-    if app.openapi_schema:
-        return app.openapi_schema
-    openapi_schema = get_openapi(
-        title=app.title,
-        version="1.0.0",
-        description="Your Gameapp API",
-        routes=app.routes,
+# Include API routers
+api_routers = [
+    (auth_routes.router, "/api/auth", ["Authentication"]),
+    (oauth_routes.router, "/api/oauth", ["OAuth Login"]),
+    (users.router, "/api/user", ["User"]),
+    (payments.router, "/api/payment", ["Payment"]),
+    (plans.router, "/api/plans", ["Plans"]),
+    (classes.router, "/api/classes", ["Classes"]),
+    (chats.router, "/api/chats", ["Chats"]),
+    (search.router, "/api/search", ["Search"]),
+    (export.router, "/api/export", ["Export"]),
+]
+
+
+# -------------------------------
+# Startup / shutdown
+# -------------------------------
+def _prepare_database():
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+
+def _warm_db_connections(count: int):
+    # Open the connections up front so the first requests after a deploy
+    # don't pay for TCP + auth; closing returns them to the pool.
+    count = min(count, engine.pool.size()) if hasattr(engine.pool, "size") else count
+    connections = []
+    try:
+        for _ in range(count):
+            conn = engine.connect()
+            connections.append(conn)
+            conn.execute(text("SELECT 1"))
+    finally:
+        for conn in connections:
+            conn.close()
+    return len(connections)
+
+
+async def _warm_oauth_metadata(timeout: float):
+    # Google's OpenID discovery document is otherwise fetched on the first login
+    for client in (oauth_routes.oauth.google,):
+        try:
+            await asyncio.wait_for(client.load_server_metadata(), timeout=timeout)
+        except Exception as e:
+            logger.warning("OAuth metadata warm-up failed for %s: %r", client.name, e)
+
+
+def _drain_ai_work(timeout: float):
+    deadline = time.monotonic() + timeout
+    requests_done = ai_admission.drain(timeout)
+    jobs_done = job_pool.drain(max(0.0, deadline - time.monotonic()))
+    if not (requests_done and jobs_done):
+        logger.warning(
+            "Shutdown drain timed out after %.0fs (active AI requests=%d, jobs done=%s)",
+            timeout, ai_admission.active, jobs_done,
+        )
+    job_pool.shutdown(wait=False)
+
+
+def _stop_background_threads():
+    sports_store.stop()
+    bucket_purge_task.stop()
+    message_maintenance_task.stop()
+    idempotency_purge_task.stop()
+    class_occurrence_task.stop()
+    email_retry_task.stop()
+    broadcaster.stop()
+
+
+def _make_lifespan(settings: Settings, loop_monitor: LoopLagMonitor):
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        app.state.ready = False
+        app.state.draining = False
+        started = time.perf_counter()
+
+        await run_in_threadpool(_prepare_database)
+        warmed = await run_in_threadpool(_warm_db_connections, settings.db_warm_connections)
+        await _warm_oauth_metadata(settings.warmup_timeout_seconds)
+        job_pool.start()
+        if settings.loop_monitor_enabled:
+            await loop_monitor.start()
+        if settings.background_tasks_enabled:
+            sports_store.start()
+            bucket_purge_task.start()
+            message_maintenance_task.start()
+            idempotency_purge_task.start()
+            class_occurrence_task.start()
+            email_retry_task.start()
+
+        app.state.ready = True
+        logger.info(
+            "startup complete in %.0fms (db connections warmed=%d, ai models=%s)",
+            (time.perf_counter() - started) * 1000,
+            warmed,
+            ",".join(e.name for e in model_pool.endpoints),
+        )
+        try:
+            yield
+        finally:
+            # Fail readiness first so the load balancer stops sending traffic,
+            # then let in-flight AI requests and queued jobs finish.
+            app.state.ready = False
+            app.state.draining = True
+            await run_in_threadpool(_drain_ai_work, settings.shutdown_drain_seconds)
+            await run_in_threadpool(_stop_background_threads)
+            await loop_monitor.stop()
+            await close_http_clients()
+            engine.dispose()
+            shutdown_logging()
+
+    return lifespan
+
+
+def _ping_db():
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+# -------------------------------
+# App factory
+# -------------------------------
+def create_app(settings: Settings = None) -> FastAPI:
+    settings = settings or Settings()
+    configure_logging()
+    loop_monitor = LoopLagMonitor(settings.loop_lag_threshold_ms)
+
+    app = FastAPI(
+        title="Gameapp",
+        openapi_tags=[
+            {"name": "Authentication", "description": "Auth related endpoints"},
+            {"name": "OAuth Login", "description": "OAuth login endpoints"},
+            {"name": "User", "description": "User profile and management"},
+            {"name": "Payment", "description": "Subscription and payments"},
+        ],
+        openapi_url="/openapi.json",
+        docs_url="/docs",
+        redoc_url="/redoc",
+        lifespan=_make_lifespan(settings, loop_monitor),
     )
-    openapi_schema["components"]["securitySchemes"] = {
-        "BearerAuth": {
-            "type": "http",
-            "scheme": "bearer",
-            "bearerFormat": "JWT",
+    app.state.settings = settings
+    app.state.ready = False
+    app.state.draining = False
+
+    # ✅ Fixed custom OpenAPI schema
+    def custom_openapi():
+        if app.openapi_schema:
+            return app.openapi_schema
+        openapi_schema = get_openapi(
+            title=app.title,
+            version="1.0.0",
+            description="Your Gameapp API",
+            routes=app.routes,
+        )
+        openapi_schema["components"]["securitySchemes"] = {
+            "BearerAuth": {
+                "type": "http",
+                "scheme": "bearer",
+                "bearerFormat": "JWT",
+            }
         }
-    }
-    openapi_schema["security"] = [{"BearerAuth": []}]
-    app.openapi_schema = openapi_schema
-    return app.openapi_schema
-
-# ✅ Assign the custom OpenAPI generator
-app.openapi = custom_openapi
-
-# CORS configuration
-origins = [
-    "http://localhost:3000",
-    "http://127.0.0.1:3000",
-    "https://e22bbebece93.ngrok-free.app",
-    "https://ppp7rljm-8000.inc1.devtunnels.ms/",
-    "http://localhost:8000",
-    "https://gameplan-demo.vercel.app",
-]
+        openapi_schema["security"] = [{"BearerAuth": []}]
+        app.openapi_schema = openapi_schema
+        return app.openapi_schema
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    # ✅ Assign the custom OpenAPI generator
+    app.openapi = custom_openapi
 
-# Session middleware for OAuth
-app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY)
+    # CORS configuration
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=list(settings.cors_origins),
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
 
-# Create DB tables on startup
-Base.metadata.create_all(bind=engine)
+    # Session middleware for OAuth
+    app.add_middleware(SessionMiddleware, secret_key=settings.secret_key)
 
-# Include API routers
-app.include_router(auth_routes.router, prefix="/api/auth", tags=["Authentication"])
-app.include_router(oauth_routes.router, prefix="/api/oauth", tags=["OAuth Login"])
-app.include_router(users.router, prefix="/api/user", tags=["User"])
-app.include_router(payments.router, prefix="/api/payment", tags=["Payment"])
-app.include_router(plans.router, prefix="/api/plans", tags=["Plans"])
-app.include_router(classes.router, prefix="/api/classes", tags=["Classes"])
-app.include_router(chats.router, prefix="/api/chats", tags=["Chats"])
-
-# Root endpoint
-@app.get("/")
-async def root():
-    return {"message": "Welcome to Gameapp API"}
+    route_table = RouteTable()
+    app.state.route_table = route_table
+
+    # Opt-in SQL profiler (query counts, DB time, N+1 detection)
+    if settings.sql_profiler_enabled:
+        install_profiler(engine)
+        app.add_middleware(
+            SQLProfilerMiddleware,
+            route_table=route_table,
+            repeat_threshold=settings.sql_profiler_repeat_threshold,
+        )
+
+    # Event-loop stall watchdog (logs the blocking route and stack)
+    if settings.loop_monitor_enabled:
+        app.add_middleware(LoopMonitorMiddleware, route_table=route_table, monitor=loop_monitor)
+
+    # Prometheus metrics: wraps the rest of the stack so it times all of it
+    if settings.metrics_enabled:
+        instrument_engine(engine)
+        app.add_middleware(PrometheusMiddleware, route_table=route_table)
+
+    # Request ids for log records: added last so it wraps every other middleware
+    app.add_middleware(RequestIdMiddleware)
+
+    for router, prefix, tags in api_routers:
+        app.include_router(router, prefix=prefix, tags=tags)
+        route_table.add(prefix, router.routes)
+
+    # Root endpoint
+    @app.get("/")
+    async def root():
+        return {"message": "Welcome to Gameapp API"}
+
+    # Liveness: the process is up and serving; no dependencies checked
+    @app.get("/health", include_in_schema=False)
+    async def health():
+        return {"status": "ok"}
+
+    # Readiness: startup warm-up finished, not draining, and the DB answers
+    @app.get("/ready", include_in_schema=False)
+    async def ready(response: Response):
+        if app.state.draining:
+            response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+            return {"status": "draining"}
+        if not app.state.ready:
+            response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+            return {"status": "starting"}
+        try:
+            await run_in_threadpool(_ping_db)
+        except Exception:
+            response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+            return {"status": "database_unavailable"}
+        return {"status": "ready"}
+
+    # Circuit breaker states of this worker (also exported as circuit_breaker_state)
+    @app.get("/health/circuits", include_in_schema=False)
+    async def circuits():
+        return breaker_states()
+
+    # Prometheus scrape endpoint
+    if settings.metrics_enabled:
+        @app.get("/metrics", include_in_schema=False)
+        def metrics():
+            body, content_type = render_metrics()
+            return Response(content=body, media_type=content_type)
+
+    # App-level routes (root, health, metrics) for the metric route labels
+    route_table.add("", [route for route in app.router.routes if isinstance(route, APIRoute)])
+
+    return app
+
+
+app = create_app()
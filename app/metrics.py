@@ -0,0 +1,292 @@
+# app/metrics.py
+
+import os
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    REGISTRY,
+)
+from sqlalchemy import event
+from starlette.routing import WebSocketRoute, compile_path
+
+# Latency buckets (seconds) shared by HTTP and outbound calls; LLM calls get
+# a wider range since a full agent run can take tens of seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+AI_LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+# --------------------
+# HTTP
+# --------------------
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being served",
+    ["method", "route"],
+    multiprocess_mode="livesum",
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "http_request_db_queries",
+    "SQL statements executed while serving one HTTP request",
+    ["route"],
+    buckets=QUERY_COUNT_BUCKETS,
+)
+
+# --------------------
+# Event loop
+# --------------------
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event-loop heartbeat woke up",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+EVENT_LOOP_STALLS = Counter(
+    "event_loop_stalls_total",
+    "Event-loop stalls over the threshold, by the route that was running",
+    ["route"],
+)
+
+# --------------------
+# Database pool
+# --------------------
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections",
+    "Connections currently checked out of the SQLAlchemy pool",
+    multiprocess_mode="livesum",
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow_connections",
+    "Connections open beyond pool_size (negative while the pool is not full)",
+    multiprocess_mode="livesum",
+)
+DB_POOL_CHECKOUTS = Counter("db_pool_checkouts_total", "Connection checkouts from the pool")
+DB_POOL_CONNECTS = Counter("db_pool_connects_total", "New DBAPI connections opened by the pool")
+
+LOG_RECORDS_DROPPED = Counter("log_records_dropped_total", "Log records dropped because the log queue was full")
+
+# --------------------
+# AI agent
+# --------------------
+AI_RESPONSE_DURATION = Histogram(
+    "ai_response_duration_seconds",
+    "Wall time of generate_ai_response",
+    ["route", "outcome"],
+    buckets=AI_LATENCY_BUCKETS,
+)
+AI_RETRIES = Counter("ai_retries_total", "Extra agent invocations (failover or hedge)", ["reason"])
+AI_ROUTE_DECISIONS = Counter(
+    "ai_route_decisions_total",
+    "Prompts sent to the direct fast path vs the tool-calling agent",
+    ["route", "reason"],
+)
+AI_MODEL_REQUESTS = Counter("ai_model_requests_total", "Agent invocations per model", ["model", "outcome"])
+AI_MODEL_HEALTH = Gauge(
+    "ai_model_health_score",
+    "Model health used for routing (1 healthy, 0 failing or cooling down)",
+    ["model"],
+    multiprocess_mode="max",
+)
+AI_CONTEXT_MESSAGES = Histogram(
+    "ai_context_messages",
+    "History messages added to a prompt (recent window or retrieved)",
+    ["source"],
+    buckets=(0, 1, 2, 4, 6, 8, 12, 16),
+)
+AI_TOKENS = Counter("ai_tokens_total", "LLM tokens reported by the provider", ["kind"])
+AI_TOOL_CALLS = Counter("ai_tool_calls_total", "Tool calls made by the agent", ["tool"])
+AI_TOOL_DURATION = Histogram(
+    "ai_tool_duration_seconds",
+    "Duration of agent tool calls",
+    ["tool"],
+    buckets=LATENCY_BUCKETS,
+)
+
+# --------------------
+# Local sports-data store
+# --------------------
+SPORTS_DATA_LOOKUPS = Counter(
+    "sports_data_lookups_total",
+    "sports-data tool lookups (hit, miss or stale fall back to web search)",
+    ["outcome"],
+)
+SPORTS_DATA_REFRESHES = Counter("sports_data_refreshes_total", "Background sports-data refreshes", ["outcome"])
+SPORTS_DATA_LOADED_AT = Gauge(
+    "sports_data_loaded_timestamp_seconds",
+    "Unix time the in-memory sports index was last rebuilt",
+    multiprocess_mode="max",
+)
+
+# --------------------
+# Rate limiting and admission control
+# --------------------
+RATE_LIMITED = Counter("rate_limited_total", "Requests rejected by a rate limit", ["endpoint", "scope"])
+AI_ADMISSION_WAITING = Gauge(
+    "ai_admission_waiting",
+    "Requests queued for an AI generation slot",
+    multiprocess_mode="livesum",
+)
+AI_ADMISSION_REJECTED = Counter("ai_admission_rejected_total", "AI requests shed because the queue was full")
+
+IDEMPOTENT_REQUESTS = Counter(
+    "idempotent_requests_total",
+    "Requests carrying an Idempotency-Key, by what happened to them",
+    ["endpoint", "outcome"],
+)
+
+# --------------------
+# Outbound calls (Stripe, SMTP, OAuth providers)
+# --------------------
+OUTBOUND_DURATION = Histogram(
+    "outbound_call_duration_seconds",
+    "Duration of calls to external services",
+    ["service", "operation", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+
+CIRCUIT_BREAKER_STATE = Gauge(
+    "circuit_breaker_state",
+    "Circuit breaker state per dependency (0 closed, 1 half-open, 2 open)",
+    ["name"],
+    multiprocess_mode="max",
+)
+CIRCUIT_BREAKER_TRANSITIONS = Counter(
+    "circuit_breaker_transitions_total", "Circuit breaker state changes", ["name", "state"]
+)
+CIRCUIT_BREAKER_REJECTED = Counter(
+    "circuit_breaker_rejected_total", "Calls failed fast because a circuit breaker was open", ["name"]
+)
+EMAILS_QUEUED = Counter("emails_queued_total", "Emails queued for retry, by what happened to them", ["outcome"])
+
+# Per-request statement counter; the middleware sets a fresh one-element list
+# so increments from threadpool workers land on the same object.
+_request_query_count: ContextVar = ContextVar("request_query_count", default=None)
+
+
+@contextmanager
+def track_outbound(service: str, operation: str):
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        OUTBOUND_DURATION.labels(service, operation, outcome).observe(time.perf_counter() - start)
+
+
+class RouteTable:
+    """Maps a request path back to its route template for metric labels."""
+
+    def __init__(self):
+        self._entries = []
+
+    def add(self, prefix: str, routes):
+        for route in routes:
+            if isinstance(route, WebSocketRoute):
+                methods = {"WS"}  # resolve("WS", path) for WebSocket scopes
+            elif hasattr(route, "methods"):
+                methods = route.methods
+            else:
+                continue
+            template = prefix + route.path
+            regex, _, _ = compile_path(template)
+            self._entries.append((regex, methods, template))
+
+    def resolve(self, method: str, path: str) -> str:
+        for regex, methods, template in self._entries:
+            if method in methods and regex.match(path):
+                return template
+        return "unmatched"
+
+
+class PrometheusMiddleware:
+    def __init__(self, app, route_table: RouteTable):
+        self.app = app
+        self.route_table = route_table
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self.route_table.resolve(method, scope["path"])
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        queries = [0]
+        token = _request_query_count.set(queries)
+        in_flight = HTTP_REQUESTS_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_DURATION.labels(method, route, str(status_code)).observe(time.perf_counter() - start)
+            DB_QUERIES_PER_REQUEST.labels(route).observe(queries[0])
+            in_flight.dec()
+            _request_query_count.reset(token)
+
+
+# Engines already carrying the listeners; create_app() may run more than once
+_instrumented_engines = weakref.WeakSet()
+
+
+def instrument_engine(engine):
+    if engine in _instrumented_engines:
+        return
+    _instrumented_engines.add(engine)
+    pool = engine.pool
+
+    @event.listens_for(pool, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        DB_POOL_CONNECTS.inc()
+
+    @event.listens_for(pool, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKOUTS.inc()
+        DB_POOL_CHECKED_OUT.inc()
+        if hasattr(pool, "overflow"):
+            DB_POOL_OVERFLOW.set(pool.overflow())
+
+    @event.listens_for(pool, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        DB_POOL_CHECKED_OUT.dec()
+        if hasattr(pool, "overflow"):
+            DB_POOL_OVERFLOW.set(pool.overflow())
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _on_execute(conn, cursor, statement, parameters, context, executemany):
+        queries = _request_query_count.get()
+        if queries is not None:
+            queries[0] += 1
+
+
+def render_metrics():
+    # With several uvicorn/gunicorn workers each process writes its samples to
+    # PROMETHEUS_MULTIPROC_DIR and the scrape aggregates them.
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
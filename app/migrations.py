@@ -0,0 +1,108 @@
+# app/migrations.py
+#
+# Idempotent schema changes applied at startup right after create_all.
+# create_all only creates missing tables, so columns and indexes added to
+# existing tables are listed here as well; every statement must be safe to
+# run again on an up-to-date database.
+
+from sqlalchemy import text
+
+from app.partitions import MAINTENANCE_LOCK_SQL, convert_messages_to_partitioned, ensure_message_partitions
+
+MIGRATIONS = [
+    # Full-text search over chat messages and plans
+    """
+    ALTER TABLE backend.messages ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', coalesce(message_text, ''))) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_messages_search_vector ON backend.messages USING gin (search_vector)",
+    """
+    ALTER TABLE backend.plans ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(description, '')), 'B')
+        ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_plans_search_vector ON backend.plans USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_user_chats_user_id ON backend.user_chats (user_id)",
+    # Chat history reads (per-partition once messages is partitioned)
+    "CREATE INDEX IF NOT EXISTS ix_messages_chat_id_timestamp ON backend.messages (chat_id, timestamp)",
+    # Calendar overlap queries: (user_id, period) in one GiST index. btree_gist
+    # provides the uuid operator class; where the extension is not installed
+    # on the server the index covers the period alone. The expression must
+    # match PLAN_PERIOD in app/routers/plans.py for the planner to use it.
+    """
+    DO $$
+    BEGIN
+        BEGIN
+            CREATE EXTENSION IF NOT EXISTS btree_gist;
+        EXCEPTION WHEN undefined_file OR feature_not_supported OR insufficient_privilege THEN
+            RAISE NOTICE 'btree_gist unavailable; indexing plan periods without user_id';
+        END;
+        IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'btree_gist') THEN
+            CREATE INDEX IF NOT EXISTS ix_plans_user_period ON backend.plans
+                USING gist (user_id, tsrange(start_date, greatest(start_date, end_date), '[]'))
+                WHERE start_date IS NOT NULL;
+        ELSE
+            CREATE INDEX IF NOT EXISTS ix_plans_period ON backend.plans
+                USING gist (tsrange(start_date, greatest(start_date, end_date), '[]'))
+                WHERE start_date IS NOT NULL;
+        END IF;
+    END
+    $$
+    """,
+    # Typed pin timestamp; pined_date strings that parse as timestamps are
+    # copied over (as UTC), anything else is left unpinned.
+    "ALTER TABLE backend.plans ADD COLUMN IF NOT EXISTS pinned_at timestamp",
+    r"""
+    DO $$
+    DECLARE
+        r record;
+    BEGIN
+        PERFORM set_config('TimeZone', 'UTC', true);
+        FOR r IN
+            SELECT id, pined_date FROM backend.plans
+            WHERE pinned_at IS NULL AND pined_date ~ '^\s*\d{4}-\d{2}-\d{2}'
+        LOOP
+            BEGIN
+                UPDATE backend.plans SET pinned_at = (r.pined_date::timestamptz AT TIME ZONE 'UTC') WHERE id = r.id;
+            EXCEPTION WHEN datetime_field_overflow OR invalid_datetime_format OR invalid_time_zone_displacement_value THEN
+                RAISE NOTICE 'plan %: unparseable pined_date %', r.id, r.pined_date;
+            END;
+        END LOOP;
+    END
+    $$
+    """,
+    # Pinned / saved lists: one index range scan per page
+    """
+    CREATE INDEX IF NOT EXISTS ix_plans_user_pinned ON backend.plans (user_id, pinned_at, id)
+        WHERE pinned_at IS NOT NULL
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_plans_user_saved ON backend.plans
+        (user_id, coalesce(created_at, '1970-01-01'::timestamp), id)
+        WHERE is_save
+    """,
+    # Structured class schedules (occurrences live in class_occurrences)
+    "ALTER TABLE backend.classes ADD COLUMN IF NOT EXISTS recurrence jsonb",
+    # Data export keyset order; created_at is nullable, hence the coalesce
+    """
+    CREATE INDEX IF NOT EXISTS ix_plans_user_export ON backend.plans
+        (user_id, coalesce(created_at, '1970-01-01'::timestamp), id)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_classes_user_export ON backend.classes
+        (user_id, coalesce(created_at, '1970-01-01'::timestamp), id)
+    """,
+]
+
+
+def run_migrations(engine):
+    with engine.begin() as conn:
+        conn.execute(MAINTENANCE_LOCK_SQL)
+        # Before the statement list, which would otherwise add indexes to the
+        # old table only to have them dropped again
+        convert_messages_to_partitioned(conn)
+        for statement in MIGRATIONS:
+            conn.execute(text(statement))
+        ensure_message_partitions(conn)
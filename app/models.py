@@ -1,9 +1,9 @@
-from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Text, UniqueConstraint
+from sqlalchemy import Column, Computed, Index, Integer, String, Boolean, DateTime, Float, ForeignKey, Text, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from datetime import datetime, timedelta
 import uuid
-from sqlalchemy.dialects.postgresql import JSONB, ARRAY
+from sqlalchemy.dialects.postgresql import JSONB, ARRAY, TSVECTOR
 from app.database import Base
 
 class User(Base):
@@ -64,7 +64,10 @@ class UserSession(Base):
 
 class Plan(Base):
     __tablename__ = "plans"
-    __table_args__ = {"schema": "backend"}
+    __table_args__ = (
+        Index("ix_plans_search_vector", "search_vector", postgresql_using="gin"),
+        {"schema": "backend"},
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     user_id = Column(UUID(as_uuid=True), ForeignKey("backend.users.id"), nullable=False)
@@ -76,11 +79,22 @@ class Plan(Base):
     # ✅ New fields
     conversation = Column(JSONB, default=[])  # Array of JSON objects
     is_save = Column(Boolean, default=False, nullable=False)
-    pined_date = Column(String, nullable=True)
+    pined_date = Column(String, nullable=True)  # legacy string form of pinned_at, kept for old clients
+    pinned_at = Column(DateTime, nullable=True)
 
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Full-text search document, maintained by Postgres on every write
+    search_vector = Column(
+        TSVECTOR,
+        Computed(
+            "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(description, '')), 'B')",
+            persisted=True,
+        ),
+    )
+
     user = relationship("User", back_populates="plans")
 
 class Class(Base):
@@ -92,6 +106,7 @@ class Class(Base):
     title = Column(String(255), nullable=False)
     description = Column(Text, nullable=True)
     schedule_info = Column(Text, nullable=True)
+    recurrence = Column(JSONB, nullable=True)  # schemas.ClassRecurrence; expanded into class_occurrences
 
     # ✅ New field
     plan_ids = Column(ARRAY(String), default=[])
@@ -101,6 +116,19 @@ class Class(Base):
 
     user = relationship("User", back_populates="classes")
 
+class ClassOccurrence(Base):
+    """One materialized occurrence of a recurring class (see app/recurrence.py)."""
+    __tablename__ = "class_occurrences"
+    __table_args__ = (
+        Index("ix_class_occurrences_user_starts_at", "user_id", "starts_at"),
+        {"schema": "backend"},
+    )
+
+    class_id = Column(UUID(as_uuid=True), ForeignKey("backend.classes.id", ondelete="CASCADE"), primary_key=True)
+    starts_at = Column(DateTime, primary_key=True)
+    ends_at = Column(DateTime, nullable=False)
+    user_id = Column(UUID(as_uuid=True), nullable=False)
+
 class Chat(Base):
     __tablename__ = "chats"
     __table_args__ = {"schema": "backend"}
@@ -116,6 +144,7 @@ class UserChat(Base):
     __tablename__ = "user_chats"
     __table_args__ = (
         UniqueConstraint("user_id", "chat_id", name="uix_user_chat"),
+        Index("ix_user_chats_user_id", "user_id"),
         {"schema": "backend"},
     )
 
@@ -126,17 +155,145 @@ class UserChat(Base):
     user = relationship("User", back_populates="user_chats")
     chat = relationship("Chat", back_populates="user_chats")
 
+# Range-partitioned by month on timestamp (see app/partitions.py), so the
+# partition key is part of the primary key.
 class Message(Base):
     __tablename__ = "messages"
-    __table_args__ = {"schema": "backend"}
+    __table_args__ = (
+        Index("ix_messages_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_messages_chat_id_timestamp", "chat_id", "timestamp"),
+        {"schema": "backend", "postgresql_partition_by": "RANGE (timestamp)"},
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     chat_id = Column(UUID(as_uuid=True), ForeignKey("backend.chats.id"), nullable=False)
     sender_id = Column(UUID(as_uuid=True), ForeignKey("backend.users.id"), nullable=False)
     receiver_id = Column(UUID(as_uuid=True), ForeignKey("backend.users.id"), nullable=False)  # NEW FIELD
     message_text = Column(Text, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, primary_key=True, nullable=False, default=datetime.utcnow)
+
+    # Full-text search document, maintained by Postgres on every write
+    search_vector = Column(
+        TSVECTOR,
+        Computed("to_tsvector('english', coalesce(message_text, ''))", persisted=True),
+    )
 
     chat = relationship("Chat", back_populates="messages")
     sender = relationship("User", back_populates="sent_messages", foreign_keys=[sender_id])
     receiver = relationship("User", back_populates="received_messages", foreign_keys=[receiver_id])
+
+class RateLimitBucket(Base):
+    __tablename__ = "rate_limit_buckets"
+    __table_args__ = {"schema": "backend"}
+
+    key = Column(String(255), primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+class AIJob(Base):
+    __tablename__ = "ai_jobs"
+    __table_args__ = {"schema": "backend"}
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("backend.users.id"), nullable=False, index=True)
+    chat_id = Column(UUID(as_uuid=True), ForeignKey("backend.chats.id"), nullable=False)
+    user_message_id = Column(UUID(as_uuid=True), nullable=False)
+    result_message_id = Column(UUID(as_uuid=True), nullable=True)
+
+    # queued -> generating -> saving -> succeeded | failed
+    status = Column(String(20), nullable=False, default="queued")
+    error = Column(Text, nullable=True)
+    timings = Column(JSONB, default=dict)  # stage -> milliseconds
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+# Structured sports data, refreshed in the background by app/sports_data.py
+class SportsFixture(Base):
+    __tablename__ = "sports_fixtures"
+    __table_args__ = (
+        Index("ix_sports_fixtures_kickoff", "kickoff"),
+        {"schema": "backend"},
+    )
+
+    id = Column(String(100), primary_key=True)  # id from the data source
+    competition = Column(String(100), nullable=False)
+    season = Column(String(20), nullable=True)
+    home_team = Column(String(100), nullable=False)
+    away_team = Column(String(100), nullable=False)
+    kickoff = Column(DateTime, nullable=False)
+    status = Column(String(20), nullable=False, default="scheduled")  # scheduled | live | finished | postponed
+    home_score = Column(Integer, nullable=True)
+    away_score = Column(Integer, nullable=True)
+    venue = Column(String(255), nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SportsStanding(Base):
+    __tablename__ = "sports_standings"
+    __table_args__ = {"schema": "backend"}
+
+    competition = Column(String(100), primary_key=True)
+    season = Column(String(20), primary_key=True)
+    team = Column(String(100), primary_key=True)
+    position = Column(Integer, nullable=False)
+    played = Column(Integer, nullable=False, default=0)
+    won = Column(Integer, nullable=False, default=0)
+    drawn = Column(Integer, nullable=False, default=0)
+    lost = Column(Integer, nullable=False, default=0)
+    goals_for = Column(Integer, nullable=False, default=0)
+    goals_against = Column(Integer, nullable=False, default=0)
+    points = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Message partitions moved to compressed files (see app/archive.py)
+class MessageArchive(Base):
+    __tablename__ = "message_archives"
+    __table_args__ = {"schema": "backend"}
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    partition_name = Column(String(63), unique=True, nullable=False)
+    range_start = Column(DateTime, nullable=False)
+    range_end = Column(DateTime, nullable=False)
+    path = Column(Text, nullable=False)
+    row_count = Column(Integer, nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+    # Last time a chat was restored into the partition; it is dropped
+    # again once this is older than MESSAGE_REHYDRATED_TTL_DAYS
+    rehydrated_at = Column(DateTime, nullable=True)
+
+class MessageArchiveChat(Base):
+    __tablename__ = "message_archive_chats"
+    __table_args__ = (
+        Index("ix_message_archive_chats_chat_id", "chat_id"),
+        {"schema": "backend"},
+    )
+
+    archive_id = Column(UUID(as_uuid=True), ForeignKey("backend.message_archives.id"), primary_key=True)
+    chat_id = Column(UUID(as_uuid=True), primary_key=True)
+    message_count = Column(Integer, nullable=False)
+    rehydrated = Column(Boolean, nullable=False, default=False)
+
+# Stored outcomes of requests sent with an Idempotency-Key header (see app/idempotency.py)
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        Index("ix_idempotency_keys_created_at", "created_at"),
+        {"schema": "backend"},
+    )
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("backend.users.id"), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    endpoint = Column(String(100), nullable=False)
+    request_hash = Column(String(64), nullable=False)
+
+    status = Column(String(20), nullable=False, default="in_progress")  # in_progress | completed
+    response_status = Column(Integer, nullable=True)
+    response_body = Column(JSONB, nullable=True)
+    response_headers = Column(JSONB, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    locked_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    completed_at = Column(DateTime, nullable=True)
@@ -0,0 +1,154 @@
+# app/partitions.py
+#
+# Monthly range partitions for backend.messages.
+#
+# Partitions are named messages_YYYY_MM and cover [first of month, first of
+# next month). New ones are created ahead of time by the maintenance task in
+# app/archive.py; there is no default partition, so an insert can only fail
+# if maintenance has been down for MESSAGE_PARTITIONS_AHEAD_MONTHS.
+#
+# Partitions are created standalone and then attached: ATTACH PARTITION only
+# takes SHARE UPDATE EXCLUSIVE on the parent, so reads and writes to
+# messages are not blocked while a partition is added.
+
+import re
+from datetime import datetime
+
+from sqlalchemy import text
+
+from app.config import MESSAGE_PARTITIONS_AHEAD_MONTHS
+from app.models import Message
+
+PARENT = "backend.messages"
+_NAME_RE = re.compile(r"^messages_(\d{4})_(\d{2})$")
+
+# Serializes partition DDL across workers
+MAINTENANCE_LOCK_SQL = text("SELECT pg_advisory_xact_lock(hashtext('message_partition_maintenance'))")
+
+# Copy columns; search_vector is generated by Postgres
+MESSAGE_COLUMNS = ["id", "chat_id", "sender_id", "receiver_id", "message_text", "timestamp"]
+
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(start: datetime) -> str:
+    return f"messages_{start.year:04d}_{start.month:02d}"
+
+
+def parse_partition_name(name: str):
+    match = _NAME_RE.match(name)
+    if not match:
+        return None
+    return datetime(int(match.group(1)), int(match.group(2)), 1)
+
+
+def is_partitioned(conn) -> bool:
+    relkind = conn.execute(text("""
+        SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'backend' AND c.relname = 'messages'
+    """)).scalar()
+    return relkind == "p"
+
+
+def attached_partitions(conn):
+    """Month start -> partition name for every attached messages_YYYY_MM."""
+    names = conn.execute(text("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'backend.messages'::regclass
+    """)).scalars().all()
+    partitions = {}
+    for name in names:
+        start = parse_partition_name(name)
+        if start is not None:
+            partitions[start] = name
+    return partitions
+
+
+def attach_month_partition(conn, start: datetime) -> bool:
+    """Create and attach the partition for the month starting at start. Returns False if it exists."""
+    start = month_start(start)
+    if start in attached_partitions(conn):
+        return False
+    name = partition_name(start)
+    end = add_months(start, 1)
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS backend.{name} "
+        f"(LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)"
+    ))
+    # The CHECK lets ATTACH skip its validation scan of the new table
+    conn.execute(text(
+        f"ALTER TABLE backend.{name} ADD CONSTRAINT {name}_range "
+        f"CHECK (timestamp >= '{start.isoformat()}' AND timestamp < '{end.isoformat()}')"
+    ))
+    conn.execute(text(
+        f"ALTER TABLE {PARENT} ATTACH PARTITION backend.{name} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+    conn.execute(text(f"ALTER TABLE backend.{name} DROP CONSTRAINT {name}_range"))
+    return True
+
+
+def ensure_message_partitions(conn, now=None, ahead: int = MESSAGE_PARTITIONS_AHEAD_MONTHS):
+    """Make sure this month and the next `ahead` months have partitions."""
+    current = month_start(now or datetime.utcnow())
+    created = []
+    for offset in range(ahead + 1):
+        start = add_months(current, offset)
+        if attach_month_partition(conn, start):
+            created.append(partition_name(start))
+    return created
+
+
+def convert_messages_to_partitioned(conn):
+    """One-off migration of an existing unpartitioned messages table.
+
+    Runs in the caller's transaction and holds an exclusive lock on messages
+    while rows are copied; on a large install run it in a maintenance window.
+    """
+    if not conn.execute(text("SELECT to_regclass('backend.messages')")).scalar() or is_partitioned(conn):
+        return False
+
+    conn.execute(text(f"LOCK TABLE {PARENT} IN ACCESS EXCLUSIVE MODE"))
+    conn.execute(text(f"ALTER TABLE {PARENT} RENAME TO messages_unpartitioned"))
+    # Free the index and constraint names the partitioned table will use
+    for index_name in conn.execute(text("""
+        SELECT i.relname FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = 'backend.messages_unpartitioned'::regclass AND NOT x.indisprimary
+    """)).scalars().all():
+        conn.execute(text(f"DROP INDEX backend.{index_name}"))
+    pkey = conn.execute(text("""
+        SELECT conname FROM pg_constraint
+        WHERE conrelid = 'backend.messages_unpartitioned'::regclass AND contype = 'p'
+    """)).scalar()
+    if pkey:
+        conn.execute(text(f"ALTER TABLE backend.messages_unpartitioned RENAME CONSTRAINT {pkey} TO messages_unpartitioned_pkey"))
+
+    Message.__table__.create(bind=conn)
+
+    # Rows without a timestamp take their chat's creation time
+    source = """
+        SELECT m.id, m.chat_id, m.sender_id, m.receiver_id, m.message_text,
+               COALESCE(m.timestamp, c.created_at, now() AT TIME ZONE 'utc') AS timestamp
+        FROM backend.messages_unpartitioned m
+        LEFT JOIN backend.chats c ON c.id = m.chat_id
+    """
+    bounds = conn.execute(text(f"SELECT min(timestamp), max(timestamp) FROM ({source}) s")).first()
+    if bounds[0] is not None:
+        start, last = month_start(bounds[0]), month_start(bounds[1])
+        while start <= last:
+            attach_month_partition(conn, start)
+            start = add_months(start, 1)
+    ensure_message_partitions(conn)
+
+    columns = ", ".join(MESSAGE_COLUMNS)
+    conn.execute(text(f"INSERT INTO {PARENT} ({columns}) {source}"))
+    conn.execute(text("DROP TABLE backend.messages_unpartitioned"))
+    return True
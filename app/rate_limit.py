@@ -0,0 +1,218 @@
+# app/rate_limit.py
+#
+# Token-bucket rate limiting for expensive endpoints plus a concurrency cap
+# on AI generation.
+#
+# Buckets live in Postgres (backend.rate_limit_buckets) and are refilled and
+# consumed in a single upsert, so every uvicorn worker sees the same limits.
+# The admission controller is per process: it caps concurrent agent runs on
+# this worker and sheds load once its wait queue is full.
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.config import (
+    AI_MAX_CONCURRENT_PER_WORKER,
+    AI_MAX_QUEUED_PER_WORKER,
+    AI_QUEUE_TIMEOUT_SECONDS,
+    CHAT_RATE_LIMIT_FREE_PER_MINUTE,
+    CHAT_RATE_LIMIT_PER_IP_PER_MINUTE,
+    CHAT_RATE_LIMIT_SUBSCRIBED_PER_MINUTE,
+    CHAT_RATE_LIMIT_TRIAL_PER_MINUTE,
+)
+from app.background import PeriodicTask
+from app.database import SessionLocal
+from app.metrics import AI_ADMISSION_REJECTED, AI_ADMISSION_WAITING, RATE_LIMITED
+from app.models import User
+
+
+@dataclass(frozen=True)
+class TokenBucket:
+    capacity: float
+    refill_per_second: float
+
+    @classmethod
+    def per_minute(cls, limit: int):
+        return cls(capacity=float(limit), refill_per_second=limit / 60.0)
+
+
+CHAT_BUCKETS = {
+    "subscribed": TokenBucket.per_minute(CHAT_RATE_LIMIT_SUBSCRIBED_PER_MINUTE),
+    "trial": TokenBucket.per_minute(CHAT_RATE_LIMIT_TRIAL_PER_MINUTE),
+    "free": TokenBucket.per_minute(CHAT_RATE_LIMIT_FREE_PER_MINUTE),
+}
+CHAT_IP_BUCKET = TokenBucket.per_minute(CHAT_RATE_LIMIT_PER_IP_PER_MINUTE)
+
+_TAKE_TOKEN_SQL = text("""
+    INSERT INTO backend.rate_limit_buckets AS b (key, tokens, updated_at)
+    VALUES (:key, :capacity - 1, clock_timestamp())
+    ON CONFLICT (key) DO UPDATE
+    SET tokens = LEAST(:capacity, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * :rate) - 1,
+        updated_at = clock_timestamp()
+    WHERE LEAST(:capacity, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * :rate) >= 1
+    RETURNING tokens
+""")
+
+_AVAILABLE_SQL = text("""
+    SELECT LEAST(:capacity, tokens + EXTRACT(EPOCH FROM clock_timestamp() - updated_at) * :rate)
+    FROM backend.rate_limit_buckets
+    WHERE key = :key
+""")
+
+_PURGE_SQL = text("""
+    DELETE FROM backend.rate_limit_buckets
+    WHERE updated_at < clock_timestamp() - make_interval(secs => :idle_seconds)
+""")
+
+
+def take_token(db: Session, key: str, bucket: TokenBucket):
+    """Consume one token. Returns (allowed, retry_after_seconds)."""
+    params = {"key": key, "capacity": bucket.capacity, "rate": bucket.refill_per_second}
+    allowed = db.execute(_TAKE_TOKEN_SQL, params).first() is not None
+    retry_after = 0.0
+    if not allowed:
+        available = db.execute(_AVAILABLE_SQL, params).scalar() or 0.0
+        retry_after = (1 - float(available)) / bucket.refill_per_second
+    db.commit()
+    return allowed, retry_after
+
+
+def purge_idle_buckets(db: Session, idle_seconds: int = 3600):
+    # An idle bucket has refilled to capacity, so dropping it changes nothing.
+    deleted = db.execute(_PURGE_SQL, {"idle_seconds": idle_seconds}).rowcount
+    db.commit()
+    return deleted
+
+
+def _purge_idle_buckets_job():
+    db = SessionLocal()
+    try:
+        purge_idle_buckets(db)
+    finally:
+        db.close()
+
+
+bucket_purge_task = PeriodicTask("rate-limit-purge", 3600, _purge_idle_buckets_job, run_immediately=False)
+
+
+def subscription_tier(user: User) -> str:
+    if user.is_subscribed:
+        return "subscribed"
+    if user.trial_ends_at and user.trial_ends_at > datetime.utcnow():
+        return "trial"
+    return "free"
+
+
+def _too_many_requests(retry_after: float, detail: str):
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+def check_chat_rate_limit(db: Session, user: User, client_host=None):
+    tier = subscription_tier(user)
+    allowed, retry_after = take_token(db, f"chat:user:{user.id}", CHAT_BUCKETS[tier])
+    if not allowed:
+        RATE_LIMITED.labels("chat", "user").inc()
+        raise _too_many_requests(retry_after, "Too many messages. Please slow down.")
+
+    if client_host:
+        allowed, retry_after = take_token(db, f"chat:ip:{client_host}", CHAT_IP_BUCKET)
+        if not allowed:
+            RATE_LIMITED.labels("chat", "ip").inc()
+            raise _too_many_requests(retry_after, "Too many messages from this address. Please slow down.")
+
+
+# --------------------
+# Admission control
+# --------------------
+class Overloaded(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"overloaded, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int, max_queued: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        # Moving average of slot hold time, used to estimate Retry-After
+        self._avg_service_time = 5.0
+
+    @property
+    def active(self):
+        return self._active
+
+    def _retry_after(self):
+        backlog = (self._waiting + 1) / max(1, self.max_concurrent)
+        return backlog * self._avg_service_time
+
+    @contextmanager
+    def slot(self):
+        with self._cond:
+            if self._active >= self.max_concurrent:
+                if self._waiting >= self.max_queued:
+                    raise Overloaded(self._retry_after())
+                self._waiting += 1
+                AI_ADMISSION_WAITING.inc()
+                try:
+                    admitted = self._cond.wait_for(
+                        lambda: self._active < self.max_concurrent, timeout=self.queue_timeout
+                    )
+                finally:
+                    self._waiting -= 1
+                    AI_ADMISSION_WAITING.dec()
+                if not admitted:
+                    raise Overloaded(self._retry_after())
+            self._active += 1
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            with self._cond:
+                self._active -= 1
+                self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * elapsed
+                # notify_all so a drain() waiter is woken as well as queued requests
+                self._cond.notify_all()
+
+    def drain(self, timeout: float) -> bool:
+        """Wait for running and queued AI requests on this worker to finish."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._active == 0 and self._waiting == 0, timeout=timeout)
+
+
+ai_admission = AdmissionController(
+    max_concurrent=AI_MAX_CONCURRENT_PER_WORKER,
+    max_queued=AI_MAX_QUEUED_PER_WORKER,
+    queue_timeout=AI_QUEUE_TIMEOUT_SECONDS,
+)
+
+
+@contextmanager
+def ai_slot():
+    try:
+        with ai_admission.slot():
+            yield
+    except Overloaded as e:
+        AI_ADMISSION_REJECTED.inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="AI service is busy. Please try again shortly.",
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+        )
@@ -0,0 +1,308 @@
+# app/realtime.py
+#
+# Chat event fan-out across uvicorn workers using Postgres LISTEN/NOTIFY.
+#
+# New messages are announced with pg_notify inside the statement that
+# inserts them (message_event builds the payload), so listeners only hear
+# about committed rows. Every worker runs one listener thread that hands
+# events to the WebSocket subscribers connected to that worker.
+#
+# Streaming AI tokens never block the generating thread: publish() queues
+# them for a publisher thread, which merges the tokens of a chat into one
+# event per TOKEN_FLUSH_SECONDS (or TOKEN_FLUSH_CHARS), hands them straight
+# to this worker's subscribers and only NOTIFYs them when another worker
+# has a subscriber for the chat. Workers announce the chats they watch on
+# the same channel (re-sent every INTEREST_REFRESH_SECONDS and whenever a
+# worker's listener connects).
+
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+import uuid
+from collections import defaultdict
+from queue import Empty, Full, Queue
+
+import psycopg2
+import psycopg2.extensions
+
+from app.database import engine
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "chat_events"
+# NOTIFY payloads are capped at 8000 bytes; larger messages are sent by id
+# and loaded by the receiving worker.
+MAX_INLINE_PAYLOAD = 7000
+SUBSCRIBER_QUEUE_SIZE = 1000
+OUTBOX_SIZE = 10000
+TOKEN_FLUSH_SECONDS = 0.05
+TOKEN_FLUSH_CHARS = 512
+INTEREST_REFRESH_SECONDS = 20
+INTEREST_TTL_SECONDS = 60
+# Chat ids per interest announcement, well under the payload cap
+INTEREST_BATCH = 100
+
+
+def _message_payload(message) -> dict:
+    return {
+        "id": str(message.id),
+        "chat_id": str(message.chat_id),
+        "sender_id": str(message.sender_id),
+        "receiver_id": str(message.receiver_id),
+        "message_text": message.message_text,
+        "timestamp": message.timestamp.isoformat() if message.timestamp else None,
+    }
+
+
+def message_event(message) -> str:
+    """NOTIFY payload announcing a new message (by id if it is too large to inline)."""
+    event = {"type": "message", "chat_id": str(message.chat_id), "message": _message_payload(message)}
+    payload = json.dumps(event)
+    if len(payload.encode("utf-8")) > MAX_INLINE_PAYLOAD:
+        payload = json.dumps({"type": "message_ref", "chat_id": str(message.chat_id), "message_id": str(message.id)})
+    return payload
+
+
+def _connect():
+    args, kwargs = engine.dialect.create_connect_args(engine.url)
+    conn = psycopg2.connect(*args, **kwargs)
+    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    return conn
+
+
+class ChatBroadcaster:
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex
+        self._subscribers = defaultdict(set)  # chat_id -> {(loop, queue)}
+        self._remote_interest = {}  # chat_id -> expiry (monotonic), watched on another worker
+        self._lock = threading.Lock()
+        # ("event", chat_id, event) | ("notify", payload) | ("flush", threading.Event)
+        self._outbox = Queue(maxsize=OUTBOX_SIZE)
+        self._publish_conn = None
+        self._thread = None
+        self._publisher = None
+        self._stopping = threading.Event()
+
+    # ---------- subscribers ----------
+    def subscribe(self, chat_id: str) -> asyncio.Queue:
+        self.start()
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            first = chat_id not in self._subscribers
+            self._subscribers[chat_id].add((asyncio.get_running_loop(), queue))
+        if first:
+            self._announce([chat_id])
+        return queue
+
+    def unsubscribe(self, chat_id: str, queue: asyncio.Queue):
+        # Other workers keep sending this chat's tokens until the
+        # announcement expires; there is nobody to dispatch them to here
+        with self._lock:
+            subscribers = self._subscribers.get(chat_id)
+            if not subscribers:
+                return
+            subscribers.difference_update({entry for entry in subscribers if entry[1] is queue})
+            if not subscribers:
+                del self._subscribers[chat_id]
+
+    def _dispatch(self, event: dict):
+        with self._lock:
+            targets = list(self._subscribers.get(event.get("chat_id"), ()))
+        for loop, queue in targets:
+            loop.call_soon_threadsafe(_offer, queue, event)
+
+    # ---------- interest ----------
+    def _announce(self, chat_ids):
+        for i in range(0, len(chat_ids), INTEREST_BATCH):
+            self._enqueue(("notify", json.dumps({
+                "type": "interest", "worker": self.worker_id, "chat_ids": chat_ids[i:i + INTEREST_BATCH],
+            })))
+
+    def _announce_all(self):
+        with self._lock:
+            chat_ids = list(self._subscribers)
+        self._announce(chat_ids)
+
+    def _remote_subscribers(self, chat_id: str) -> bool:
+        return self._remote_interest.get(chat_id, 0.0) > time.monotonic()
+
+    def _receive(self, event: dict):
+        kind = event.get("type")
+        if event.get("origin") == self.worker_id or event.get("worker") == self.worker_id:
+            return  # our own tokens were dispatched locally already
+        if kind == "interest":
+            expires = time.monotonic() + INTEREST_TTL_SECONDS
+            with self._lock:
+                for chat_id in event.get("chat_ids", ()):
+                    self._remote_interest[chat_id] = expires
+        elif kind == "interest_sync":
+            self._announce_all()
+        else:
+            self._dispatch(event)
+
+    # ---------- publishing ----------
+    def publish(self, chat_id, event: dict):
+        """Queue an ephemeral event (e.g. an AI token) for this chat's subscribers on every worker."""
+        self.start()
+        self._enqueue(("event", str(chat_id), event))
+
+    def flush(self, timeout: float = 1.0):
+        """Wait until events published so far are delivered (e.g. before the final message)."""
+        if self._publisher is None or not self._publisher.is_alive():
+            return
+        done = threading.Event()
+        if self._enqueue(("flush", done)):
+            done.wait(timeout)
+
+    def _enqueue(self, item) -> bool:
+        try:
+            self._outbox.put_nowait(item)
+            return True
+        except Full:
+            logger.warning("Chat event outbox full; dropping %s", item[0])
+            return False
+
+    def _notify(self, payload: str):
+        for attempt in range(2):
+            try:
+                if self._publish_conn is None or self._publish_conn.closed:
+                    self._publish_conn = _connect()
+                with self._publish_conn.cursor() as cur:
+                    cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, payload))
+                return
+            except psycopg2.Error:
+                logger.exception("Failed to publish chat event")
+                self._publish_conn = None
+
+    def _collect(self, first) -> list:
+        # Everything queued within TOKEN_FLUSH_SECONDS of the first item,
+        # cut short by a flush request or TOKEN_FLUSH_CHARS of tokens
+        items = [first]
+        chars = _text_length(first)
+        deadline = time.monotonic() + TOKEN_FLUSH_SECONDS
+        while items[-1][0] != "flush" and chars < TOKEN_FLUSH_CHARS:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._outbox.get(timeout=remaining))
+            except Empty:
+                break
+            chars += _text_length(items[-1])
+        return items
+
+    def _deliver(self, items):
+        by_chat = defaultdict(list)  # chat_id -> events, in order
+        for item in items:
+            if item[0] == "notify":
+                self._notify(item[1])
+                continue
+            if item[0] != "event":
+                continue
+            _, chat_id, event = item
+            events = by_chat[chat_id]
+            last = events[-1] if events else None
+            if (
+                last is not None and event.get("type") == "token" == last.get("type")
+                and len(last["text"]) + len(event["text"]) <= TOKEN_FLUSH_CHARS
+            ):
+                last["text"] += event["text"]
+            else:
+                events.append({**event, "chat_id": chat_id})
+        for chat_id, events in by_chat.items():
+            remote = self._remote_subscribers(chat_id)
+            for event in events:
+                self._dispatch(event)
+                if remote:
+                    self._notify(json.dumps({**event, "origin": self.worker_id}))
+        for item in items:
+            if item[0] == "flush":
+                item[1].set()
+
+    def _publish_forever(self):
+        next_refresh = time.monotonic() + INTEREST_REFRESH_SECONDS
+        while not self._stopping.is_set():
+            now = time.monotonic()
+            if now >= next_refresh:
+                self._announce_all()
+                with self._lock:
+                    self._remote_interest = {c: t for c, t in self._remote_interest.items() if t > now}
+                next_refresh = now + INTEREST_REFRESH_SECONDS
+            try:
+                first = self._outbox.get(timeout=1.0)
+            except Empty:
+                continue
+            try:
+                self._deliver(self._collect(first))
+            except Exception:
+                logger.exception("Failed to deliver chat events")
+
+    # ---------- listener ----------
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._listen_forever, name="chat-broadcaster", daemon=True)
+            self._thread.start()
+            if not (self._publisher and self._publisher.is_alive()):
+                self._publisher = threading.Thread(target=self._publish_forever, name="chat-publisher", daemon=True)
+                self._publisher.start()
+
+    def stop(self):
+        self._stopping.set()
+        for thread in (self._thread, self._publisher):
+            if thread:
+                thread.join(timeout=5)
+        if self._publish_conn is not None and not self._publish_conn.closed:
+            self._publish_conn.close()
+        self._publish_conn = None
+
+    def _listen_forever(self):
+        backoff = 0.5
+        while not self._stopping.is_set():
+            conn = None
+            try:
+                conn = _connect()
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL}")
+                backoff = 0.5
+                # Learn which chats the other workers watch, and remind them of ours
+                self._enqueue(("notify", json.dumps({"type": "interest_sync", "worker": self.worker_id})))
+                self._announce_all()
+                while not self._stopping.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notification = conn.notifies.pop(0)
+                        try:
+                            self._receive(json.loads(notification.payload))
+                        except ValueError:
+                            logger.warning("Ignoring malformed chat event: %r", notification.payload)
+            except (psycopg2.Error, OSError):
+                logger.exception("Chat event listener lost its connection; reconnecting")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if conn is not None and not conn.closed:
+                    conn.close()
+
+
+def _text_length(item) -> int:
+    return len(item[2].get("text") or "") if item[0] == "event" else 0
+
+
+def _offer(queue: asyncio.Queue, event: dict):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        # A subscriber that cannot keep up loses events; it still sees the
+        # final messages by re-fetching history on reconnect.
+        logger.warning("Dropping chat event for slow WebSocket subscriber")
+
+
+broadcaster = ChatBroadcaster()
@@ -0,0 +1,127 @@
+# app/recurrence.py
+#
+# Recurring class schedules.
+#
+# Class.recurrence holds a small RRULE subset (schemas.ClassRecurrence).
+# Occurrences are expanded with dateutil.rrule and stored in
+# backend.class_occurrences from now up to CLASS_OCCURRENCE_HORIZON_DAYS
+# ahead, so "what is on this week" is one range scan over
+# (user_id, starts_at). Saving a class replaces its future occurrences; a
+# periodic task extends every schedule as the horizon moves forward. Past
+# occurrences are kept as history.
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+from dateutil.rrule import DAILY, FR, MO, MONTHLY, SA, SU, TH, TU, WE, WEEKLY, rrule
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.background import PeriodicTask
+from app.config import CLASS_OCCURRENCE_HORIZON_DAYS, CLASS_OCCURRENCE_REFRESH_SECONDS
+from app.database import engine
+from app.models import Class, ClassOccurrence
+from app.schemas import ClassRecurrence
+
+logger = logging.getLogger(__name__)
+
+FREQUENCIES = {"DAILY": DAILY, "WEEKLY": WEEKLY, "MONTHLY": MONTHLY}
+WEEKDAYS = {"MO": MO, "TU": TU, "WE": WE, "TH": TH, "FR": FR, "SA": SA, "SU": SU}
+
+# Classes locked and extended per transaction by the refresh task
+REFRESH_BATCH = 200
+
+_table = ClassOccurrence.__table__
+
+
+# --------------------
+# Expansion
+# --------------------
+def build_rule(recurrence: ClassRecurrence) -> rrule:
+    tz = ZoneInfo(recurrence.timezone) if recurrence.timezone else None
+    return rrule(
+        FREQUENCIES[recurrence.freq],
+        interval=recurrence.interval,
+        dtstart=recurrence.dtstart.replace(tzinfo=tz),
+        until=recurrence.until.replace(tzinfo=tz) if recurrence.until else None,
+        count=recurrence.count,
+        byweekday=[WEEKDAYS[day] for day in recurrence.by_weekday] if recurrence.by_weekday else None,
+        bymonthday=recurrence.by_month_day or None,
+    )
+
+
+def _to_rule_time(value: datetime, tz) -> datetime:
+    # Window bounds are naive UTC; the rule runs in its own wall-clock zone
+    return value.replace(tzinfo=timezone.utc).astimezone(tz) if tz else value
+
+
+def _to_utc(value: datetime) -> datetime:
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+
+def expand(recurrence: ClassRecurrence, start: datetime, end: datetime):
+    """(starts_at, ends_at) in naive UTC for occurrences starting in [start, end)."""
+    tz = ZoneInfo(recurrence.timezone) if recurrence.timezone else None
+    duration = timedelta(minutes=recurrence.duration_minutes)
+    window_end = _to_rule_time(end, tz)
+    occurrences = []
+    for local in build_rule(recurrence).between(_to_rule_time(start, tz), window_end, inc=True):
+        if local < window_end:
+            starts_at = _to_utc(local)
+            occurrences.append((starts_at, starts_at + duration))
+    return occurrences
+
+
+# --------------------
+# Materialization
+# --------------------
+def _insert_occurrences(conn, class_id, user_id, recurrence: dict, start: datetime, end: datetime) -> int:
+    rows = [
+        {"class_id": class_id, "user_id": user_id, "starts_at": starts_at, "ends_at": ends_at}
+        for starts_at, ends_at in expand(ClassRecurrence.model_validate(recurrence), start, end)
+    ]
+    if rows:
+        conn.execute(insert(_table).on_conflict_do_nothing(), rows)
+    return len(rows)
+
+
+def replace_occurrences(conn, class_id, user_id, recurrence: Optional[dict], now=None) -> int:
+    """Rebuild a class's future occurrences in the caller's transaction."""
+    now = now or datetime.utcnow()
+    conn.execute(delete(_table).where(_table.c.class_id == class_id, _table.c.starts_at >= now))
+    if not recurrence:
+        return 0
+    return _insert_occurrences(conn, class_id, user_id, recurrence, now, now + timedelta(days=CLASS_OCCURRENCE_HORIZON_DAYS))
+
+
+def extend_class_occurrences(now=None) -> int:
+    """Fill every recurring class up to the current horizon. Safe to re-run."""
+    now = now or datetime.utcnow()
+    horizon = now + timedelta(days=CLASS_OCCURRENCE_HORIZON_DAYS)
+    expanded, last_id = 0, None
+    while True:
+        with engine.begin() as conn:
+            # Row locks keep a concurrent class update from being overwritten
+            # with occurrences of the schedule it just replaced (update_class
+            # and delete_class lock the row before touching occurrences)
+            stmt = select(Class.id, Class.user_id, Class.recurrence).where(Class.recurrence.is_not(None))
+            if last_id is not None:
+                stmt = stmt.where(Class.id > last_id)
+            batch = conn.execute(stmt.order_by(Class.id).limit(REFRESH_BATCH).with_for_update()).all()
+            for row in batch:
+                expanded += _insert_occurrences(conn, row.id, row.user_id, row.recurrence, now, horizon)
+        if len(batch) < REFRESH_BATCH:
+            break
+        last_id = batch[-1].id
+    logger.info("class occurrences refreshed up to %s (%d expanded)", horizon.date(), expanded)
+    return expanded
+
+
+class_occurrence_task = PeriodicTask(
+    "class-occurrences",
+    CLASS_OCCURRENCE_REFRESH_SECONDS,
+    extend_class_occurrences,
+    run_immediately=False,
+)
@@ -1,55 +1,107 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-from uuid import UUID
-from datetime import datetime
-from sqlalchemy import func
-from app.database import get_db
-from app.models import Chat, Message, UserChat, User
-from app.schemas import ChatResponse, MessageCreate, MessageResponse
-from app.routers.dependencies import get_current_user
+import asyncio
+import json
+import logging
+import time
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, aliased
+from typing import List, Optional
+from types import SimpleNamespace
+from uuid import UUID, uuid4
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, text, true
+from app.database import get_db, release_connection, SessionLocal
+from app.models import AIJob, Chat, Message, UserChat, User
+from app.schemas import AIJobResponse, ChatResponse, MessageCreate, MessageResponse
+from app.routers.dependencies import get_current_user, get_user_from_token
 from app.ai.agent import generate_ai_response
+from app.ai.jobs import JobPoolFull, job_pool
+from app.rate_limit import ai_slot, check_chat_rate_limit
+from app.realtime import CHANNEL, broadcaster, message_event
+from app.archive import hot_cutoff, needs_rehydration, rehydrate_chat
+from app.idempotency import request_fingerprint, run_idempotent
+from app.responses import as_text, json_response, schema_columns
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # Fixed AI user UUID
 AI_USER_ID = UUID("00000000-0000-0000-0000-000000000001")
 
+# Messages in a chat are never older than the chat, so bounding timestamp by
+# chat.created_at lets Postgres prune older message partitions. The margin
+# covers clock skew between app servers.
+PRUNING_MARGIN = timedelta(days=1)
+EPOCH = datetime(1970, 1, 1)
 
-# -------------------------------
-# Get Recent Chats (Recent Plans)
-# -------------------------------
-@router.get("/", response_model=List[ChatResponse])
-def get_chats(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    user_chats = (
-        db.query(Chat)
+
+def _messages_since(chat_created_at):
+    return (chat_created_at or EPOCH) - PRUNING_MARGIN
+
+
+# Columns of a message as returned by the API
+_MESSAGE_COLUMNS = schema_columns(Message.__table__, MessageResponse)
+
+
+def _chat_summaries(user_id: UUID):
+    """Core query for ChatResponse rows: one row per chat, newest first.
+
+    Participants are aggregated per chat and the last message comes from a
+    LATERAL subquery, bounded below by the chat's creation time so only the
+    partitions since then are searched.
+    """
+    members = aliased(UserChat)
+    participants = (
+        select(func.array_agg(as_text(members.user_id)))
+        .where(members.chat_id == Chat.id)
+        .correlate(Chat)
+        .scalar_subquery()
+    )
+    last_message = (
+        select(*_MESSAGE_COLUMNS)
+        .where(
+            Message.chat_id == Chat.id,
+            Message.timestamp >= func.coalesce(Chat.created_at, EPOCH) - PRUNING_MARGIN,
+        )
+        .order_by(Message.timestamp.desc())
+        .limit(1)
+        .lateral("last_message")
+    )
+    return (
+        select(
+            as_text(Chat.id),
+            Chat.updated_at,
+            participants.label("participants"),
+            *[c.label(f"last_{c.name}") for c in last_message.c],
+        )
         .join(UserChat, Chat.id == UserChat.chat_id)
-        .filter(UserChat.user_id == user.id)
+        .outerjoin(last_message, true())
+        .where(UserChat.user_id == user_id)
         .order_by(Chat.updated_at.desc())
-        .all()
     )
 
-    response = []
-    for chat in user_chats:
-        participants = db.query(UserChat.user_id).filter(UserChat.chat_id == chat.id).all()
-        participant_ids = [p[0] for p in participants]
 
-        last_msg = (
-            db.query(Message)
-            .filter(Message.chat_id == chat.id)
-            .order_by(Message.timestamp.desc())
-            .first()
-        )
+def _chat_response(row) -> dict:
+    last_message = None
+    if row.last_id is not None:
+        last_message = {c.name: row._mapping[f"last_{c.name}"] for c in _MESSAGE_COLUMNS}
+    return {
+        "id": row.id,
+        "participants": row.participants or [],
+        "last_message": last_message,
+        "updated_at": row.updated_at,
+    }
 
-        response.append(
-            ChatResponse(
-                id=chat.id,
-                participants=participant_ids,
-                last_message=last_msg,
-                updated_at=chat.updated_at,
-            )
-        )
-    return response
+
+# -------------------------------
+# Get Recent Chats (Recent Plans)
+# -------------------------------
+@router.get("/", response_model=List[ChatResponse])
+def get_chats(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+    rows = db.execute(_chat_summaries(user.id)).all()
+    return json_response(List[ChatResponse], [_chat_response(row) for row in rows])
 
 
 # -------------------------------
@@ -78,32 +130,10 @@ def create_new_chat(db: Session = Depends(get_db), user: User = Depends(get_curr
 # -------------------------------
 @router.get("/last", response_model=ChatResponse)
 def get_last_chat(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    last_chat = (
-        db.query(Chat)
-        .join(UserChat, Chat.id == UserChat.chat_id)
-        .filter(UserChat.user_id == user.id)
-        .order_by(Chat.updated_at.desc())
-        .first()
-    )
-    if not last_chat:
+    row = db.execute(_chat_summaries(user.id).limit(1)).first()
+    if not row:
         raise HTTPException(status_code=404, detail="No previous chats found")
-
-    participants = db.query(UserChat.user_id).filter(UserChat.chat_id == last_chat.id).all()
-    participant_ids = [p[0] for p in participants]
-
-    last_msg = (
-        db.query(Message)
-        .filter(Message.chat_id == last_chat.id)
-        .order_by(Message.timestamp.desc())
-        .first()
-    )
-
-    return ChatResponse(
-        id=last_chat.id,
-        participants=participant_ids,
-        last_message=last_msg,
-        updated_at=last_chat.updated_at
-    )
+    return json_response(ChatResponse, _chat_response(row))
 
 
 # -------------------------------
@@ -111,80 +141,404 @@ def get_last_chat(db: Session = Depends(get_db), user: User = Depends(get_curren
 # -------------------------------
 @router.get("/{chat_id}", response_model=List[MessageResponse])
 def get_chat_messages(chat_id: UUID, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    user_chat = (
-        db.query(UserChat)
-        .filter(UserChat.chat_id == chat_id, UserChat.user_id == user.id)
-        .first()
-    )
-    if not user_chat:
+    chat_created_at = db.execute(
+        select(Chat.created_at)
+        .join(UserChat, Chat.id == UserChat.chat_id)
+        .where(UserChat.chat_id == chat_id, UserChat.user_id == user.id)
+    ).first()
+    if not chat_created_at:
         raise HTTPException(status_code=404, detail="Chat not found or access denied")
+    chat_created_at = chat_created_at[0]
+
+    # Chats older than the hot window may have history in cold storage
+    if (chat_created_at is None or chat_created_at < hot_cutoff()) and needs_rehydration(db, chat_id):
+        rehydrate_chat(db, chat_id)
 
-    messages = (
-        db.query(Message)
-        .filter(Message.chat_id == chat_id)
+    messages = db.execute(
+        select(*_MESSAGE_COLUMNS)
+        .where(Message.chat_id == chat_id, Message.timestamp >= _messages_since(chat_created_at))
         .order_by(Message.timestamp)
-        .all()
-    )
-    return messages
+    ).mappings().all()
+    return json_response(List[MessageResponse], messages)
 
 
 # -------------------------------
 # Send a Message and Get AI Response
 # -------------------------------
-@router.post("/", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
-def send_message(msg_in: MessageCreate, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    ai_user_id = AI_USER_ID
+# mode=async stores the user message, queues generation on the background
+# job pool and answers 202 right away; poll GET /jobs/{job_id} for the reply.
+# With an Idempotency-Key header a retried send returns the original reply
+# (or job) instead of storing and generating a second one. The rate limit is
+# charged inside the handler, so replays of a stored response are free.
+@router.post(
+    "/",
+    response_model=MessageResponse,
+    status_code=status.HTTP_201_CREATED,
+    responses={202: {"model": AIJobResponse, "description": "Reply queued (mode=async)"}},
+)
+def send_message(
+    msg_in: MessageCreate,
+    request: Request,
+    mode: str = Query("sync", pattern="^(sync|async)$"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    def handler():
+        check_chat_rate_limit(db, user, request.client.host if request.client else None)
+        if mode == "async":
+            return _enqueue_ai_job(db, user, msg_in.message_text)
 
-    # Find chat between user and AI
-    chat = (
-        db.query(Chat)
-        .join(UserChat, Chat.id == UserChat.chat_id)
-        .filter(UserChat.user_id.in_([user.id, ai_user_id]))
-        .group_by(Chat.id)
-        .having(func.count(Chat.id) == 2)
-        .first()
+        # Don't hold a pooled connection while queued for an AI slot
+        release_connection(db)
+        with ai_slot():
+            chat_id = _get_or_create_ai_chat(db, user.id)
+            return _exchange_messages(db, user.id, chat_id, msg_in.message_text)
+
+    return run_idempotent(
+        db, user.id, idempotency_key, "chats.send_message",
+        request_fingerprint({"mode": mode, **msg_in.model_dump()}),
+        handler,
+        success_status=status.HTTP_201_CREATED,
+        response_model=MessageResponse,
     )
 
-    if not chat:
-        chat = Chat(updated_at=datetime.utcnow())
-        db.add(chat)
-        db.commit()
-        db.refresh(chat)
 
-        db.add_all([
-            UserChat(chat_id=chat.id, user_id=user.id),
-            UserChat(chat_id=chat.id, user_id=ai_user_id)
-        ])
-        db.commit()
+# Write path: one statement finds or creates the AI chat, one stores the
+# user's message (and announces it), then the transaction ends before
+# generation starts. The reply, the chat bump and its NOTIFY are a single
+# statement in a second transaction.
+_AI_CHAT_SQL = text("""
+    WITH existing AS (
+        SELECT uc.chat_id AS id
+        FROM backend.user_chats uc
+        JOIN backend.user_chats ai ON ai.chat_id = uc.chat_id AND ai.user_id = :ai_user_id
+        WHERE uc.user_id = :user_id
+        LIMIT 1
+    ), created AS (
+        INSERT INTO backend.chats (id, created_at, updated_at)
+        SELECT :new_chat_id, :now, :now
+        WHERE NOT EXISTS (SELECT 1 FROM existing)
+        RETURNING id
+    ), members AS (
+        INSERT INTO backend.user_chats (id, chat_id, user_id)
+        SELECT gen_random_uuid(), created.id, member.user_id
+        FROM created CROSS JOIN (VALUES (CAST(:user_id AS uuid)), (CAST(:ai_user_id AS uuid))) AS member(user_id)
+    )
+    SELECT id FROM existing
+    UNION ALL
+    SELECT id FROM created
+""")
 
-    # Store user message
-    user_message = Message(
-        chat_id=chat.id,
-        sender_id=user.id,
-        receiver_id=ai_user_id,
-        message_text=msg_in.message_text,
-        timestamp=datetime.utcnow()
+_INSERT_MESSAGE_SQL = text("""
+    WITH inserted AS (
+        INSERT INTO backend.messages (id, chat_id, sender_id, receiver_id, message_text, timestamp)
+        VALUES (:id, :chat_id, :sender_id, :receiver_id, :message_text, :timestamp)
+        RETURNING id, chat_id, sender_id, receiver_id, message_text, timestamp
     )
-    db.add(user_message)
-    db.commit()
-    db.refresh(user_message)
-
-    # Generate AI response
-    ai_response_text = generate_ai_response(msg_in.message_text)
-
-    # Store AI response
-    ai_message = Message(
-        chat_id=chat.id,
-        sender_id=ai_user_id,
-        receiver_id=user.id,
-        message_text=ai_response_text,
-        timestamp=datetime.utcnow()
+    SELECT inserted.*, pg_notify(:channel, :payload) AS notified FROM inserted
+""")
+
+_INSERT_REPLY_SQL = text("""
+    WITH inserted AS (
+        INSERT INTO backend.messages (id, chat_id, sender_id, receiver_id, message_text, timestamp)
+        VALUES (:id, :chat_id, :sender_id, :receiver_id, :message_text, :timestamp)
+        RETURNING id, chat_id, sender_id, receiver_id, message_text, timestamp
+    ), bumped AS (
+        UPDATE backend.chats SET updated_at = :timestamp WHERE id = :chat_id
+    )
+    SELECT inserted.*, pg_notify(:channel, :payload) AS notified FROM inserted
+""")
+
+
+# Takes back the user's message of a send that failed, and tells the chat's
+# subscribers it is gone
+_WITHDRAW_MESSAGE_SQL = text("""
+    WITH deleted AS (
+        DELETE FROM backend.messages
+        WHERE id = :id AND chat_id = :chat_id AND timestamp = :timestamp
+        RETURNING id, chat_id
     )
-    db.add(ai_message)
+    SELECT pg_notify(:channel, json_build_object(
+        'type', 'message_deleted', 'chat_id', chat_id::text, 'message_id', id::text
+    )::text) FROM deleted
+""")
+
+
+def _get_or_create_ai_chat(db: Session, user_id: UUID) -> UUID:
+    """Id of the user's chat with the AI, creating it (and both memberships) if needed."""
+    return db.execute(_AI_CHAT_SQL, {
+        "user_id": user_id,
+        "ai_user_id": AI_USER_ID,
+        "new_chat_id": uuid4(),
+        "now": datetime.utcnow(),
+    }).scalar_one()
+
+
+def _insert_message(db: Session, statement, chat_id: UUID, sender_id: UUID, receiver_id: UUID, message_text: str):
+    values = {
+        "id": uuid4(),
+        "chat_id": chat_id,
+        "sender_id": sender_id,
+        "receiver_id": receiver_id,
+        "message_text": message_text,
+        "timestamp": datetime.utcnow(),
+    }
+    params = {**values, "channel": CHANNEL, "payload": message_event(SimpleNamespace(**values))}
+    return db.execute(statement, params).one()
+
 
-    chat.updated_at = datetime.utcnow()
+def _add_user_message(db: Session, user_id: UUID, chat_id: UUID, message_text: str):
+    return _insert_message(db, _INSERT_MESSAGE_SQL, chat_id, user_id, AI_USER_ID, message_text)
+
+
+def _add_ai_reply(db: Session, user_id: UUID, chat_id: UUID, reply_text: str):
+    return _insert_message(db, _INSERT_REPLY_SQL, chat_id, AI_USER_ID, user_id, reply_text)
+
+
+def _withdraw_message(db: Session, message):
+    db.rollback()
+    try:
+        db.execute(_WITHDRAW_MESSAGE_SQL, {
+            "id": message.id, "chat_id": message.chat_id, "timestamp": message.timestamp, "channel": CHANNEL,
+        })
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Could not withdraw message %s of a failed send", message.id)
+
+
+def _exchange_messages(db: Session, user_id: UUID, chat_id: UUID, message_text: str, on_token=None):
+    # Store user message; committing hands the connection back to the pool
+    user_message = _add_user_message(db, user_id, chat_id, message_text)
     db.commit()
-    db.refresh(ai_message)
-    db.refresh(chat)
 
+    try:
+        # Generate AI response
+        ai_response_text = generate_ai_response(message_text, user_id=user_id, chat_id=chat_id, on_token=on_token)
+        if on_token is not None:
+            broadcaster.flush()  # the last tokens go out before the reply itself
+
+        # Store AI response and bump the chat
+        ai_message = _add_ai_reply(db, user_id, chat_id, ai_response_text)
+        db.commit()
+    except Exception:
+        # A failed send stores nothing, so its retry (which the Idempotency-Key
+        # allows for 5xx/429) doesn't leave the question in the chat twice
+        _withdraw_message(db, user_message)
+        raise
     return ai_message
+
+
+# -------------------------------
+# Async AI Jobs
+# -------------------------------
+def _enqueue_ai_job(db: Session, user: User, message_text: str) -> JSONResponse:
+    try:
+        job_pool.reserve()
+    except JobPoolFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="AI job queue is full. Please try again shortly.",
+            headers={"Retry-After": "5"},
+        )
+
+    try:
+        chat_id = _get_or_create_ai_chat(db, user.id)
+        user_message = _add_user_message(db, user.id, chat_id, message_text)
+        job = AIJob(
+            user_id=user.id,
+            chat_id=chat_id,
+            user_message_id=user_message.id,
+            status="queued",
+            timings={},
+        )
+        db.add(job)
+        db.commit()
+    except Exception:
+        job_pool.release()
+        raise
+
+    job_pool.submit(_run_ai_job, job.id, time.monotonic())
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=AIJobResponse.model_validate(job).model_dump(mode="json"),
+        headers={"Location": f"/api/chats/jobs/{job.id}"},
+    )
+
+
+def _elapsed_ms(since: float) -> float:
+    return round((time.monotonic() - since) * 1000, 1)
+
+
+def _run_ai_job(job_id: UUID, enqueued_at: float):
+    timings = {"queue_wait_ms": _elapsed_ms(enqueued_at)}
+    db = SessionLocal()
+    try:
+        job = db.query(AIJob).filter(AIJob.id == job_id).one()
+        user_message = db.query(Message).filter(Message.id == job.user_message_id).first()
+        if user_message is None:
+            raise HTTPException(status_code=404, detail="The message for this job no longer exists.")
+        chat_id, user_id, prompt = job.chat_id, job.user_id, user_message.message_text
+
+        job.status = "generating"
+        job.started_at = datetime.utcnow()
+        job.timings = dict(timings)
+        db.commit()
+
+        stage_start = time.monotonic()
+        reply_text = generate_ai_response(
+            prompt,
+            user_id=user_id,
+            chat_id=chat_id,
+            on_token=lambda text: broadcaster.publish(chat_id, {"type": "token", "text": text}),
+        )
+        timings["generation_ms"] = _elapsed_ms(stage_start)
+        broadcaster.flush()
+
+        job.status = "saving"
+        job.timings = dict(timings)
+        db.commit()
+
+        stage_start = time.monotonic()
+        ai_message = _add_ai_reply(db, user_id, chat_id, reply_text)
+        job.result_message_id = ai_message.id
+        job.status = "succeeded"
+        timings["persist_ms"] = _elapsed_ms(stage_start)
+        timings["total_ms"] = _elapsed_ms(enqueued_at)
+        job.timings = timings
+        job.finished_at = datetime.utcnow()
+        db.commit()
+    except Exception as e:
+        logger.exception("AI job %s failed", job_id)
+        db.close()
+        timings["total_ms"] = _elapsed_ms(enqueued_at)
+        error = e.detail if isinstance(e, HTTPException) else "Unexpected error while generating the AI response."
+        _fail_ai_job(job_id, error, timings)
+    finally:
+        db.close()
+
+
+def _fail_ai_job(job_id: UUID, error: str, timings: dict):
+    # Fresh session: the job's own may be the thing that broke
+    db = SessionLocal()
+    try:
+        db.query(AIJob).filter(AIJob.id == job_id).update(
+            {"status": "failed", "error": error, "timings": timings, "finished_at": datetime.utcnow()},
+            synchronize_session=False,
+        )
+        db.commit()
+    except Exception:
+        logger.exception("Could not mark AI job %s as failed", job_id)
+    finally:
+        db.close()
+
+
+@router.get("/jobs/{job_id}", response_model=AIJobResponse)
+def get_ai_job(job_id: UUID, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+    job = db.query(AIJob).filter(AIJob.id == job_id, AIJob.user_id == user.id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    response = AIJobResponse.model_validate(job)
+    if job.result_message_id:
+        result_message = db.query(Message).filter(Message.id == job.result_message_id).first()
+        if result_message:
+            response.result_message = MessageResponse.model_validate(result_message)
+    return response
+
+
+# -------------------------------
+# Live Chat Channel (WebSocket)
+# -------------------------------
+# Connect to /api/chats/ws/{chat_id}?token=<access token>. The server pushes
+# {"type": "message", "message": {...}} for every new message in the chat and
+# {"type": "token", "text": "..."} while the AI reply is being generated.
+# Send {"message_text": "..."} to post a message.
+@router.websocket("/ws/{chat_id}")
+async def chat_socket(websocket: WebSocket, chat_id: UUID, token: str = Query(...)):
+    try:
+        user_id = await run_in_threadpool(_authorize_chat_socket, token, chat_id)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    client_host = websocket.client.host if websocket.client else None
+    queue = broadcaster.subscribe(str(chat_id))
+    pump = asyncio.create_task(_pump_chat_events(websocket, queue))
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                data = json.loads(raw)
+            except ValueError:
+                data = None
+            message_text = data.get("message_text") if isinstance(data, dict) else None
+            if not message_text:
+                await websocket.send_json({"type": "error", "status": 422, "detail": "message_text is required"})
+                continue
+            try:
+                await run_in_threadpool(_send_over_socket, user_id, chat_id, message_text, client_host)
+            except HTTPException as e:
+                await websocket.send_json({
+                    "type": "error",
+                    "status": e.status_code,
+                    "detail": e.detail,
+                    "retry_after": (e.headers or {}).get("Retry-After"),
+                })
+    except WebSocketDisconnect:
+        pass
+    finally:
+        pump.cancel()
+        broadcaster.unsubscribe(str(chat_id), queue)
+
+
+def _authorize_chat_socket(token: str, chat_id: UUID) -> UUID:
+    db = SessionLocal()
+    try:
+        user = get_user_from_token(token, db)
+        user_chat = (
+            db.query(UserChat)
+            .filter(UserChat.chat_id == chat_id, UserChat.user_id == user.id)
+            .first()
+        )
+        if not user_chat:
+            raise HTTPException(status_code=404, detail="Chat not found or access denied")
+        return user.id
+    finally:
+        db.close()
+
+
+def _send_over_socket(user_id: UUID, chat_id: UUID, message_text: str, client_host):
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.id == user_id).first()
+        check_chat_rate_limit(db, user, client_host)
+        with ai_slot():
+            _exchange_messages(
+                db, user.id, chat_id, message_text,
+                on_token=lambda text: broadcaster.publish(chat_id, {"type": "token", "text": text}),
+            )
+    finally:
+        db.close()
+
+
+async def _pump_chat_events(websocket: WebSocket, queue: asyncio.Queue):
+    while True:
+        event = await queue.get()
+        if event.get("type") == "message_ref":
+            message = await run_in_threadpool(_load_message, event["message_id"])
+            if message is None:
+                continue
+            event = {"type": "message", "chat_id": event["chat_id"], "message": message}
+        await websocket.send_json(event)
+
+
+def _load_message(message_id: str):
+    db = SessionLocal()
+    try:
+        message = db.query(Message).filter(Message.id == message_id).first()
+        return MessageResponse.model_validate(message).model_dump(mode="json") if message else None
+    finally:
+        db.close()
@@ -1,16 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from uuid import UUID
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 from app.database import get_db
-from app.models import Class, Plan, User
-from app.schemas import ClassCreate, ClassResponse, ClassUpdate
+from app.models import Class, ClassOccurrence, Plan, User
+from app.schemas import ClassCreate, ClassOccurrenceResponse, ClassResponse, ClassUpdate
 from app.routers.dependencies import get_current_user
+from app.recurrence import replace_occurrences
+from app.responses import as_text, json_response, schema_columns
 
 router = APIRouter()
 
+_CLASS_COLUMNS = schema_columns(Class.__table__, ClassResponse)
+_OCCURRENCE_COLUMNS = [as_text(ClassOccurrence.class_id), Class.title, ClassOccurrence.starts_at, ClassOccurrence.ends_at]
+
+MAX_OCCURRENCE_WINDOW_DAYS = 366
+
 # Create Class
 @router.post("/", response_model=ClassResponse, status_code=status.HTTP_201_CREATED)
 def create_class(class_in: ClassCreate, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
@@ -20,9 +28,13 @@ def create_class(class_in: ClassCreate, db: Session = Depends(get_db), user: Use
         title=class_in.title,
         description=class_in.description,
         schedule_info=class_in.schedule_info,
+        recurrence=class_in.recurrence.model_dump(mode="json") if class_in.recurrence else None,
         plan_ids=plan_ids
     )
     db.add(new_class)
+    db.flush()
+    if new_class.recurrence:
+        replace_occurrences(db.connection(), new_class.id, user.id, new_class.recurrence)
     db.commit()
     db.refresh(new_class)
     return new_class
@@ -30,8 +42,42 @@ def create_class(class_in: ClassCreate, db: Session = Depends(get_db), user: Use
 # List all classes for user
 @router.get("/", response_model=List[ClassResponse])
 def get_classes(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    classes = db.query(Class).filter(Class.user_id == user.id).all()
-    return classes
+    classes = db.execute(select(*_CLASS_COLUMNS).where(Class.user_id == user.id)).mappings().all()
+    return json_response(List[ClassResponse], classes)
+
+# Occurrences of recurring classes starting in [from, to), in time order.
+# Served from class_occurrences (one range scan on user_id, starts_at);
+# occurrences are materialized CLASS_OCCURRENCE_HORIZON_DAYS ahead.
+@router.get("/occurrences", response_model=List[ClassOccurrenceResponse])
+def get_class_occurrences(
+    start: datetime = Query(..., alias="from"),
+    end: datetime = Query(..., alias="to"),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    start, end = _naive_utc(start), _naive_utc(end)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="'to' must be after 'from'")
+    if end - start > timedelta(days=MAX_OCCURRENCE_WINDOW_DAYS):
+        raise HTTPException(status_code=400, detail=f"Window is limited to {MAX_OCCURRENCE_WINDOW_DAYS} days")
+
+    occurrences = db.execute(
+        select(*_OCCURRENCE_COLUMNS)
+        .join(Class, Class.id == ClassOccurrence.class_id)
+        .where(
+            ClassOccurrence.user_id == user.id,
+            ClassOccurrence.starts_at >= start,
+            ClassOccurrence.starts_at < end,
+        )
+        .order_by(ClassOccurrence.starts_at, ClassOccurrence.class_id)
+    ).mappings().all()
+    return json_response(List[ClassOccurrenceResponse], occurrences)
+
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
 
 # Get class details
 @router.get("/{class_id}", response_model=ClassResponse)
@@ -44,15 +90,22 @@ def get_class(class_id: UUID, db: Session = Depends(get_db), user: User = Depend
 # Update Class (including updating plan_ids)
 @router.put("/{class_id}", response_model=ClassResponse)
 def update_class(class_id: UUID, class_in: ClassUpdate, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    klass = db.query(Class).filter(Class.id == class_id, Class.user_id == user.id).first()
+    # Row lock first: the occurrence refresh task locks the same row, so it
+    # can't add occurrences of the old schedule while this one is replaced
+    klass = db.query(Class).filter(Class.id == class_id, Class.user_id == user.id).with_for_update().first()
     if not klass:
         raise HTTPException(status_code=404, detail="Class not found")
 
     # Update simple fields
     for var, value in vars(class_in).items():
-        if var != "plan_ids" and value is not None:
+        if var not in ("plan_ids", "recurrence") and value is not None:
             setattr(klass, var, value)
 
+    # A new (or removed) schedule replaces the class's future occurrences
+    if "recurrence" in class_in.model_fields_set:
+        klass.recurrence = class_in.recurrence.model_dump(mode="json") if class_in.recurrence else None
+        replace_occurrences(db.connection(), klass.id, user.id, klass.recurrence)
+
     # If plan_ids present in update schema, replace or extend it (optional)
     if hasattr(class_in, "plan_ids") and class_in.plan_ids is not None:
         klass.plan_ids = class_in.plan_ids
@@ -65,7 +118,7 @@ def update_class(class_id: UUID, class_in: ClassUpdate, db: Session = Depends(ge
 # Delete Class
 @router.delete("/{class_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_class(class_id: UUID, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    klass = db.query(Class).filter(Class.id == class_id, Class.user_id == user.id).first()
+    klass = db.query(Class).filter(Class.id == class_id, Class.user_id == user.id).with_for_update().first()
     if not klass:
         raise HTTPException(status_code=404, detail="Class not found")
     db.delete(klass)
@@ -4,20 +4,17 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from jose import JWTError, jwt
-from app.database import SessionLocal
+from app.database import get_db
 from app.models import User
 from app.auth import SECRET_KEY, ALGORITHM  # Import from auth.py
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")  # Adjust if needed
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+    return get_user_from_token(token, db)
+
+# Shared by HTTP routes and the chat WebSocket (which passes the JWT as a query param)
+def get_user_from_token(token: str, db: Session) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials or token expired",
@@ -0,0 +1,208 @@
+import base64
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from typing import Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select, tuple_
+
+from app.archive import rehydrate_chats
+from app.database import SessionLocal
+from app.models import Class, Message, Plan, User, UserChat
+from app.routers.dependencies import get_current_user
+
+router = APIRouter()
+
+# Rows fetched per round trip from the server-side cursor
+YIELD_PER = 1000
+# Uncompressed bytes buffered before handing a chunk to the response
+CHUNK_SIZE = 64 * 1024
+
+EPOCH = datetime(1970, 1, 1)
+
+# kind -> (model, sort timestamp column, exported columns)
+EXPORTS = {
+    "messages": (
+        Message,
+        Message.timestamp,
+        ["id", "chat_id", "sender_id", "receiver_id", "message_text", "timestamp"],
+    ),
+    "plans": (
+        Plan,
+        Plan.created_at,
+        ["id", "title", "description", "start_date", "end_date", "conversation", "is_save",
+         "pined_date", "pinned_at", "created_at", "updated_at"],
+    ),
+    "classes": (
+        Class,
+        Class.created_at,
+        ["id", "title", "description", "schedule_info", "recurrence", "plan_ids", "created_at", "updated_at"],
+    ),
+}
+KIND_ORDER = ["messages", "plans", "classes"]
+RECORD_TYPES = {"messages": "message", "plans": "plan", "classes": "class"}
+
+
+# -------------------------------
+# Resume cursors
+# -------------------------------
+# A cursor names the last exported row: kind + its (sort timestamp, id).
+# Rows are exported kind by kind in (timestamp, id) order, so resuming
+# continues strictly after that row.
+def _encode_cursor(kind: str, ts: datetime, row_id) -> str:
+    raw = f"{kind}|{ts.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        kind, ts, row_id = raw.split("|")
+        if kind not in EXPORTS:
+            raise ValueError(kind)
+        return kind, datetime.fromisoformat(ts), UUID(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid export cursor")
+
+
+def _export_query(kind: str, user_id, after=None):
+    model, ts_column, columns = EXPORTS[kind]
+    # messages.timestamp is NOT NULL; plans and classes sort on the same
+    # coalesce as their ix_*_user_export indexes
+    sort_ts = ts_column if kind == "messages" else func.coalesce(ts_column, EPOCH)
+    stmt = select(sort_ts.label("_sort_ts"), *[getattr(model, c) for c in columns])
+    if kind == "messages":
+        stmt = stmt.where(Message.chat_id.in_(select(UserChat.chat_id).where(UserChat.user_id == user_id)))
+    else:
+        stmt = stmt.where(model.user_id == user_id)
+    if after is not None:
+        # The plain bound lets Postgres skip whole message partitions on resume
+        stmt = stmt.where(sort_ts >= after[0], tuple_(sort_ts, model.id) > tuple_(after[0], after[1]))
+    return stmt.order_by(sort_ts, model.id).execution_options(stream_results=True, yield_per=YIELD_PER)
+
+
+def _plan_kinds(kinds, cursor):
+    """Kinds still to export and the keyset position to start the first one from."""
+    if cursor is None:
+        return [(kind, None) for kind in kinds]
+    cursor_kind, ts, row_id = cursor
+    if cursor_kind not in kinds:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor does not match the export type")
+    remaining = kinds[kinds.index(cursor_kind):]
+    return [(remaining[0], (ts, row_id))] + [(kind, None) for kind in remaining[1:]]
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+
+# -------------------------------
+# Row serializers
+# -------------------------------
+def _iter_rows(user_id, plan):
+    """Yield (kind, columns, values, cursor) using one server-side cursor per kind."""
+    db = SessionLocal()
+    try:
+        for kind, after in plan:
+            if kind == "messages":
+                # A full export includes months that were moved to cold storage
+                rehydrate_chats(db, select(UserChat.chat_id).where(UserChat.user_id == user_id))
+            columns = EXPORTS[kind][2]
+            result = db.execute(_export_query(kind, user_id, after))
+            for row in result:
+                values = [_json_value(v) for v in row[1:]]
+                yield kind, columns, values, _encode_cursor(kind, row[0], row.id)
+            result.close()
+    finally:
+        db.close()
+
+
+def _ndjson_lines(rows):
+    for kind, columns, values, cursor in rows:
+        record = {"type": RECORD_TYPES[kind], **dict(zip(columns, values)), "cursor": cursor}
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def _csv_lines(rows, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns + ["cursor"])
+    for _, _, values, cursor in rows:
+        writer.writerow([json.dumps(v) if isinstance(v, (list, dict)) else v for v in values] + [cursor])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _chunked(lines, compress: bool):
+    # gzip (wbits=31) as we go; only CHUNK_SIZE of output is ever buffered
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    pending, size = [], 0
+    for line in lines:
+        data = line.encode("utf-8")
+        pending.append(data)
+        size += len(data)
+        if size >= CHUNK_SIZE:
+            chunk = b"".join(pending)
+            pending, size = [], 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+    chunk = b"".join(pending)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+# -------------------------------
+# Export Chats, Plans and Classes
+# -------------------------------
+# Streams every message in the user's chats plus their plans and classes.
+# Each row carries a "cursor"; pass the last one received as ?cursor= to
+# resume an interrupted download. CSV has one column set, so it exports a
+# single type at a time.
+@router.get("/")
+def export_data(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    type: str = Query("all", pattern="^(all|messages|plans|classes)$"),
+    cursor: Optional[str] = Query(None, max_length=200),
+    compress: bool = Query(True),
+    user: User = Depends(get_current_user),
+):
+    if format == "csv" and type == "all":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="CSV exports one type at a time: choose messages, plans or classes",
+        )
+
+    kinds = KIND_ORDER if type == "all" else [type]
+    plan = _plan_kinds(kinds, _decode_cursor(cursor) if cursor else None)
+    rows = _iter_rows(user.id, plan)
+
+    if format == "csv":
+        lines = _csv_lines(rows, EXPORTS[type][2])
+        media_type, extension = "text/csv", "csv"
+    else:
+        lines = _ndjson_lines(rows)
+        media_type, extension = "application/x-ndjson", "ndjson"
+
+    filename = f"gameapp-export-{type}-{datetime.utcnow():%Y%m%d}.{extension}"
+    if compress:
+        media_type, filename = "application/gzip", filename + ".gz"
+
+    return StreamingResponse(
+        _chunked(lines, compress),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -1,8 +1,12 @@
 from fastapi import APIRouter, Request, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from authlib.integrations.starlette_client import OAuth
+from authlib.integrations.starlette_client import OAuth, OAuthError
 from app.database import get_db
 from app import models, auth
+from app.metrics import track_outbound
+from app.circuit_breaker import CircuitOpen, get_breaker
+from app.http_clients import TIMEOUT, async_transport
 from app.config import (
     GOOGLE_CLIENT_ID,
     GOOGLE_CLIENT_SECRET,
@@ -10,18 +14,23 @@ from app.config import (
     FACEBOOK_CLIENT_SECRET,
     GOOGLE_REDIRECT_URI,
     FACEBOOK_REDIRECT_URI,
+    CIRCUIT_SLOW_OAUTH_SECONDS,
 )
 
 router = APIRouter()
 oauth = OAuth()
 
+# Authlib opens a client per call; the shared transport keeps the
+# connections to the providers alive between them
+HTTP_CLIENT_KWARGS = {"transport": async_transport, "timeout": TIMEOUT}
+
 # Register Google OAuth client
 oauth.register(
     name="google",
     client_id=GOOGLE_CLIENT_ID,
     client_secret=GOOGLE_CLIENT_SECRET,
     server_metadata_url="https://accounts.google.com/.well-known/openid-configuration",
-    client_kwargs={"scope": "email"},
+    client_kwargs={"scope": "email", **HTTP_CLIENT_KWARGS},
 )
 
 # Register Facebook OAuth client
@@ -31,28 +40,21 @@ oauth.register(
     client_secret=FACEBOOK_CLIENT_SECRET,
     authorize_url="https://www.facebook.com/dialog/oauth",
     access_token_url="https://graph.facebook.com/oauth/access_token",
-    client_kwargs={"scope": "email"},
+    client_kwargs={"scope": "email", **HTTP_CLIENT_KWARGS},
 )
 
-# --- Google Login ---
-@router.get("/auth/google")
-async def google_login(request: Request):
-    return await oauth.google.authorize_redirect(request, GOOGLE_REDIRECT_URI)
+# A rejected code or state (OAuthError) comes from a provider that is up
+google_breaker = get_breaker("oauth:google", CIRCUIT_SLOW_OAUTH_SECONDS, ignore=(OAuthError,))
+facebook_breaker = get_breaker("oauth:facebook", CIRCUIT_SLOW_OAUTH_SECONDS, ignore=(OAuthError,))
 
-@router.get("/auth/google/callback")
-async def google_auth_callback(request: Request, db: Session = Depends(get_db)):
-    token = await oauth.google.authorize_access_token(request)
-    resp = await oauth.google.get("https://www.googleapis.com/oauth2/v1/userinfo", token=token)
-    user_info = resp.json()
-
-    email = user_info.get("email")
-    if email is None:
-        raise HTTPException(status_code=400, detail="Failed to get user email from Google")
+def _provider_unavailable(e: CircuitOpen, provider: str) -> HTTPException:
+    return e.to_http(f"{provider} login is temporarily unavailable, please try again shortly")
 
+def _get_or_create_oauth_user(db: Session, email: str, username: str):
     user = db.query(models.User).filter(models.User.email == email).first()
     if not user:
         user = models.User(
-            username=user_info.get("name", "Google User"),
+            username=username,
             email=email,
             password_hash=auth.hash_password("oauth_dummy_password"),
             agreed_to_terms=True,
@@ -61,6 +63,36 @@ async def google_auth_callback(request: Request, db: Session = Depends(get_db)):
         db.add(user)
         db.commit()
         db.refresh(user)
+    return user
+
+
+# --- Google Login ---
+@router.get("/auth/google")
+async def google_login(request: Request):
+    try:
+        with google_breaker.guard():
+            return await oauth.google.authorize_redirect(request, GOOGLE_REDIRECT_URI)
+    except CircuitOpen as e:
+        raise _provider_unavailable(e, "Google")
+
+@router.get("/auth/google/callback")
+async def google_auth_callback(request: Request, db: Session = Depends(get_db)):
+    try:
+        with google_breaker.guard():
+            with track_outbound("google_oauth", "authorize_access_token"):
+                token = await oauth.google.authorize_access_token(request)
+            with track_outbound("google_oauth", "userinfo"):
+                resp = await oauth.google.get("https://www.googleapis.com/oauth2/v1/userinfo", token=token)
+    except CircuitOpen as e:
+        raise _provider_unavailable(e, "Google")
+    user_info = resp.json()
+
+    email = user_info.get("email")
+    if email is None:
+        raise HTTPException(status_code=400, detail="Failed to get user email from Google")
+
+    # DB access and bcrypt are blocking; keep them off the event loop
+    user = await run_in_threadpool(_get_or_create_oauth_user, db, email, user_info.get("name", "Google User"))
 
     access_token = auth.create_access_token({"user_id": str(user.id)})
     refresh_token = auth.create_refresh_token({"user_id": str(user.id)})
@@ -71,30 +103,30 @@ async def google_auth_callback(request: Request, db: Session = Depends(get_db)):
 # --- Facebook Login ---
 @router.get("/auth/facebook")
 async def facebook_login(request: Request):
-    return await oauth.facebook.authorize_redirect(request, FACEBOOK_REDIRECT_URI)
+    try:
+        with facebook_breaker.guard():
+            return await oauth.facebook.authorize_redirect(request, FACEBOOK_REDIRECT_URI)
+    except CircuitOpen as e:
+        raise _provider_unavailable(e, "Facebook")
 
 @router.get("/auth/facebook/callback")
 async def facebook_auth_callback(request: Request, db: Session = Depends(get_db)):
-    token = await oauth.facebook.authorize_access_token(request)
-    resp = await oauth.facebook.get("https://graph.facebook.com/me?fields=id,name,email", token=token)
+    try:
+        with facebook_breaker.guard():
+            with track_outbound("facebook_oauth", "authorize_access_token"):
+                token = await oauth.facebook.authorize_access_token(request)
+            with track_outbound("facebook_oauth", "userinfo"):
+                resp = await oauth.facebook.get("https://graph.facebook.com/me?fields=id,name,email", token=token)
+    except CircuitOpen as e:
+        raise _provider_unavailable(e, "Facebook")
     user_info = resp.json()
 
     email = user_info.get("email")
     if email is None:
         raise HTTPException(status_code=400, detail="Failed to get user email from Facebook")
 
-    user = db.query(models.User).filter(models.User.email == email).first()
-    if not user:
-        user = models.User(
-            username=user_info.get("name", "Facebook User"),
-            email=email,
-            password_hash=auth.hash_password("oauth_dummy_password"),
-            agreed_to_terms=True,
-            email_verified=True,
-        )
-        db.add(user)
-        db.commit()
-        db.refresh(user)
+    # DB access and bcrypt are blocking; keep them off the event loop
+    user = await run_in_threadpool(_get_or_create_oauth_user, db, email, user_info.get("name", "Facebook User"))
 
     access_token = auth.create_access_token({"user_id": str(user.id)})
     refresh_token = auth.create_refresh_token({"user_id": str(user.id)})
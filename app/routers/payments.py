@@ -1,10 +1,13 @@
 # app/routes/payments.py
 
+import anyio
 import stripe
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from typing import Optional
 from sqlalchemy.orm import Session
 from app.models import User
-from app.routers.dependencies import get_current_user, get_db
+from app.routers.dependencies import get_current_user
 from app.schemas import PlanRequest
 from app.config import (
     STRIPE_SECRET_KEY,
@@ -12,19 +15,56 @@ from app.config import (
     STRIPE_PRICE_MONTHLY,
     STRIPE_PRICE_YEARLY,
     FRONTEND_DOMAIN,
+    CIRCUIT_SLOW_STRIPE_SECONDS,
 )
-from app.database import SessionLocal
+from app.database import SessionLocal, get_db, release_connection
+from app.metrics import track_outbound
+from app.circuit_breaker import CircuitOpen, get_breaker
+from app.http_clients import TIMEOUT, async_transport, httpx, sync_transport
+from app.idempotency import request_fingerprint, run_idempotent
 
 router = APIRouter()
+
+
+class StripeHTTPClient(stripe.HTTPXClient):
+    """Stripe's httpx adapter, sending over the shared keep-alive pools.
+
+    HTTPXClient can't be handed a client or transport and builds its own in
+    __init__, so this does that setup itself with clients on the shared
+    transports instead.
+    """
+
+    def __init__(self):
+        stripe.HTTPClient.__init__(self)
+        self.httpx = httpx
+        self.anyio = anyio
+        self._timeout = TIMEOUT
+        self._client = httpx.Client(transport=sync_transport, timeout=TIMEOUT)
+        self._client_async = httpx.AsyncClient(transport=async_transport, timeout=TIMEOUT)
+
+
 stripe.api_key = STRIPE_SECRET_KEY
+stripe.default_http_client = StripeHTTPClient()
 
 MONTHLY_PRICE_ID = STRIPE_PRICE_MONTHLY
 YEARLY_PRICE_ID = STRIPE_PRICE_YEARLY
 
+# Declined cards and bad requests are answers from a healthy Stripe
+stripe_breaker = get_breaker(
+    "stripe", CIRCUIT_SLOW_STRIPE_SECONDS, ignore=(stripe.InvalidRequestError, stripe.CardError)
+)
+STRIPE_UNAVAILABLE = "Payments are temporarily unavailable, please try again shortly"
+
 
+# Sync on purpose: the Stripe client blocks, so FastAPI runs this in the threadpool.
+# A retry with the same Idempotency-Key gets the same checkout URL back; the
+# key is also passed to Stripe so a retry after a lost response can't open a
+# second session there either.
 @router.post("/create-checkout-session")
-async def create_checkout_session(
+def create_checkout_session(
     plan_request: PlanRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
     plan = plan_request.plan
@@ -36,19 +76,32 @@ async def create_checkout_session(
     else:
         raise HTTPException(status_code=400, detail="Invalid plan")
 
-    try:
-        checkout_session = stripe.checkout.Session.create(
-            success_url=f"{FRONTEND_DOMAIN}/subscription-success",
-            cancel_url=f"{FRONTEND_DOMAIN}/subscription-cancelled",
-            payment_method_types=["card"],
-            mode="subscription",
-            line_items=[{"price": price_id, "quantity": 1}],
-            customer_email=user.email,
-            metadata={"user_id": str(user.id)},
-        )
-        return {"checkout_url": checkout_session.url}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    def handler():
+        release_connection(db)
+        options = {"idempotency_key": f"checkout-{user.id}-{idempotency_key}"} if idempotency_key else {}
+        try:
+            with stripe_breaker.guard(), track_outbound("stripe", "checkout_session_create"):
+                checkout_session = stripe.checkout.Session.create(
+                    success_url=f"{FRONTEND_DOMAIN}/subscription-success",
+                    cancel_url=f"{FRONTEND_DOMAIN}/subscription-cancelled",
+                    payment_method_types=["card"],
+                    mode="subscription",
+                    line_items=[{"price": price_id, "quantity": 1}],
+                    customer_email=user.email,
+                    metadata={"user_id": str(user.id)},
+                    **options,
+                )
+            return {"checkout_url": checkout_session.url}
+        except CircuitOpen as e:
+            raise e.to_http(STRIPE_UNAVAILABLE)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return run_idempotent(
+        db, user.id, idempotency_key, "payments.create_checkout_session",
+        request_fingerprint(plan_request.model_dump()),
+        handler,
+    )
 
 
 @router.post("/portal")
@@ -57,11 +110,14 @@ def create_customer_portal(user: User = Depends(get_current_user)):
         raise HTTPException(status_code=400, detail="No active subscription found")
 
     try:
-        session = stripe.billing_portal.Session.create(
-            customer=user.stripe_customer_id or user.subscription_id,
-            return_url=f"{FRONTEND_DOMAIN}/profile",
-        )
+        with stripe_breaker.guard(), track_outbound("stripe", "billing_portal_session_create"):
+            session = stripe.billing_portal.Session.create(
+                customer=user.stripe_customer_id or user.subscription_id,
+                return_url=f"{FRONTEND_DOMAIN}/profile",
+            )
         return {"url": session.url}
+    except CircuitOpen as e:
+        raise e.to_http(STRIPE_UNAVAILABLE)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -88,15 +144,19 @@ async def stripe_webhook(request: Request):
         subscription_id = session.get("subscription")
         customer_id = session.get("customer")
 
-        db: Session = SessionLocal()
-        try:
-            user = db.query(User).filter_by(id=user_id).first()
-            if user:
-                user.is_subscribed = True
-                user.subscription_id = subscription_id
-                user.stripe_customer_id = customer_id
-                db.commit()
-        finally:
-            db.close()
+        await run_in_threadpool(_activate_subscription, user_id, subscription_id, customer_id)
 
     return {"status": "success"}
+
+
+def _activate_subscription(user_id, subscription_id, customer_id):
+    db: Session = SessionLocal()
+    try:
+        user = db.query(User).filter_by(id=user_id).first()
+        if user:
+            user.is_subscribed = True
+            user.subscription_id = subscription_id
+            user.stripe_customer_id = customer_id
+            db.commit()
+    finally:
+        db.close()
@@ -1,37 +1,207 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import base64
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from sqlalchemy import func, select, tuple_
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from uuid import UUID
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 from app.database import get_db
 from app.models import Plan
-from app.schemas import PlanCreate, PlanResponse, PlanUpdate
+from app.schemas import PlanCalendarEntry, PlanCalendarResponse, PlanCreate, PlanPage, PlanResponse, PlanUpdate
 from app.routers.dependencies import get_current_user
+from app.idempotency import request_fingerprint, run_idempotent
+from app.responses import json_response, schema_columns
 from app.models import User
 
 router = APIRouter()
 
-# Create Plan
+EPOCH = datetime(1970, 1, 1)
+
+_PLAN_COLUMNS = schema_columns(Plan.__table__, PlanResponse)
+_CALENDAR_COLUMNS = schema_columns(Plan.__table__, PlanCalendarEntry)
+
+# Create Plan (a retry with the same Idempotency-Key returns the first plan)
 @router.post("/", response_model=PlanResponse, status_code=status.HTTP_201_CREATED)
-def create_plan(plan_in: PlanCreate, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    plan = Plan(
-        user_id=user.id,
-        title=plan_in.title,
-        description=plan_in.description,
-        start_date=plan_in.start_date,
-        end_date=plan_in.end_date
+def create_plan(
+    plan_in: PlanCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    def handler():
+        plan = Plan(
+            user_id=user.id,
+            title=plan_in.title,
+            description=plan_in.description,
+            start_date=plan_in.start_date,
+            end_date=plan_in.end_date
+        )
+        db.add(plan)
+        db.commit()
+        db.refresh(plan)
+        return plan
+
+    return run_idempotent(
+        db, user.id, idempotency_key, "plans.create_plan",
+        request_fingerprint(plan_in.model_dump()),
+        handler,
+        success_status=status.HTTP_201_CREATED,
+        response_model=PlanResponse,
     )
-    db.add(plan)
-    db.commit()
-    db.refresh(plan)
-    return plan
 
 # Get all plans for user
 @router.get("/", response_model=List[PlanResponse])
 def get_plans(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    plans = db.query(Plan).filter(Plan.user_id == user.id).all()
-    return plans
+    plans = db.execute(select(*_PLAN_COLUMNS).where(Plan.user_id == user.id)).mappings().all()
+    return json_response(List[PlanResponse], plans)
+
+# Calendar: plans overlapping [from, to), grouped by UTC day. The overlap
+# test is answered by the GiST period index (see app/migrations.py), so the
+# cost follows the plans in the window, not the user's total. A plan spanning several days is listed on each.
+MAX_CALENDAR_DAYS = 366
+
+# Same expression as the index; a plan without an end date is a point in time
+PLAN_PERIOD = func.tsrange(Plan.start_date, func.greatest(Plan.start_date, Plan.end_date), "[]")
+
+
+def _calendar_days(rows, start: datetime, end: datetime):
+    days = {}
+    for row in rows:
+        first = max(row.start_date, start).date()
+        # Period end as in PLAN_PERIOD: an end before the start counts as the start
+        period_end = max(row.start_date, row.end_date or row.start_date)
+        last = min(period_end, end - timedelta(microseconds=1)).date()
+        day = first
+        while day <= last:
+            days.setdefault(day, []).append(row)
+            day += timedelta(days=1)
+    return [{"date": day, "plans": days[day]} for day in sorted(days)]
+
+
+@router.get("/calendar", response_model=PlanCalendarResponse)
+def get_plan_calendar(
+    start: datetime = Query(..., alias="from"),
+    end: datetime = Query(..., alias="to"),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    # Compare as naive UTC, like the stored timestamps
+    start, end = _naive_utc(start), _naive_utc(end)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="'to' must be after 'from'")
+    if end - start > timedelta(days=MAX_CALENDAR_DAYS):
+        raise HTTPException(status_code=400, detail=f"Calendar window is limited to {MAX_CALENDAR_DAYS} days")
+
+    rows = db.execute(
+        select(*_CALENDAR_COLUMNS)
+        .where(
+            Plan.user_id == user.id,
+            Plan.start_date.is_not(None),
+            PLAN_PERIOD.op("&&")(func.tsrange(start, end, "[)")),
+        )
+        .order_by(Plan.start_date, Plan.id)
+    ).mappings().all()
+    return json_response(PlanCalendarResponse, {"start": start, "end": end, "days": _calendar_days(rows, start, end)})
+
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+# --------------------
+# Pinned and saved plans
+# --------------------
+# Newest first, keyset-paginated: the cursor names the last plan returned by
+# its (sort timestamp, id), and the next page continues strictly after it.
+# Each list matches a partial index (ix_plans_user_pinned,
+# ix_plans_user_saved), so a page is one index range scan.
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+PINNED_SORT = Plan.pinned_at
+SAVED_SORT = func.coalesce(Plan.created_at, EPOCH)  # same expression as ix_plans_user_saved
+
+
+def _encode_page_cursor(ts: datetime, plan_id) -> str:
+    raw = f"{ts.isoformat()}|{plan_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_page_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, plan_id = raw.split("|")
+        return datetime.fromisoformat(ts), UUID(plan_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def _plan_page(db: Session, condition, sort_ts, limit: int, cursor: Optional[str]):
+    stmt = select(sort_ts.label("_sort_ts"), *_PLAN_COLUMNS).where(condition)
+    if cursor:
+        stmt = stmt.where(tuple_(sort_ts, Plan.id) < tuple_(*_decode_page_cursor(cursor)))
+    # One extra row tells us whether there is a next page
+    rows = db.execute(stmt.order_by(sort_ts.desc(), Plan.id.desc()).limit(limit + 1)).mappings().all()
+    items = rows[:limit]
+    next_cursor = _encode_page_cursor(items[-1]["_sort_ts"], items[-1]["id"]) if len(rows) > limit else None
+    return json_response(PlanPage, {"items": items, "next_cursor": next_cursor})
+
+
+@router.get("/pinned", response_model=PlanPage)
+def get_pinned_plans(
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, max_length=200),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    return _plan_page(db, (Plan.user_id == user.id) & Plan.pinned_at.is_not(None), PINNED_SORT, limit, cursor)
+
+
+@router.get("/saved", response_model=PlanPage)
+def get_saved_plans(
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, max_length=200),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    return _plan_page(db, (Plan.user_id == user.id) & Plan.is_save, SAVED_SORT, limit, cursor)
+
+
+def _set_plan_flags(db: Session, user: User, plan_id: UUID, **values):
+    plan = db.query(Plan).filter(Plan.id == plan_id, Plan.user_id == user.id).first()
+    if not plan:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    for var, value in values.items():
+        setattr(plan, var, value)
+    plan.updated_at = datetime.utcnow()
+    db.commit()
+    return plan
+
+
+# Pin / unpin (pined_date mirrors pinned_at for older clients)
+@router.put("/{plan_id}/pin", response_model=PlanResponse)
+def pin_plan(plan_id: UUID, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+    now = datetime.utcnow()
+    return _set_plan_flags(db, user, plan_id, pinned_at=now, pined_date=now.isoformat())
+
+
+@router.delete("/{plan_id}/pin", response_model=PlanResponse)
+def unpin_plan(plan_id: UUID, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+    return _set_plan_flags(db, user, plan_id, pinned_at=None, pined_date=None)
+
+
+# Save / unsave
+@router.put("/{plan_id}/save", response_model=PlanResponse)
+def save_plan(plan_id: UUID, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+    return _set_plan_flags(db, user, plan_id, is_save=True)
+
+
+@router.delete("/{plan_id}/save", response_model=PlanResponse)
+def unsave_plan(plan_id: UUID, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+    return _set_plan_flags(db, user, plan_id, is_save=False)
 
 # Get recent plans (last 5)
 @router.get("/recent", response_model=List[PlanResponse])
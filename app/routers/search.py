@@ -0,0 +1,93 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from app.archive import archived_until
+from app.database import get_db
+from app.models import User
+from app.schemas import SearchResponse, SearchResult
+from app.routers.dependencies import get_current_user
+
+router = APIRouter()
+
+# Both branches hit the GIN indexes on search_vector; ts_headline is only
+# computed for the rows on the requested page.
+_SEARCH_SQL = """
+WITH q AS (SELECT websearch_to_tsquery('english', :q) AS query),
+hits AS (
+    {branches}
+),
+page AS (
+    SELECT * FROM hits
+    ORDER BY rank DESC, ts DESC NULLS LAST, id
+    LIMIT :limit OFFSET :offset
+)
+SELECT page.kind, page.id, page.chat_id, page.title, page.rank, page.ts,
+       ts_headline('english', page.body, q.query,
+                   'StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=15, MaxFragments=2') AS snippet
+FROM page, q
+ORDER BY page.rank DESC, page.ts DESC NULLS LAST, page.id
+"""
+
+# Archived months are not in backend.messages and so not searched; the
+# response's archived_until says where that cut-off is.
+_MESSAGE_BRANCH = """
+    SELECT 'message' AS kind, m.id, m.chat_id, NULL AS title, m.message_text AS body,
+           m.timestamp AS ts, ts_rank(m.search_vector, q.query) AS rank
+    FROM backend.messages m, q
+    WHERE m.search_vector @@ q.query
+      AND m.chat_id IN (SELECT uc.chat_id FROM backend.user_chats uc WHERE uc.user_id = :user_id)
+"""
+
+_PLAN_BRANCH = """
+    SELECT 'plan' AS kind, p.id, NULL AS chat_id, p.title,
+           p.title || '. ' || coalesce(p.description, '') AS body,
+           p.updated_at AS ts, ts_rank(p.search_vector, q.query) AS rank
+    FROM backend.plans p, q
+    WHERE p.user_id = :user_id AND p.search_vector @@ q.query
+"""
+
+_QUERIES = {
+    "all": text(_SEARCH_SQL.format(branches=_MESSAGE_BRANCH + " UNION ALL " + _PLAN_BRANCH)),
+    "messages": text(_SEARCH_SQL.format(branches=_MESSAGE_BRANCH)),
+    "plans": text(_SEARCH_SQL.format(branches=_PLAN_BRANCH)),
+}
+
+
+# -------------------------------
+# Search Messages and Plans
+# -------------------------------
+@router.get("/", response_model=SearchResponse)
+def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    type: Optional[str] = Query("all", pattern="^(all|messages|plans)$"),
+    limit: int = Query(20, ge=1, le=50),
+    offset: int = Query(0, ge=0, le=1000),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    rows = db.execute(
+        _QUERIES[type],
+        {"q": q, "user_id": user.id, "limit": limit + 1, "offset": offset},
+    ).mappings().all()
+
+    results = [
+        SearchResult(
+            kind=row["kind"],
+            id=row["id"],
+            chat_id=row["chat_id"],
+            title=row["title"],
+            snippet=row["snippet"],
+            rank=row["rank"],
+            timestamp=row["ts"],
+        )
+        for row in rows[:limit]
+    ]
+    return SearchResponse(
+        results=results,
+        limit=limit,
+        offset=offset,
+        has_more=len(rows) > limit,
+        archived_until=archived_until(db, user.id) if type != "plans" else None,
+    )
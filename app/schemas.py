@@ -1,7 +1,7 @@
-from pydantic import BaseModel, EmailStr, Field, model_validator
+from pydantic import BaseModel, EmailStr, Field, field_validator, model_validator
 from uuid import UUID
-from typing import Optional, List
-from datetime import datetime
+from typing import Literal, Optional, List
+from datetime import date, datetime
 
 # --------------------
 # User Signup Schema
@@ -102,18 +102,86 @@ class PlanUpdate(BaseModel):
 class PlanResponse(PlanBase):
     id: UUID
     user_id: UUID
-    conversation: Optional[str] = None
+    conversation: Optional[List[dict]] = None
     is_save: bool = False
     pined_date: Optional[str] = None
+    pinned_at: Optional[datetime] = None
     created_at: datetime
     updated_at: datetime
 
     model_config = {
         "from_attributes": True
     }
+
+class PlanPage(BaseModel):
+    items: List[PlanResponse]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for the next page
+
+class PlanCalendarEntry(BaseModel):
+    id: UUID
+    title: str
+    start_date: datetime
+    end_date: Optional[datetime] = None
+    is_save: bool = False
+
+    model_config = {
+        "from_attributes": True
+    }
+
+class PlanCalendarDay(BaseModel):
+    date: date
+    plans: List[PlanCalendarEntry]
+
+class PlanCalendarResponse(BaseModel):
+    start: datetime
+    end: datetime
+    days: List[PlanCalendarDay]  # only days with at least one plan, in order
 # --------------------
 # Class Schemas
 # --------------------
+Weekday = Literal["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+
+class ClassRecurrence(BaseModel):
+    """RRULE subset. dtstart is wall-clock time in `timezone` (UTC when unset)."""
+    freq: Literal["DAILY", "WEEKLY", "MONTHLY"]
+    interval: int = Field(1, ge=1, le=52)
+    dtstart: datetime
+    duration_minutes: int = Field(60, ge=1, le=24 * 60)
+    by_weekday: Optional[List[Weekday]] = None
+    by_month_day: Optional[List[int]] = None
+    until: Optional[datetime] = None
+    count: Optional[int] = Field(None, ge=1, le=1000)
+    timezone: Optional[str] = None
+
+    @field_validator("dtstart", "until")
+    @classmethod
+    def naive_wall_time(cls, value):
+        return value.replace(tzinfo=None) if value is not None else value
+
+    @field_validator("by_month_day")
+    @classmethod
+    def valid_month_days(cls, value):
+        if value and any(day == 0 or not -31 <= day <= 31 for day in value):
+            raise ValueError("by_month_day values must be 1..31 or -31..-1")
+        return value
+
+    @field_validator("timezone")
+    @classmethod
+    def known_timezone(cls, value):
+        if value is not None:
+            from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+            try:
+                ZoneInfo(value)
+            except (ZoneInfoNotFoundError, ValueError):
+                raise ValueError(f"Unknown timezone: {value}")
+        return value
+
+    @model_validator(mode="after")
+    def until_or_count(self):
+        if self.until is not None and self.count is not None:
+            raise ValueError("Use either until or count, not both")
+        return self
+
 class ClassBase(BaseModel):
     title: str
     description: Optional[str] = None
@@ -123,12 +191,14 @@ class ClassCreate(BaseModel):
     title: str
     description: Optional[str] = None
     schedule_info: Optional[str] = None
+    recurrence: Optional[ClassRecurrence] = None
     plan_ids: Optional[List[str]] = None
 
 class ClassUpdate(BaseModel):
     title: Optional[str] = None
     description: Optional[str] = None
     schedule_info: Optional[str] = None
+    recurrence: Optional[ClassRecurrence] = None  # explicit null removes the schedule
     plan_ids: Optional[List[str]] = None  # ✅ Add this
 
 class ClassResponse(BaseModel):
@@ -137,10 +207,21 @@ class ClassResponse(BaseModel):
     title: str
     description: Optional[str] = None
     schedule_info: Optional[str] = None
+    recurrence: Optional[ClassRecurrence] = None
     plan_ids: List[str]
     created_at: datetime
     updated_at: datetime
 
+    model_config = {
+        "from_attributes": True
+    }
+
+class ClassOccurrenceResponse(BaseModel):
+    class_id: UUID
+    title: str
+    starts_at: datetime
+    ends_at: datetime
+
     model_config = {
         "from_attributes": True
     }
@@ -175,8 +256,45 @@ class ChatResponse(BaseModel):
         "from_attributes": True
     }
 
+class AIJobResponse(BaseModel):
+    id: UUID
+    chat_id: UUID
+    user_message_id: UUID
+    status: str
+    error: Optional[str] = None
+    timings: Optional[dict] = None
+    result_message: Optional[MessageResponse] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    model_config = {
+        "from_attributes": True
+    }
+
 # --------------------
 # PlanRequest
 # --------------------
 class PlanRequest(BaseModel):
     plan: str  # "monthly" or "yearly"
+
+# --------------------
+# Search Schemas
+# --------------------
+class SearchResult(BaseModel):
+    kind: str  # "message" or "plan"
+    id: UUID
+    chat_id: Optional[UUID] = None
+    title: Optional[str] = None
+    snippet: str
+    rank: float
+    timestamp: Optional[datetime] = None
+
+class SearchResponse(BaseModel):
+    results: List[SearchResult]
+    limit: int
+    offset: int
+    has_more: bool
+    # Set when some of the user's older messages are in cold storage: messages
+    # before this time were not searched (opening the chat restores them)
+    archived_until: Optional[datetime] = None
@@ -0,0 +1,404 @@
+# app/sports_data.py
+#
+# Local store of fixtures, results and league tables for the AI agent.
+#
+# A background task pulls structured data from a pluggable source into
+# backend.sports_fixtures / backend.sports_standings, then every worker
+# rebuilds an in-memory index from those tables. The agent's sports-data
+# tool answers from that index (dict lookups plus one precompiled regex
+# over the question), so common "when do X play" or "league table"
+# questions no longer cost a web search. Questions the store cannot answer,
+# or an index that has gone stale, return None and the caller falls back
+# to web search.
+#
+# Source payload (file or HTTP, same JSON shape):
+#   {"fixtures": [{"id", "competition", "season", "home_team", "away_team",
+#                  "kickoff" (ISO 8601), "status", "home_score", "away_score", "venue"}],
+#    "standings": [{"competition", "season", "team", "position", "played", "won",
+#                   "drawn", "lost", "goals_for", "goals_against", "points"}]}
+
+import bisect
+import json
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.background import PeriodicTask
+from app.config import SPORTS_DATA_REFRESH_SECONDS, SPORTS_DATA_SOURCE
+from app.database import SessionLocal
+from app.http_clients import http_client
+from app.metrics import SPORTS_DATA_LOADED_AT, SPORTS_DATA_LOOKUPS, SPORTS_DATA_REFRESHES, track_outbound
+from app.models import SportsFixture, SportsStanding
+
+logger = logging.getLogger(__name__)
+
+FINISHED = "finished"
+LIVE = "live"
+
+# Only one worker ingests per refresh; the others just reload the index.
+_INGEST_LOCK_SQL = text("SELECT pg_try_advisory_xact_lock(hashtext('sports_data_ingest'))")
+
+_STANDINGS_INTENT_RE = re.compile(
+    r"\b(table|standings?|position|points|rank(ed|ing)?|top of|bottom of|relegation|leading|leader[s]?)\b",
+    re.IGNORECASE,
+)
+_TEAM_SUFFIX_RE = re.compile(r"\b(fc|afc|cf|sc|ac)\b", re.IGNORECASE)
+
+
+# --------------------
+# Sources
+# --------------------
+class FileSource:
+    """Reads the payload from a local JSON file (tests, fixtures, manual imports)."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def fetch(self) -> dict:
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
+
+
+class HTTPSource:
+    """Fetches the payload from an HTTP endpoint serving the same JSON."""
+
+    def __init__(self, url: str, timeout: float = 20.0):
+        self.url = url
+        self.timeout = timeout
+
+    def fetch(self) -> dict:
+        with track_outbound("sports_data", "fetch"):
+            response = http_client.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+def source_from_url(url: str):
+    if not url:
+        return None
+    if url.startswith("file://"):
+        return FileSource(url[len("file://"):])
+    if url.startswith(("http://", "https://")):
+        return HTTPSource(url)
+    return FileSource(url)
+
+
+# --------------------
+# Ingestion
+# --------------------
+def _parse_kickoff(value: str) -> datetime:
+    kickoff = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if kickoff.tzinfo is not None:
+        kickoff = kickoff.astimezone(timezone.utc).replace(tzinfo=None)
+    return kickoff
+
+
+def _fixture_row(raw: dict, now: datetime) -> dict:
+    return {
+        "id": str(raw["id"]),
+        "competition": raw["competition"],
+        "season": raw.get("season"),
+        "home_team": raw["home_team"],
+        "away_team": raw["away_team"],
+        "kickoff": _parse_kickoff(raw["kickoff"]),
+        "status": (raw.get("status") or "scheduled").lower(),
+        "home_score": raw.get("home_score"),
+        "away_score": raw.get("away_score"),
+        "venue": raw.get("venue"),
+        "updated_at": now,
+    }
+
+
+def _standing_row(raw: dict, now: datetime) -> dict:
+    return {
+        "competition": raw["competition"],
+        "season": raw.get("season") or "",
+        "team": raw["team"],
+        "position": int(raw["position"]),
+        "played": int(raw.get("played", 0)),
+        "won": int(raw.get("won", 0)),
+        "drawn": int(raw.get("drawn", 0)),
+        "lost": int(raw.get("lost", 0)),
+        "goals_for": int(raw.get("goals_for", 0)),
+        "goals_against": int(raw.get("goals_against", 0)),
+        "points": int(raw.get("points", 0)),
+        "updated_at": now,
+    }
+
+
+def _upsert(db: Session, model, rows, key_columns):
+    if not rows:
+        return
+    stmt = insert(model.__table__).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={c: stmt.excluded[c] for c in rows[0] if c not in key_columns},
+    )
+    db.execute(stmt)
+
+
+def ingest(db: Session, payload: dict):
+    """Upsert a source payload. Returns (fixtures, standings) row counts."""
+    now = datetime.utcnow()
+    fixtures, standings = [], []
+    for raw in payload.get("fixtures", []):
+        try:
+            fixtures.append(_fixture_row(raw, now))
+        except (KeyError, TypeError, ValueError):
+            logger.warning("Skipping malformed fixture: %r", raw)
+    for raw in payload.get("standings", []):
+        try:
+            standings.append(_standing_row(raw, now))
+        except (KeyError, TypeError, ValueError):
+            logger.warning("Skipping malformed standing: %r", raw)
+
+    _upsert(db, SportsFixture, fixtures, ["id"])
+    # A table is replaced as a whole: teams that dropped out of a
+    # competition/season must not linger with an old position.
+    for competition, season in {(r["competition"], r["season"]) for r in standings}:
+        db.query(SportsStanding).filter(
+            SportsStanding.competition == competition,
+            SportsStanding.season == season,
+            SportsStanding.updated_at < now,
+        ).delete(synchronize_session=False)
+    _upsert(db, SportsStanding, standings, ["competition", "season", "team"])
+    return len(fixtures), len(standings)
+
+
+# --------------------
+# In-memory index
+# --------------------
+def _normalize(name: str) -> str:
+    return " ".join(name.lower().split())
+
+
+def _aliases(name: str):
+    normalized = _normalize(name)
+    yield normalized
+    stripped = _normalize(_TEAM_SUFFIX_RE.sub(" ", normalized))
+    if stripped and stripped != normalized:
+        yield stripped
+
+
+def _name_pattern(names):
+    if not names:
+        return None
+    # Longest first so "manchester united" wins over "manchester"
+    alternatives = sorted(names, key=len, reverse=True)
+    return re.compile(r"\b(" + "|".join(re.escape(n) for n in alternatives) + r")\b", re.IGNORECASE)
+
+
+def _format_fixture(f) -> str:
+    when = f.kickoff.strftime("%a %d %b %Y %H:%M UTC")
+    if f.status == FINISHED and f.home_score is not None:
+        line = f"{f.home_team} {f.home_score}-{f.away_score} {f.away_team} (FT, {when})"
+    elif f.status == LIVE:
+        score = f" {f.home_score}-{f.away_score} " if f.home_score is not None else " vs "
+        line = f"{f.home_team}{score}{f.away_team} (LIVE, kicked off {when})"
+    else:
+        line = f"{f.home_team} vs {f.away_team} ({f.status}, {when})"
+    venue = f" at {f.venue}" if f.venue else ""
+    return f"- {f.competition}: {line}{venue}"
+
+
+def _format_standing(s) -> str:
+    return (
+        f"{s.position}. {s.team} - P{s.played} W{s.won} D{s.drawn} L{s.lost} "
+        f"GF{s.goals_for} GA{s.goals_against} Pts {s.points}"
+    )
+
+
+class SportsIndex:
+    """Immutable snapshot of the store; a refresh swaps in a new one."""
+
+    def __init__(self, fixtures, standings, data_updated_at=None):
+        self.loaded_at = datetime.utcnow()
+        self.data_updated_at = data_updated_at
+        self.size = len(fixtures) + len(standings)
+
+        self._display = {}
+        for f in fixtures:
+            self._display.setdefault(_normalize(f.home_team), f.home_team)
+            self._display.setdefault(_normalize(f.away_team), f.away_team)
+        for s in standings:
+            self._display.setdefault(_normalize(s.team), s.team)
+
+        team_fixtures = defaultdict(list)
+        competition_fixtures = defaultdict(list)
+        for f in sorted(fixtures, key=lambda f: f.kickoff):
+            team_fixtures[_normalize(f.home_team)].append(f)
+            team_fixtures[_normalize(f.away_team)].append(f)
+            competition_fixtures[_normalize(f.competition)].append(f)
+        self._team_fixtures = dict(team_fixtures)
+        self._competition_fixtures = dict(competition_fixtures)
+        self._kickoffs = {
+            key: [f.kickoff for f in items]
+            for key, items in list(team_fixtures.items()) + list(competition_fixtures.items())
+        }
+
+        tables = defaultdict(list)
+        team_standings = defaultdict(list)
+        for s in sorted(standings, key=lambda s: s.position):
+            tables[_normalize(s.competition)].append(s)
+            team_standings[_normalize(s.team)].append(s)
+        self._tables = dict(tables)
+        self._team_standings = dict(team_standings)
+
+        self._team_names = {}
+        for name in set(self._team_fixtures) | set(self._team_standings):
+            for alias in _aliases(name):
+                self._team_names.setdefault(alias, name)
+        self._competition_names = {}
+        for name in set(self._competition_fixtures) | set(self._tables):
+            self._competition_names[name] = name
+        self._team_re = _name_pattern(self._team_names)
+        self._competition_re = _name_pattern(self._competition_names)
+
+    def _match(self, pattern, names, query):
+        if pattern is None:
+            return []
+        found = []
+        for match in pattern.finditer(query):
+            name = names[_normalize(match.group(1))]
+            if name not in found:
+                found.append(name)
+        return found
+
+    def _around(self, key, items, now, past: int, upcoming: int):
+        split = bisect.bisect_left(self._kickoffs[key], now - timedelta(hours=3))
+        recent = [f for f in items[:split] if f.status == FINISHED][-past:] if past else []
+        ahead = items[split:split + upcoming]
+        return recent, ahead
+
+    def lookup(self, query: str, now=None):
+        now = now or datetime.utcnow()
+        teams = self._match(self._team_re, self._team_names, query)
+        competitions = self._match(self._competition_re, self._competition_names, query)
+        if not teams and not competitions:
+            return None
+
+        lines = []
+        if _STANDINGS_INTENT_RE.search(query):
+            for competition in competitions:
+                table = self._tables.get(competition, [])
+                if teams:
+                    table = [s for s in table if _normalize(s.team) in teams]
+                if table:
+                    lines.append(f"{table[0].competition} table ({table[0].season}):")
+                    lines.extend(_format_standing(s) for s in table)
+            if not competitions:
+                for team in teams:
+                    for s in self._team_standings.get(team, []):
+                        lines.append(f"{s.competition} ({s.season}): {_format_standing(s)}")
+
+        for team in teams:
+            items = self._team_fixtures.get(team, [])
+            recent, ahead = self._around(team, items, now, past=3, upcoming=3)
+            if competitions:
+                recent = [f for f in recent if _normalize(f.competition) in competitions]
+                ahead = [f for f in ahead if _normalize(f.competition) in competitions]
+            if recent:
+                lines.append(f"Recent results for {self._display[team]}:")
+                lines.extend(_format_fixture(f) for f in recent)
+            if ahead:
+                lines.append(f"Upcoming for {self._display[team]}:")
+                lines.extend(_format_fixture(f) for f in ahead)
+
+        if not teams:
+            for competition in competitions:
+                items = self._competition_fixtures.get(competition, [])
+                recent, ahead = self._around(competition, items, now, past=10, upcoming=10)
+                recent = [f for f in recent if f.kickoff >= now - timedelta(days=7)]
+                ahead = [f for f in ahead if f.kickoff <= now + timedelta(days=7)]
+                if recent:
+                    lines.append("Results in the last 7 days:")
+                    lines.extend(_format_fixture(f) for f in recent)
+                if ahead:
+                    lines.append("Fixtures in the next 7 days:")
+                    lines.extend(_format_fixture(f) for f in ahead)
+
+        if not lines:
+            return None
+        updated = (self.data_updated_at or self.loaded_at).strftime("%Y-%m-%d %H:%M UTC")
+        return f"Local sports data (updated {updated}):\n" + "\n".join(lines)
+
+
+# --------------------
+# Store
+# --------------------
+class SportsDataStore:
+    def __init__(self, source, refresh_seconds: float):
+        self.source = source
+        self.refresh_seconds = refresh_seconds
+        self.index = SportsIndex([], [])
+        self._refresh_lock = threading.Lock()
+        self._task = PeriodicTask("sports-data", refresh_seconds, self.refresh)
+
+    def start(self):
+        self._task.start()
+
+    def stop(self):
+        self._task.stop()
+
+    def is_stale(self) -> bool:
+        updated = self.index.data_updated_at
+        if updated is None:
+            return True
+        # Three missed refreshes and we stop trusting the store
+        return datetime.utcnow() - updated > timedelta(seconds=3 * self.refresh_seconds)
+
+    def refresh(self):
+        with self._refresh_lock:
+            db = SessionLocal()
+            try:
+                if self.source is not None:
+                    self._ingest_if_due(db)
+                self.load(db)
+            finally:
+                db.close()
+
+    def _ingest_if_due(self, db: Session):
+        try:
+            if not db.execute(_INGEST_LOCK_SQL).scalar():
+                db.rollback()
+                return
+            last = db.execute(select(func.max(SportsFixture.updated_at))).scalar()
+            if last is not None and datetime.utcnow() - last < timedelta(seconds=self.refresh_seconds / 2):
+                # Another worker just ingested
+                db.rollback()
+                return
+            fixtures, standings = ingest(db, self.source.fetch())
+            db.commit()
+            SPORTS_DATA_REFRESHES.labels("ok").inc()
+            logger.info("sports_data ingested fixtures=%d standings=%d", fixtures, standings)
+        except Exception:
+            db.rollback()
+            SPORTS_DATA_REFRESHES.labels("error").inc()
+            logger.exception("Sports data ingestion failed")
+
+    def load(self, db: Session):
+        fixtures = db.execute(select(SportsFixture)).scalars().all()
+        standings = db.execute(select(SportsStanding)).scalars().all()
+        db.expunge_all()
+        timestamps = [r.updated_at for r in fixtures + standings if r.updated_at]
+        self.index = SportsIndex(fixtures, standings, max(timestamps) if timestamps else None)
+        SPORTS_DATA_LOADED_AT.set(time.time())
+
+    def lookup(self, query: str):
+        """Answer from the local store, or None when the caller should search the web."""
+        if self.is_stale():
+            SPORTS_DATA_LOOKUPS.labels("stale").inc()
+            return None
+        answer = self.index.lookup(query)
+        SPORTS_DATA_LOOKUPS.labels("hit" if answer else "miss").inc()
+        return answer
+
+
+sports_store = SportsDataStore(source_from_url(SPORTS_DATA_SOURCE), SPORTS_DATA_REFRESH_SECONDS)
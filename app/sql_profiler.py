@@ -0,0 +1,139 @@
+# app/sql_profiler.py
+#
+# Opt-in per-request SQL profiler (SQL_PROFILER_ENABLED=true). Counts the
+# statements and DB time of every request, fingerprints them so the same
+# query with different parameters collapses to one entry, and flags requests
+# that repeat a statement more than SQL_PROFILER_REPEAT_THRESHOLD times —
+# the usual N+1 signature.
+
+import hashlib
+import json
+import logging
+import re
+import time
+import weakref
+from collections import Counter
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+_current_profile: ContextVar = ContextVar("sql_profile", default=None)
+
+# Called with (method, route, profile) after each profiled request; the
+# query-budget pytest fixture hooks in here.
+profile_listeners = []
+
+_PARAM_RE = re.compile(r"%\([^)]+\)s|%s|\$\d+|:\w+|\?")
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_statement(statement: str) -> str:
+    normalized = _STRING_RE.sub("?", statement)
+    normalized = _PARAM_RE.sub("?", normalized)
+    normalized = _NUMBER_RE.sub("?", normalized)
+    normalized = _IN_LIST_RE.sub("(...)", normalized)
+    return _SPACE_RE.sub(" ", normalized).strip()
+
+
+def fingerprint(statement: str) -> str:
+    return hashlib.sha1(normalize_statement(statement).encode("utf-8")).hexdigest()[:12]
+
+
+class RequestProfile:
+    def __init__(self):
+        self.query_count = 0
+        self.db_time = 0.0
+        self.fingerprints = Counter()
+        self.samples = {}
+
+    def record(self, statement: str, duration: float):
+        fp = fingerprint(statement)
+        self.query_count += 1
+        self.db_time += duration
+        self.fingerprints[fp] += 1
+        if fp not in self.samples:
+            self.samples[fp] = normalize_statement(statement)[:300]
+
+    def repeated(self, threshold: int):
+        return {fp: count for fp, count in self.fingerprints.items() if count > threshold}
+
+    def as_dict(self, threshold: int):
+        repeated = self.repeated(threshold)
+        return {
+            "query_count": self.query_count,
+            "db_time_ms": round(self.db_time * 1000, 2),
+            "repeated_statements": [
+                {"fingerprint": fp, "count": count, "statement": self.samples[fp]}
+                for fp, count in sorted(repeated.items(), key=lambda item: -item[1])
+            ],
+        }
+
+
+_profiled_engines = weakref.WeakSet()
+
+
+def install_profiler(engine):
+    if engine in _profiled_engines:
+        return
+    _profiled_engines.add(engine)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current_profile.get() is not None:
+            conn.info.setdefault("sql_profiler_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = _current_profile.get()
+        starts = conn.info.get("sql_profiler_start")
+        if profile is not None and starts:
+            profile.record(statement, time.perf_counter() - starts.pop())
+
+
+class SQLProfilerMiddleware:
+    def __init__(self, app, route_table, repeat_threshold: int = 5):
+        self.app = app
+        self.route_table = route_table
+        self.repeat_threshold = repeat_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self.route_table.resolve(method, scope["path"])
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-query-count", str(profile.query_count).encode()))
+                headers.append((b"x-db-time-ms", f"{profile.db_time * 1000:.2f}".encode()))
+                repeated = profile.repeated(self.repeat_threshold)
+                if repeated:
+                    value = ",".join(f"{fp}:{count}" for fp, count in repeated.items())
+                    headers.append((b"x-db-repeated-statements", value.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_profile.reset(token)
+            self._report(method, route, profile)
+
+    def _report(self, method, route, profile):
+        payload = {"method": method, "route": route, **profile.as_dict(self.repeat_threshold)}
+        if payload["repeated_statements"]:
+            logger.warning("sql_profile possible N+1 %s", json.dumps(payload))
+        else:
+            logger.info("sql_profile %s", json.dumps(payload))
+        for listener in profile_listeners:
+            listener(method, route, profile)
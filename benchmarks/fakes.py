@@ -0,0 +1,143 @@
+# benchmarks/fakes.py
+#
+# Deterministic stand-ins for the external services the API talks to
+# (Gemini, Tavily, Stripe, SMTP). Every fake sleeps for a configurable
+# latency so the load numbers reflect our own code plus a realistic wait.
+
+import asyncio
+import hashlib
+import os
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+
+@dataclass
+class FakeLatencies:
+    llm_ms: float = 800.0
+    search_ms: float = 400.0
+    stripe_ms: float = 250.0
+    smtp_ms: float = 150.0
+
+
+# Prompts containing any of these words make the fake agent "call" the
+# web-search tool, which costs a search plus a second LLM round-trip.
+REALTIME_HINTS = ("today", "latest", "score", "fixture", "standings", "tonight", "news")
+
+
+def _sleep_ms(ms: float):
+    if ms > 0:
+        time.sleep(ms / 1000.0)
+
+
+class FakeSearchTool:
+    def __init__(self, latencies: FakeLatencies):
+        self.latencies = latencies
+
+    def run(self, query: str, *args, **kwargs):
+        _sleep_ms(self.latencies.search_ms)
+        return [{"url": "https://example.com/fake", "content": f"Fake search result for: {query}"}]
+
+
+class FakeAgentExecutor:
+    def __init__(self, latencies: FakeLatencies, search_tool: FakeSearchTool):
+        self.latencies = latencies
+        self.search_tool = search_tool
+
+    def _answer(self, user_input: str):
+        digest = hashlib.sha1(user_input.encode("utf-8")).hexdigest()[:12]
+        return {"output": f"Fake AI answer {digest} for: {user_input[:80]}"}
+
+    def _needs_search(self, user_input: str):
+        return any(hint in user_input.lower() for hint in REALTIME_HINTS)
+
+    def invoke(self, inputs: dict, *args, **kwargs):
+        user_input = inputs.get("input", "")
+        _sleep_ms(self.latencies.llm_ms)
+        if self._needs_search(user_input):
+            self.search_tool.run(user_input)
+            _sleep_ms(self.latencies.llm_ms)
+        return self._answer(user_input)
+
+    async def ainvoke(self, inputs: dict, *args, **kwargs):
+        user_input = inputs.get("input", "")
+        await asyncio.sleep(self.latencies.llm_ms / 1000.0)
+        if self._needs_search(user_input):
+            await asyncio.sleep(self.latencies.search_ms / 1000.0)
+            await asyncio.sleep(self.latencies.llm_ms / 1000.0)
+        return self._answer(user_input)
+
+
+class FakeLLM:
+    """Direct (no-tools) chat model used by the fast path."""
+
+    def __init__(self, latencies: FakeLatencies):
+        self.latencies = latencies
+
+    async def astream(self, messages, *args, **kwargs):
+        await asyncio.sleep(self.latencies.llm_ms / 1000.0)
+        user_input = messages[-1].content if messages else ""
+        digest = hashlib.sha1(user_input.encode("utf-8")).hexdigest()[:12]
+        for word in f"Fake direct answer {digest} for: {user_input[:80]}".split(" "):
+            yield SimpleNamespace(content=word + " ")
+
+
+class FakeSMTP:
+    latencies = FakeLatencies()
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def starttls(self):
+        pass
+
+    def login(self, *args):
+        pass
+
+    def sendmail(self, *args):
+        _sleep_ms(self.latencies.smtp_ms)
+
+
+def prepare_environment():
+    # The real clients validate their API keys on construction, so give them
+    # dummy values before app.ai.agent is imported.
+    os.environ.setdefault("GOOGLE_API_KEY", "bench-fake-google-key")
+    os.environ.setdefault("TAVILY_API_KEY", "bench-fake-tavily-key")
+    os.environ.setdefault("SECRET_KEY", "bench-secret-key")
+    # Measure capacity, not the chat rate limits
+    for tier in ("SUBSCRIBED", "TRIAL", "FREE"):
+        os.environ.setdefault(f"CHAT_RATE_LIMIT_{tier}_PER_MINUTE", "1000000")
+    os.environ.setdefault("CHAT_RATE_LIMIT_PER_IP_PER_MINUTE", "1000000")
+    # Small local sports-data set so startup ingestion runs against a file source
+    os.environ.setdefault(
+        "SPORTS_DATA_SOURCE",
+        "file://" + os.path.join(os.path.dirname(os.path.abspath(__file__)), "sports_sample.json"),
+    )
+
+
+def install_fakes(latencies: FakeLatencies):
+    import smtplib
+    import stripe
+    from app.ai import agent
+
+    search_tool = FakeSearchTool(latencies)
+    agent.search_tool_instance = search_tool
+    for endpoint in agent.model_pool.endpoints:
+        endpoint.llm = FakeLLM(latencies)
+        endpoint.executor = FakeAgentExecutor(latencies, search_tool)
+
+    FakeSMTP.latencies = latencies
+    smtplib.SMTP = FakeSMTP
+
+    def fake_checkout_create(**params):
+        _sleep_ms(latencies.stripe_ms)
+        digest = hashlib.sha1(repr(sorted(params.items())).encode("utf-8")).hexdigest()[:16]
+        return SimpleNamespace(id=f"cs_fake_{digest}", url=f"https://checkout.example.com/{digest}")
+
+    stripe.checkout.Session.create = staticmethod(fake_checkout_create)
@@ -0,0 +1,365 @@
+# benchmarks/load.py
+#
+# End-to-end load benchmark for the Gameapp API.
+#
+# Boots app.main against the Postgres in DATABASE_URL with the external
+# services replaced by the fakes in benchmarks/fakes.py, drives a weighted
+# mix of login / chat / plan / class traffic and writes per-endpoint
+# p50/p95/p99 latency and throughput as JSON.
+#
+#   DATABASE_URL=postgresql://... python -m benchmarks.load \
+#       --duration 60 --concurrency 16 --users 20 --output bench.json
+#
+# Compare two runs with `python -m benchmarks.load --compare old.json new.json`.
+
+import argparse
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from benchmarks.fakes import FakeLatencies, install_fakes, prepare_environment
+
+# (name, weight) — weights are relative, roughly what the mobile app sends.
+TRAFFIC_MIX = [
+    ("login", 5),
+    ("list_chats", 10),
+    ("send_message", 20),
+    ("get_chat_messages", 10),
+    ("create_plan", 8),
+    ("list_plans", 15),
+    ("recent_plans", 8),
+    ("create_class", 4),
+    ("list_classes", 10),
+    ("profile", 10),
+]
+
+CHAT_PROMPTS = [
+    "thanks!",
+    "What is the offside rule?",
+    "Who won the latest Arsenal match?",
+    "Give me a 4-3-3 pressing drill for U12s",
+    "What are today's Premier League fixtures?",
+    "How many substitutions are allowed in a cup final?",
+]
+
+
+# --------------------
+# Server bootstrap
+# --------------------
+def start_server(host: str, port: int, latencies: FakeLatencies):
+    prepare_environment()
+
+    import uvicorn
+    from app.main import app
+
+    install_fakes(latencies)
+
+    config = uvicorn.Config(app, host=host, port=port, log_level="warning", access_log=False)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+
+    # Tables are created in the app lifespan, so seed once the app reports ready
+    deadline = time.time() + 30
+    while not (server.started and app.state.ready):
+        if time.time() > deadline:
+            raise RuntimeError("uvicorn did not become ready within 30s")
+        time.sleep(0.05)
+    seed_ai_user()
+    return server, thread
+
+
+def seed_ai_user():
+    from app.database import SessionLocal
+    from app.models import User
+    from app.routers.chats import AI_USER_ID
+
+    db = SessionLocal()
+    try:
+        if not db.query(User).filter(User.id == AI_USER_ID).first():
+            db.add(User(
+                id=AI_USER_ID,
+                username="Gameapp AI",
+                email="ai@gameapp.invalid",
+                password_hash="!",
+                agreed_to_terms=True,
+                email_verified=True,
+            ))
+            db.commit()
+    finally:
+        db.close()
+
+
+# --------------------
+# HTTP client
+# --------------------
+class Client:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.conn = http.client.HTTPConnection(host, port, timeout=120)
+
+    def request(self, method: str, path: str, body=None, token=None):
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        payload = json.dumps(body) if body is not None else None
+        try:
+            self.conn.request(method, path, body=payload, headers=headers)
+            resp = self.conn.getresponse()
+            data = resp.read()
+        except (http.client.HTTPException, OSError):
+            # Reconnect once on a dropped keep-alive connection
+            self.conn.close()
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=120)
+            self.conn.request(method, path, body=payload, headers=headers)
+            resp = self.conn.getresponse()
+            data = resp.read()
+        parsed = json.loads(data) if data else None
+        return resp.status, parsed
+
+
+def create_users(client: Client, count: int, run_id: str):
+    users = []
+    for i in range(count):
+        email = f"bench-{run_id}-{i}@example.com"
+        password = "benchmark-password"
+        client.request("POST", "/api/auth/signup", {
+            "username": f"bench{i}",
+            "email": email,
+            "password": password,
+            "confirm_password": password,
+            "agreed_to_terms": True,
+        })
+        status, body = client.request("POST", "/api/auth/login", {"email": email, "password": password})
+        if status != 200:
+            raise RuntimeError(f"Could not log in benchmark user {email}: {status} {body}")
+        users.append({"email": email, "password": password, "token": body["access_token"], "chat_id": None})
+    return users
+
+
+# --------------------
+# Scenarios
+# --------------------
+def run_scenario(name: str, client: Client, user: dict, rng: random.Random):
+    token = user["token"]
+    if name == "login":
+        status, body = client.request("POST", "/api/auth/login", {"email": user["email"], "password": user["password"]})
+        if status == 200:
+            user["token"] = body["access_token"]
+        return "POST /api/auth/login", status
+    if name == "list_chats":
+        status, _ = client.request("GET", "/api/chats/", token=token)
+        return "GET /api/chats/", status
+    if name == "send_message":
+        status, body = client.request("POST", "/api/chats/", {"message_text": rng.choice(CHAT_PROMPTS)}, token=token)
+        if status == 201:
+            user["chat_id"] = body["chat_id"]
+        return "POST /api/chats/", status
+    if name == "get_chat_messages":
+        if not user["chat_id"]:
+            return run_scenario("send_message", client, user, rng)
+        status, _ = client.request("GET", f"/api/chats/{user['chat_id']}", token=token)
+        return "GET /api/chats/{chat_id}", status
+    if name == "create_plan":
+        start = datetime.utcnow() + timedelta(days=rng.randint(0, 60))
+        status, _ = client.request("POST", "/api/plans/", {
+            "title": f"Session {rng.randint(1, 10_000)}",
+            "description": "Benchmark plan",
+            "start_date": start.isoformat(),
+            "end_date": (start + timedelta(hours=2)).isoformat(),
+        }, token=token)
+        return "POST /api/plans/", status
+    if name == "list_plans":
+        status, _ = client.request("GET", "/api/plans/", token=token)
+        return "GET /api/plans/", status
+    if name == "recent_plans":
+        status, _ = client.request("GET", "/api/plans/recent", token=token)
+        return "GET /api/plans/recent", status
+    if name == "create_class":
+        status, _ = client.request("POST", "/api/classes/", {
+            "title": f"Class {rng.randint(1, 10_000)}",
+            "description": "Benchmark class",
+            "schedule_info": "Mondays 18:00",
+        }, token=token)
+        return "POST /api/classes/", status
+    if name == "list_classes":
+        status, _ = client.request("GET", "/api/classes/", token=token)
+        return "GET /api/classes/", status
+    if name == "profile":
+        status, _ = client.request("GET", "/api/user/profile", token=token)
+        return "GET /api/user/profile", status
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+def worker(host, port, users, stop_at, seed, results, lock):
+    rng = random.Random(seed)
+    client = Client(host, port)
+    names = [name for name, _ in TRAFFIC_MIX]
+    weights = [weight for _, weight in TRAFFIC_MIX]
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+
+    while time.time() < stop_at:
+        user = rng.choice(users)
+        name = rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            endpoint, status = run_scenario(name, client, user, rng)
+        except Exception:
+            endpoint, status = name, 0
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        samples[endpoint].append(elapsed_ms)
+        if status == 0 or status >= 400:
+            errors[endpoint] += 1
+
+    with lock:
+        for endpoint, values in samples.items():
+            results["samples"][endpoint].extend(values)
+        for endpoint, count in errors.items():
+            results["errors"][endpoint] += count
+
+
+# --------------------
+# Reporting
+# --------------------
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, errors, duration_s):
+    endpoints = {}
+    total = 0
+    for endpoint in sorted(samples):
+        values = sorted(samples[endpoint])
+        total += len(values)
+        endpoints[endpoint] = {
+            "count": len(values),
+            "errors": errors.get(endpoint, 0),
+            "throughput_rps": round(len(values) / duration_s, 3),
+            "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2),
+            "p99_ms": round(percentile(values, 99), 2),
+            "max_ms": round(values[-1], 2),
+        }
+    return {
+        "total_requests": total,
+        "total_errors": sum(errors.values()),
+        "throughput_rps": round(total / duration_s, 3),
+        "endpoints": endpoints,
+    }
+
+
+def compare(old_path: str, new_path: str, tolerance: float):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    regressions = []
+    for endpoint, new_stats in new["results"]["endpoints"].items():
+        old_stats = old["results"]["endpoints"].get(endpoint)
+        if not old_stats:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if old_stats[key] and new_stats[key] > old_stats[key] * (1 + tolerance):
+                regressions.append({"endpoint": endpoint, "metric": key, "old": old_stats[key], "new": new_stats[key]})
+        if new_stats["throughput_rps"] < old_stats["throughput_rps"] * (1 - tolerance):
+            regressions.append({
+                "endpoint": endpoint,
+                "metric": "throughput_rps",
+                "old": old_stats["throughput_rps"],
+                "new": new_stats["throughput_rps"],
+            })
+
+    print(json.dumps({"regressions": regressions}, indent=2))
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gameapp end-to-end load benchmark")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of measured load")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds of unmeasured load first")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0)
+    parser.add_argument("--search-latency-ms", type=float, default=400.0)
+    parser.add_argument("--stripe-latency-ms", type=float, default=250.0)
+    parser.add_argument("--smtp-latency-ms", type=float, default=150.0)
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="diff two result files and exit")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression for --compare")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return compare(args.compare[0], args.compare[1], args.tolerance)
+
+    latencies = FakeLatencies(
+        llm_ms=args.llm_latency_ms,
+        search_ms=args.search_latency_ms,
+        stripe_ms=args.stripe_latency_ms,
+        smtp_ms=args.smtp_latency_ms,
+    )
+    server, thread = start_server(args.host, args.port, latencies)
+
+    run_id = uuid.uuid4().hex[:8]
+    users = create_users(Client(args.host, args.port), args.users, run_id)
+
+    lock = threading.Lock()
+    for phase, duration in (("warmup", args.warmup), ("measured", args.duration)):
+        results = {"samples": defaultdict(list), "errors": defaultdict(int)}
+        stop_at = time.time() + duration
+        started = time.time()
+        threads = [
+            threading.Thread(
+                target=worker,
+                args=(args.host, args.port, users, stop_at, args.seed + i, results, lock),
+            )
+            for i in range(args.concurrency)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.time() - started
+
+    report = {
+        "run_id": run_id,
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "config": {
+            "duration_s": args.duration,
+            "concurrency": args.concurrency,
+            "users": args.users,
+            "seed": args.seed,
+            "latencies_ms": vars(latencies),
+            "traffic_mix": dict(TRAFFIC_MIX),
+        },
+        "results": summarize(results["samples"], results["errors"], elapsed),
+    }
+
+    server.should_exit = True
+    thread.join(timeout=10)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+# benchmarks/read_path.py
+#
+# Before/after benchmark for the list endpoints' read path.
+#
+# Seeds one user with --rows messages (in one chat), plans and classes plus
+# --chats chats, then requests each list endpoint --repeat times through
+# the real app and through the previous ORM implementations (mounted on a
+# side router with the same response models). Reports per-endpoint
+# latency and peak Python allocation during one request (tracemalloc)
+# as JSON.
+#
+#   DATABASE_URL=postgresql://... python -m benchmarks.read_path \
+#       --rows 10000 --chats 1000 --repeat 5 --output read_path.json
+
+import argparse
+import gc
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+from benchmarks.fakes import prepare_environment
+
+
+# --------------------
+# Previous ORM implementations
+# --------------------
+def legacy_router():
+    from fastapi import APIRouter, Depends
+    from sqlalchemy.orm import Session
+
+    from app.database import get_db
+    from app.models import Chat, Class, Message, Plan, User, UserChat
+    from app.routers.chats import _messages_since
+    from app.routers.dependencies import get_current_user
+    from app.schemas import ChatResponse, ClassResponse, MessageResponse, PlanResponse
+
+    router = APIRouter()
+
+    @router.get("/chats/", response_model=List[ChatResponse])
+    def get_chats(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+        response = []
+        chats = (
+            db.query(Chat)
+            .join(UserChat, Chat.id == UserChat.chat_id)
+            .filter(UserChat.user_id == user.id)
+            .order_by(Chat.updated_at.desc())
+            .all()
+        )
+        for chat in chats:
+            participants = db.query(UserChat.user_id).filter(UserChat.chat_id == chat.id).all()
+            last_msg = (
+                db.query(Message)
+                .filter(Message.chat_id == chat.id, Message.timestamp >= _messages_since(chat.created_at))
+                .order_by(Message.timestamp.desc())
+                .first()
+            )
+            response.append(ChatResponse(
+                id=chat.id, participants=[p[0] for p in participants], last_message=last_msg, updated_at=chat.updated_at,
+            ))
+        return response
+
+    @router.get("/chats/{chat_id}", response_model=List[MessageResponse])
+    def get_chat_messages(chat_id: uuid.UUID, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+        created_at = (
+            db.query(Chat.created_at)
+            .join(UserChat, Chat.id == UserChat.chat_id)
+            .filter(UserChat.chat_id == chat_id, UserChat.user_id == user.id)
+            .first()
+        )[0]
+        return (
+            db.query(Message)
+            .filter(Message.chat_id == chat_id, Message.timestamp >= _messages_since(created_at))
+            .order_by(Message.timestamp)
+            .all()
+        )
+
+    @router.get("/plans/", response_model=List[PlanResponse])
+    def get_plans(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+        return db.query(Plan).filter(Plan.user_id == user.id).all()
+
+    @router.get("/classes/", response_model=List[ClassResponse])
+    def get_classes(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+        return db.query(Class).filter(Class.user_id == user.id).all()
+
+    return router
+
+
+# --------------------
+# Data
+# --------------------
+def seed(rows: int, chats: int):
+    from app.database import engine
+    from app.models import Chat, Class, Message, Plan, User, UserChat
+    from app.routers.chats import AI_USER_ID
+
+    user_id = uuid.uuid4()
+    now = datetime.utcnow()
+    chat_ids = [uuid.uuid4() for _ in range(max(chats, 1))]
+    with engine.begin() as conn:
+        for uid, name in ((user_id, "readbench"), (AI_USER_ID, "Gameapp AI")):
+            exists = conn.execute(User.__table__.select().where(User.id == uid)).first()
+            if not exists:
+                conn.execute(User.__table__.insert(), {
+                    "id": uid, "username": name, "email": f"{uid}@readbench.invalid",
+                    "password_hash": "!", "agreed_to_terms": True, "email_verified": True,
+                    "is_subscribed": False, "created_at": now, "updated_at": now,
+                })
+        conn.execute(Chat.__table__.insert(), [
+            {"id": cid, "created_at": now - timedelta(minutes=5), "updated_at": now - timedelta(seconds=i)}
+            for i, cid in enumerate(chat_ids)
+        ])
+        conn.execute(UserChat.__table__.insert(), [
+            {"id": uuid.uuid4(), "chat_id": cid, "user_id": member}
+            for cid in chat_ids for member in (user_id, AI_USER_ID)
+        ])
+        # Every chat gets one message; the first chat holds the big history
+        messages = [
+            {"id": uuid.uuid4(), "chat_id": cid, "sender_id": user_id, "receiver_id": AI_USER_ID,
+             "message_text": f"opening message {i}", "timestamp": now - timedelta(minutes=4)}
+            for i, cid in enumerate(chat_ids[1:])
+        ]
+        messages += [
+            {"id": uuid.uuid4(), "chat_id": chat_ids[0],
+             "sender_id": user_id if i % 2 == 0 else AI_USER_ID,
+             "receiver_id": AI_USER_ID if i % 2 == 0 else user_id,
+             "message_text": f"message {i}: what formation should we play against a back three?",
+             "timestamp": now - timedelta(minutes=4) + timedelta(milliseconds=i)}
+            for i in range(rows)
+        ]
+        conn.execute(Message.__table__.insert(), messages)
+        conn.execute(Plan.__table__.insert(), [
+            {"id": uuid.uuid4(), "user_id": user_id, "title": f"Session {i}", "description": "Pressing and transitions",
+             "start_date": now + timedelta(days=i), "end_date": now + timedelta(days=i, hours=1),
+             "conversation": [{"role": "user", "content": "plan a session"}], "is_save": i % 3 == 0,
+             "created_at": now, "updated_at": now}
+            for i in range(rows)
+        ])
+        conn.execute(Class.__table__.insert(), [
+            {"id": uuid.uuid4(), "user_id": user_id, "title": f"U12 group {i}", "description": "Tuesday squad",
+             "schedule_info": "Tue 17:00", "plan_ids": [str(uuid.uuid4())], "created_at": now, "updated_at": now}
+            for i in range(rows)
+        ])
+    return user_id, chat_ids
+
+
+def cleanup(user_id, chat_ids):
+    from sqlalchemy import delete
+
+    from app.database import engine
+    from app.models import Chat, Class, Message, Plan, User, UserChat
+
+    with engine.begin() as conn:
+        conn.execute(delete(Message).where(Message.chat_id.in_(chat_ids)))
+        conn.execute(delete(UserChat).where(UserChat.chat_id.in_(chat_ids)))
+        conn.execute(delete(Chat).where(Chat.id.in_(chat_ids)))
+        conn.execute(delete(Plan).where(Plan.user_id == user_id))
+        conn.execute(delete(Class).where(Class.user_id == user_id))
+        conn.execute(delete(User).where(User.id == user_id))
+
+
+# --------------------
+# Measurement
+# --------------------
+def measure(client, path: str, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        response = client.get(path)
+        timings.append((time.perf_counter() - started) * 1000)
+        response.raise_for_status()
+
+    # Separate pass: tracemalloc slows everything down, so it is not timed
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    client.get(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "rows": len(response.json()),
+        "bytes": len(response.content),
+        "p50_ms": round(statistics.median(timings), 2),
+        "min_ms": round(min(timings), 2),
+        "peak_alloc_kib": round((peak - before) / 1024, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List endpoint read-path benchmark (ORM vs Core)")
+    parser.add_argument("--rows", type=int, default=10000, help="messages, plans and classes to seed")
+    parser.add_argument("--chats", type=int, default=1000, help="chats to seed (the ORM path runs 2 queries per chat)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    prepare_environment()
+    from fastapi.testclient import TestClient
+
+    from app.main import _prepare_database, app
+    from app.routers.dependencies import get_current_user
+
+    _prepare_database()
+    app.include_router(legacy_router(), prefix="/legacy")
+    user_id, chat_ids = seed(args.rows, args.chats)
+
+    from app.database import SessionLocal
+    from app.models import User
+
+    db = SessionLocal()
+    user = db.get(User, user_id)
+    db.close()
+    app.dependency_overrides[get_current_user] = lambda: user
+
+    endpoints = {
+        "list_chats": "/api/chats/",
+        "get_chat_messages": f"/api/chats/{chat_ids[0]}",
+        "list_plans": "/api/plans/",
+        "list_classes": "/api/classes/",
+    }
+    legacy = {
+        "list_chats": "/legacy/chats/",
+        "get_chat_messages": f"/legacy/chats/{chat_ids[0]}",
+        "list_plans": "/legacy/plans/",
+        "list_classes": "/legacy/classes/",
+    }
+
+    results = {}
+    try:
+        client = TestClient(app)
+        for name, path in endpoints.items():
+            client.get(path)
+            client.get(legacy[name])  # warm statement caches and adapters
+            before = measure(client, legacy[name], args.repeat)
+            after = measure(client, path, args.repeat)
+            results[name] = {
+                "orm": before,
+                "core": after,
+                "speedup": round(before["p50_ms"] / after["p50_ms"], 2) if after["p50_ms"] else None,
+                "alloc_ratio": round(after["peak_alloc_kib"] / before["peak_alloc_kib"], 2) if before["peak_alloc_kib"] else None,
+            }
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+        cleanup(user_id, chat_ids)
+
+    report = {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "config": {"rows": args.rows, "chats": args.chats, "repeat": args.repeat},
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
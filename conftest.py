@@ -0,0 +1,51 @@
+# conftest.py
+#
+# Shared pytest fixtures. Apps under test need the SQL profiler middleware
+# mounted (SQL_PROFILER_ENABLED=true, or Settings(sql_profiler_enabled=True))
+# for sql_query_budget to see their requests.
+
+import pytest
+
+from app import sql_profiler
+
+pytest_plugins = ["pytester"]
+
+
+@pytest.fixture
+def sql_query_budget():
+    """Fail the test if any endpoint runs more SQL than its budget.
+
+    Usage::
+
+        def test_list_chats(client, sql_query_budget):
+            sql_query_budget({"GET /api/chats/": 3}, max_repeats=2)
+            client.get("/api/chats/", headers=auth_headers)
+
+    Budgets are keyed by "METHOD /route/template". max_repeats caps how often
+    any single statement fingerprint may run in one request (N+1 guard).
+    """
+    budgets = {}
+    limits = {"max_repeats": None}
+    violations = []
+
+    def listener(method, route, profile):
+        key = f"{method} {route}"
+        budget = budgets.get(key)
+        if budget is not None and profile.query_count > budget:
+            violations.append(f"{key} ran {profile.query_count} queries (budget {budget})")
+        if limits["max_repeats"] is not None:
+            for fp, count in profile.repeated(limits["max_repeats"]).items():
+                violations.append(
+                    f"{key} repeated statement {count}x (max {limits['max_repeats']}): {profile.samples[fp]}"
+                )
+
+    def configure(endpoint_budgets, max_repeats=None):
+        budgets.update(endpoint_budgets)
+        limits["max_repeats"] = max_repeats
+
+    sql_profiler.profile_listeners.append(listener)
+    yield configure
+    sql_profiler.profile_listeners.remove(listener)
+
+    if violations:
+        pytest.fail("SQL query budget exceeded:\n" + "\n".join(violations))
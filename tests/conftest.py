@@ -0,0 +1,54 @@
+# tests/conftest.py
+#
+# Database fixtures. The tests run against the DATABASE_URL Postgres; each
+# test seeds its own user (benchmarks.read_path.seed) and removes it after.
+
+import pytest
+from sqlalchemy import delete, select
+
+from benchmarks.fakes import prepare_environment
+
+prepare_environment()
+
+
+@pytest.fixture(scope="session")
+def database():
+    from app.main import _prepare_database
+
+    _prepare_database()
+
+
+@pytest.fixture
+def seeded_user(database):
+    """(user_id, chat_ids) of a fresh user with one chat with the AI user."""
+    from app.database import engine
+    from app.models import AIJob, IdempotencyKey, UserChat
+    from benchmarks.read_path import cleanup, seed
+
+    user_id, chat_ids = seed(rows=2, chats=1)
+    yield user_id, chat_ids
+
+    with engine.begin() as conn:
+        conn.execute(delete(IdempotencyKey).where(IdempotencyKey.user_id == user_id))
+        conn.execute(delete(AIJob).where(AIJob.user_id == user_id))
+        chat_ids = conn.execute(select(UserChat.chat_id).where(UserChat.user_id == user_id)).scalars().all()
+    cleanup(user_id, chat_ids)
+
+
+@pytest.fixture
+def client(seeded_user):
+    """TestClient signed in as the seeded user (startup/shutdown are not run)."""
+    from fastapi.testclient import TestClient
+
+    from app.config import Settings
+    from app.database import SessionLocal
+    from app.main import create_app
+    from app.models import User
+    from app.routers.dependencies import get_current_user
+
+    db = SessionLocal()
+    user = db.get(User, seeded_user[0])
+    db.close()
+    app = create_app(Settings(sql_profiler_enabled=True))
+    app.dependency_overrides[get_current_user] = lambda: user
+    return TestClient(app)
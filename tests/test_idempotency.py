@@ -0,0 +1,52 @@
+# tests/test_idempotency.py
+
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.config import IDEMPOTENCY_WAIT_SECONDS
+from app.database import SessionLocal
+from app.idempotency import _claim, run_idempotent
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+def test_duplicate_of_in_flight_request_gets_409_quickly(db, seeded_user):
+    user_id, _ = seeded_user
+    assert _claim(db, user_id, "dup-key", "test.endpoint", "hash")
+
+    started = time.monotonic()
+    with pytest.raises(HTTPException) as raised:
+        run_idempotent(db, user_id, "dup-key", "test.endpoint", "hash", lambda: pytest.fail("handler ran twice"))
+    assert raised.value.status_code == 409
+    assert raised.value.headers["Retry-After"]
+    assert time.monotonic() - started < IDEMPOTENCY_WAIT_SECONDS + 1
+
+
+def test_retry_after_failed_send_stores_the_message_once(client, seeded_user, monkeypatch):
+    from app.models import Message
+    from app.routers import chats
+
+    def unavailable(*args, **kwargs):
+        raise HTTPException(status_code=503, detail="AI service is currently unavailable")
+
+    headers = {"Idempotency-Key": "send-retry"}
+    monkeypatch.setattr(chats, "generate_ai_response", unavailable)
+    assert client.post("/api/chats/", json={"message_text": "who won?"}, headers=headers).status_code == 503
+
+    monkeypatch.setattr(chats, "generate_ai_response", lambda *args, **kwargs: "Spain")
+    response = client.post("/api/chats/", json={"message_text": "who won?"}, headers=headers)
+    assert response.status_code == 201
+
+    db = SessionLocal()
+    try:
+        sent = db.query(Message).filter(Message.sender_id == seeded_user[0], Message.message_text == "who won?").count()
+    finally:
+        db.close()
+    assert sent == 1
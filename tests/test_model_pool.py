@@ -0,0 +1,86 @@
+# tests/test_model_pool.py
+#
+# ModelPool failover/hedging and generate_ai_response through the fake
+# Gemini endpoints from benchmarks/fakes.py.
+
+import asyncio
+import time
+
+import pytest
+
+from benchmarks.fakes import FakeLatencies, install_fakes, prepare_environment
+
+prepare_environment()
+
+from app.ai import agent  # noqa: E402
+from app.ai.model_pool import ModelEndpoint, ModelHealth, ModelPool  # noqa: E402
+from app.circuit_breaker import get_breaker  # noqa: E402
+
+
+def _endpoint(name: str) -> ModelEndpoint:
+    return ModelEndpoint(
+        name=name,
+        llm=None,
+        executor=None,
+        health=ModelHealth(name, cooldown_seconds=30),
+        breaker=get_breaker(f"test:{name}", 10),
+    )
+
+
+@pytest.fixture
+def fakes():
+    install_fakes(FakeLatencies(llm_ms=0, search_ms=0))
+
+
+def test_runs_every_request_on_one_loop():
+    pool = ModelPool([_endpoint("a")], hedge_enabled=False)
+    loops = []
+
+    async def call(endpoint, callbacks):
+        loops.append(asyncio.get_running_loop())
+        return {"output": endpoint.name}
+
+    assert pool.run(call) == {"output": "a"}
+    assert pool.run(call) == {"output": "a"}
+    assert loops[0] is loops[1]
+    assert loops[0].is_running()
+
+
+def test_hedge_winner_does_not_wait_for_blocked_loser():
+    pool = ModelPool([_endpoint("slow"), _endpoint("fast")], hedge_min_delay=0.05, hedge_default_delay=0.05)
+
+    async def call(endpoint, callbacks):
+        if endpoint.name == "slow":
+            await asyncio.to_thread(time.sleep, 1.0)  # e.g. a web search
+        return {"output": endpoint.name}
+
+    started = time.monotonic()
+    assert pool.run(call) == {"output": "fast"}
+    assert time.monotonic() - started < 0.5
+
+
+def test_streams_only_the_answer_that_is_returned():
+    pool = ModelPool([_endpoint("first"), _endpoint("hedge")], hedge_min_delay=0.05, hedge_default_delay=0.05)
+    tokens = []
+
+    async def call(endpoint, callbacks):
+        if endpoint.name == "first":
+            # Finishes first, but the hedge started streaming before it
+            await asyncio.sleep(0.15)
+            callbacks[0].on_llm_new_token("first")
+            return {"output": "first"}
+        await asyncio.sleep(0.01)
+        callbacks[0].on_llm_new_token("hedge")
+        await asyncio.sleep(0.3)
+        return {"output": "hedge"}
+
+    assert pool.run(call, on_token=tokens.append) == {"output": "hedge"}
+    assert tokens == ["hedge"]
+
+
+@pytest.mark.parametrize("prompt", ["who won the 2010 world cup", "latest premier league news"])
+def test_generate_ai_response_twice(fakes, prompt):
+    first = agent.generate_ai_response(prompt)
+    second = agent.generate_ai_response(prompt)
+    assert first == second
+    assert "Fake" in first
@@ -0,0 +1,62 @@
+# tests/test_realtime.py
+#
+# Token fan-out between two broadcasters (two workers) over Postgres NOTIFY.
+
+import asyncio
+import time
+
+import pytest
+
+from app.realtime import ChatBroadcaster
+
+
+@pytest.fixture
+def workers():
+    a, b = ChatBroadcaster(), ChatBroadcaster()
+    yield a, b
+    a.stop()
+    b.stop()
+
+
+def _publish_tokens(broadcaster, chat_id, tokens):
+    for token in tokens:
+        broadcaster.publish(chat_id, {"type": "token", "text": token})
+    broadcaster.flush()
+
+
+async def _received_text(queue, expected: str, timeout: float = 5.0) -> list:
+    events = []
+    deadline = time.monotonic() + timeout
+    while "".join(e["text"] for e in events) != expected:
+        events.append(await asyncio.wait_for(queue.get(), deadline - time.monotonic()))
+    return events
+
+
+def test_tokens_reach_local_and_remote_subscribers_batched(workers):
+    a, b = workers
+    tokens = [f"t{i} " for i in range(20)]
+
+    async def scenario():
+        local = a.subscribe("chat-1")
+        remote = b.subscribe("chat-1")
+        deadline = time.monotonic() + 5
+        while not a._remote_subscribers("chat-1"):
+            assert time.monotonic() < deadline, "interest announcement never arrived"
+            await asyncio.sleep(0.02)
+
+        await asyncio.to_thread(_publish_tokens, a, "chat-1", tokens)
+        local_events = await _received_text(local, "".join(tokens))
+        remote_events = await _received_text(remote, "".join(tokens))
+        assert len(local_events) < len(tokens)
+        assert len(remote_events) == len(local_events)
+
+    asyncio.run(scenario())
+
+
+def test_no_notify_without_remote_subscribers(workers, monkeypatch):
+    a, _ = workers
+    sent = []
+    monkeypatch.setattr(a, "_notify", sent.append)
+    a.start()
+    _publish_tokens(a, "chat-2", ["a", "b"])
+    assert not [p for p in sent if '"token"' in p]
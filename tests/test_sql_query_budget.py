@@ -0,0 +1,25 @@
+# tests/test_sql_query_budget.py
+
+from pathlib import Path
+
+ROOT_CONFTEST = Path(__file__).resolve().parent.parent / "conftest.py"
+
+
+def test_list_chats_within_budget(client, sql_query_budget):
+    sql_query_budget({"GET /api/chats/": 3}, max_repeats=1)
+    assert client.get("/api/chats/").status_code == 200
+
+
+def test_exceeded_budget_fails_the_test(pytester):
+    pytester.makeconftest(
+        ROOT_CONFTEST.read_text()
+        + "\nfrom tests.conftest import client, database, seeded_user  # noqa: E402,F401\n"
+    )
+    pytester.makepyfile(test_over_budget="""
+        def test_list_chats(client, sql_query_budget):
+            sql_query_budget({"GET /api/chats/": 0})
+            assert client.get("/api/chats/").status_code == 200
+    """)
+    result = pytester.runpytest_inprocess("-p", "no:cacheprovider")
+    result.assert_outcomes(passed=1, errors=1)
+    result.stdout.fnmatch_lines(["*GET /api/chats/ ran * queries (budget 0)*"])